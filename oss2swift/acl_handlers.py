@@ -1,10 +1,28 @@
 import sys
 
+from oss2swift.cache import Cache
+from oss2swift.cfg import CONF
 from oss2swift.etree import fromstring, XMLSyntaxError, DocumentInvalid
 from oss2swift.response import MissingSecurityHeader, \
-    MalformedACLError, UnexpectedContent
-from oss2swift.subresource import ACL, Owner, encode_acl
-from oss2swift.utils import LOGGER, MULTIUPLOAD_SUFFIX, sysmeta_header
+    MalformedACLError, UnexpectedContent, NoSuchKey, NoSuchBucket, \
+    AccessDenied
+from oss2swift.subresource import ACL, Owner, encode_acl, decode_acl
+from oss2swift.utils import LOGGER, MULTIUPLOAD_SUFFIX, \
+    MULTIUPLOAD_INDEX_SUFFIX, sysmeta_header, is_multiupload_container, \
+    multiupload_bucket, transient_sysmeta_header, metadata_post_headers
+from swift.common.utils import close_if_possible
+
+
+# ACL metadata of the buckets and objects, see BaseAclHandler._handle_acl
+ACL_CACHE = Cache('acl', 'acl_cache_ttl')
+
+
+def _acl_cache_key(req, container, obj):
+    return '/'.join([req.account, container, obj or ''])
+
+
+def invalidate_acl_cache(req, container, obj):
+    ACL_CACHE.delete(req.environ, _acl_cache_key(req, container, obj))
 
 
 def get_acl(headers, body, bucket_owner, object_owner=None):
@@ -56,6 +74,8 @@ class BaseAclHandler(object):
         self.method = req.environ['REQUEST_METHOD']
         self.user_id = self.req.user_id
         self.headers = self.req.headers if headers is None else headers
+        # permission to check on the response, see check_response
+        self.response_permission = None
 
     def handle_acl(self, app, method):
         method = method or self.method
@@ -83,6 +103,17 @@ class BaseAclHandler(object):
         if not permission:
             raise Exception('No permission to be checked exists')
 
+        if resource == 'container':
+            obj = ''
+        cache_key = _acl_cache_key(self.req, container, obj)
+        if sw_method != 'HEAD':
+            # Only the ACL is needed, not the response of the HEAD.
+            acl_headers = ACL_CACHE.get(self.req.environ, cache_key)
+            if acl_headers is not None:
+                acl = decode_acl(resource, acl_headers, self.user_id)
+                acl.check_permission(self.user_id, permission)
+                return
+
         if resource == 'object':
             resp = self.req.get_acl_response(app, 'HEAD',
                                              container, obj,
@@ -92,18 +123,39 @@ class BaseAclHandler(object):
             resp = self.req.get_acl_response(app, 'HEAD',
                                              container, '')
             acl = resp.bucket_acl
+        acl_headers = dict(
+            (key.lower(), val)
+            for key, val in resp.sysmeta_headers.iteritems()
+            if key.lower() in (sysmeta_header(resource, 'acl'),
+                               transient_sysmeta_header('acl')))
+        ACL_CACHE.set(self.req.environ, cache_key, acl_headers)
         acl.check_permission(self.user_id, permission)
 
         if sw_method == 'HEAD':
             return resp
 
+    def check_response(self, resp):
+        """
+        Checks the object ACL of the response of the request itself, when the
+        handler left the check to it.  The body is not sent yet, so it is
+        closed if the permission is denied.
+        """
+        if not self.response_permission:
+            return
+        try:
+            resp.object_acl.check_permission(self.user_id,
+                                             self.response_permission)
+        except AccessDenied:
+            close_if_possible(resp.app_iter)
+            raise
+
 
 class BucketAclHandler(BaseAclHandler):
     """
     BucketAclHandler: Handler for BucketController
     """
     def DELETE(self, app):
-        if self.container.endswith(MULTIUPLOAD_SUFFIX):
+        if is_multiupload_container(self.container):
            
             pass
         else:
@@ -117,7 +169,7 @@ class BucketAclHandler(BaseAclHandler):
 
     def GET(self, app):
         if self.method == 'DELETE' and \
-                self.container.endswith(MULTIUPLOAD_SUFFIX):
+                is_multiupload_container(self.container):
             pass
         else:
             return self._handle_acl(app, 'GET')
@@ -127,7 +179,8 @@ class BucketAclHandler(BaseAclHandler):
                                    Owner(self.user_id, self.user_id))
         if 'X-Oss-Acl' not in self.req.headers:
 	    try:
-           	 resp =self.req.get_acl_response(app, 'GET')
+                 # HEAD, a GET of the container would list it
+           	 resp =self.req.get_acl_response(app, 'HEAD')
 		 if resp.bucket_acl:
 		    req_acl=resp.bucket_acl
             except :
@@ -152,6 +205,15 @@ class ObjectAclHandler(BaseAclHandler):
         if self.method != 'DELETE':
             return self._handle_acl(app, 'HEAD')
 
+    def GET(self, app):
+        acl_check = ACL_MAP.get((self.method, 'GET', 'object'))
+        if CONF.inline_object_acl_check and acl_check:
+            # The GET returns the ACL with the object, so check it there
+            # instead of with a HEAD first.
+            self.response_permission = acl_check['Grant']
+        else:
+            return self._handle_acl(app, 'GET')
+
     def PUT(self, app):
 	OBJ_ACL='default'
         b_resp = self._handle_acl(app, 'HEAD', obj='')
@@ -162,13 +224,18 @@ class ObjectAclHandler(BaseAclHandler):
 	    if req_acl=='private':
 		req_acl=='default'
             try:
-                 resp =self.req.get_acl_response(app, 'GET')
+                 # HEAD, a GET would read the whole object
+                 resp =self.req.get_acl_response(app, 'HEAD')
                  if resp.object_acl:
                     req_acl=resp.object_acl
             except :
                  pass
         self.req.object_acl = req_acl
-        
+        # The ACL set by PUT Object acl is kept in transient sysmeta, which
+        # Swift copies along with the object, see OssAclHandler.PUT.
+        # Clear it so that only the ACL above applies to the new object.
+        self.req.headers[transient_sysmeta_header('acl')] = ''
+
 
 class OssAclHandler(BaseAclHandler):
     """
@@ -177,7 +244,11 @@ class OssAclHandler(BaseAclHandler):
     def GET(self, app):
         self._handle_acl(app, 'HEAD', permission='READ-ACL')
 
-    def PUT(self, app):
+    def PUT(self, app, transient=False):
+        """
+        :param transient: whether the object ACL is set by a POST in
+                          transient sysmeta, see OssAclController.PUT
+        """
         if self.req.is_object_request:
             b_resp = self.req.get_acl_response(app, 'HEAD', obj='')
             o_resp = self._handle_acl(app, 'HEAD', permission='WRITE-ACL')
@@ -196,17 +267,24 @@ class OssAclHandler(BaseAclHandler):
 	    if 'X-Oss-Acl' not in self.req.headers:
 		if req_acl=='private':
            		req_acl=='default'
-            	try:
-                   resp =self.req.get_acl_response(app, 'GET')
-                   if resp.object_acl:
-                   	req_acl=resp.object_acl
-            	except :
-                   pass
+                # the HEAD of the object above already has its ACL
+                if o_resp.object_acl:
+                    req_acl = o_resp.object_acl
             self.req.object_acl = req_acl
+            if transient:
+                # a Swift POST can't change the object sysmeta and replaces
+                # the rest of the metadata.
+                self.req.headers[transient_sysmeta_header('acl')] = \
+                    self.req.headers[sysmeta_header('object', 'acl')]
+                self.req.headers.update(
+                    metadata_post_headers(o_resp, self.container))
         else:
             self._handle_acl(app, self.method)
 
     def POST(self, app):
+        if self.req.is_object_request:
+            # PUT Object acl
+            return self.PUT(app, transient=True)
         if self.req.is_bucket_request:
             resp = self._handle_acl(app, 'HEAD', permission='WRITE-ACL')
 
@@ -243,7 +321,7 @@ class MultiUploadAclHandler(BaseAclHandler):
     def __init__(self, req, container, obj, headers):
         super(MultiUploadAclHandler, self).__init__(req, container, obj,
                                                     headers)
-        self.container = self.container[:-len(MULTIUPLOAD_SUFFIX)]
+        self.container = multiupload_bucket(self.container)
 
     def handle_acl(self, app, method):
         method = method or self.method
@@ -254,7 +332,7 @@ class MultiUploadAclHandler(BaseAclHandler):
             pass
 
     def HEAD(self, app):
-        # For _check_upload_info
+        # For _get_upload_info
         self._handle_acl(app, 'HEAD', self.container, '')
 
 
@@ -267,8 +345,8 @@ class PartAclHandler(MultiUploadAclHandler):
         super(MultiUploadAclHandler, self).__init__(req, container, obj,
                                                     headers)
         self.check_copy_src = False
-        if self.container.endswith(MULTIUPLOAD_SUFFIX):
-            self.container = self.container[:-len(MULTIUPLOAD_SUFFIX)]
+        if is_multiupload_container(self.container):
+            self.container = multiupload_bucket(self.container)
         else:
             self.check_copy_src = True
 
@@ -277,7 +355,7 @@ class PartAclHandler(MultiUploadAclHandler):
             # For check_copy_source
             return self._handle_acl(app, 'HEAD', self.container, self.obj)
         else:
-            # For _check_upload_info
+            # For _get_upload_info
             self._handle_acl(app, 'HEAD', self.container, '')
 
 
@@ -313,9 +391,14 @@ class UploadAclHandler(MultiUploadAclHandler):
         self._handle_acl(app, method, self.container, '')
 
     def PUT(self, app):
-        container = self.req.container_name + MULTIUPLOAD_SUFFIX
         obj = '%s/%s' % (self.obj, self.req.params['uploadId'])
-        resp = self.req._get_response(app, 'HEAD', container, obj)
+        try:
+            container = self.req.container_name + MULTIUPLOAD_INDEX_SUFFIX
+            resp = self.req._get_response(app, 'HEAD', container, obj)
+        except (NoSuchKey, NoSuchBucket):
+            # upload initiated before the upload index existed
+            container = self.req.container_name + MULTIUPLOAD_SUFFIX
+            resp = self.req._get_response(app, 'HEAD', container, obj)
         self.req.headers[sysmeta_header('object', 'acl')] = \
             resp.sysmeta_headers.get(sysmeta_header('object', 'tmpacl'))
 ACL_MAP = {
@@ -0,0 +1,159 @@
+"""
+Short lived caches of the results of Swift requests.
+
+Each Cache is stored in memcache when the cache middleware is in the proxy
+pipeline, so the proxy workers share the entries and see each other's
+invalidations.  Without memcache the entries are kept in a size bounded LRU
+local to the worker.  The time to live of a Cache is read from CONF on every
+use; 0 disables the cache.
+
+Each Cache counts its hits and misses in the worker, and reports them as the
+oss2swift.<name>_cache.hit and .miss StatsD metrics when StatsD logging is
+configured.
+
+A Cache created with shared_only is not used at all without memcache, for
+the entries which other workers must be able to invalidate.
+
+record_failure() and is_damped() keep negative cache entries, which reject a
+key for a while after it failed, for longer after each consecutive failure.
+"""
+
+from collections import OrderedDict
+from hashlib import md5
+from time import time
+
+from oss2swift.cfg import CONF
+from oss2swift.utils import LOGGER
+from swift.common.utils import cache_from_env
+
+
+class LRUCache(object):
+    """
+    A mapping of at most max_size entries which expire after their time to
+    live.  The least recently used entry is dropped first.
+
+    :param max_size: maximum number of entries
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        try:
+            expires, value = self._entries.pop(key)
+        except KeyError:
+            return None
+        if expires <= time():
+            return None
+        self._entries[key] = (expires, value)
+        return value
+
+    def set(self, key, value, ttl):
+        self._entries.pop(key, None)
+        self._entries[key] = (time() + ttl, value)
+        while len(self._entries) > max(self.max_size, 1):
+            self._entries.popitem(last=False)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def record_failure(entry, reason, damping, max_damping):
+    """
+    Returns the negative cache entry of a key after one more failure.  The
+    key is rejected for damping seconds after its first failure, twice as
+    long after each consecutive one, and at most max_damping seconds.
+
+    :param entry: the previous entry of the key, or None
+    :param reason: why the key failed, e.g. the code of the OSS error
+    """
+    failures = entry['failures'] + 1 if entry else 1
+    window = min(damping * 2 ** min(failures - 1, 32), max_damping)
+    return {'reason': reason, 'failures': failures, 'until': time() + window}
+
+
+def is_damped(entry):
+    """
+    Returns whether the key of a negative cache entry is still rejected.
+    """
+    return bool(entry) and entry['until'] > time()
+
+
+class Cache(object):
+    """
+    A named cache whose values must be serializable to JSON.
+
+    :param name: name of the cache, used in the memcache keys
+    :param ttl_option: name of the CONF option giving the time to live
+    :param size_option: name of the CONF option giving the maximum number
+                        of entries of the LRU local to the worker
+    :param shared_only: if True, the cache is disabled without memcache
+    """
+    def __init__(self, name, ttl_option, size_option='local_cache_size',
+                 shared_only=False):
+        self.name = name
+        self.ttl_option = ttl_option
+        self.size_option = size_option
+        self.shared_only = shared_only
+        self.local = LRUCache(CONF[size_option])
+        self.hits = 0
+        self.misses = 0
+
+    def _local(self):
+        # the size may be changed by the proxy configuration after this
+        # module is imported
+        self.local.max_size = CONF[self.size_option]
+        return self.local
+
+    @property
+    def ttl(self):
+        return CONF[self.ttl_option]
+
+    def _memcache_key(self, key):
+        # Keys may be long or contain spaces, which memcache does not allow.
+        return 'oss2swift/%s/%s' % (self.name, md5(key).hexdigest())
+
+    def get(self, env, key):
+        if self.ttl <= 0:
+            return None
+        memcache = cache_from_env(env, True)
+        if memcache is None:
+            if self.shared_only:
+                return None
+            value = self._local().get(key)
+        else:
+            value = memcache.get(self._memcache_key(key))
+        if value is None:
+            self.misses += 1
+            LOGGER.increment('%s_cache.miss' % self.name)
+        else:
+            self.hits += 1
+            LOGGER.increment('%s_cache.hit' % self.name)
+        return value
+
+    def set(self, env, key, value, ttl=None):
+        """
+        :param ttl: time to live of this entry, if shorter than the one of
+                    the cache
+        """
+        ttl = self.ttl if ttl is None else min(self.ttl, int(ttl))
+        if ttl <= 0:
+            return
+        memcache = cache_from_env(env, True)
+        if memcache is None:
+            if not self.shared_only:
+                self._local().set(key, value, ttl)
+            return
+        memcache.set(self._memcache_key(key), value, time=ttl)
+
+    def delete(self, env, key):
+        self.local.delete(key)
+        memcache = cache_from_env(env, True)
+        if memcache is not None:
+            memcache.delete(self._memcache_key(key))
@@ -48,8 +48,26 @@ CONF = Config({
     'oss_acl': True,
     'storage_domain': 'oss-ostorage.com',
     'auth_pipeline_check': True,
-    'max_upload_part_num': 1000,
+    'max_upload_part_num': 10000,
     'check_bucket_owner': True,
     'force_swift_request_proxy_log': True,
     'allow_multipart_uploads': True,
+    'segments_container_shards': 1,
+    'local_cache_size': 10000,
+    'upload_cache_ttl': 30,
+    'container_cache_ttl': 600,
+    'complete_cache_ttl': 600,
+    'acl_cache_ttl': 10,
+    'identity_cache_ttl': 60,
+    'presigned_url_cache_ttl': 3600,
+    'coalesce_max_wait': 5,
+    'not_found_cache_ttl': 2,
+    'not_found_cache_size': 10000,
+    'auth_failure_cache_ttl': 60,
+    'auth_failure_damping': 1,
+    'auth_failure_trusted_proxies': '',
+    'inline_object_acl_check': False,
+    'put_segment_threshold': 0,
+    'put_segment_size': 104857600,
+    'put_segment_concurrency': 4,
 })
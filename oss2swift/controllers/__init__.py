@@ -1,4 +1,5 @@
 from oss2swift.controllers.acl import AclController
+from oss2swift.controllers.append import AppendController
 from oss2swift.controllers.base import Controller, UnsupportedController
 from oss2swift.controllers.bucket import BucketController
 from oss2swift.controllers.location import LocationController
@@ -22,6 +23,7 @@ __all__ = [
     'ObjectController',
     'CorsController',
     'AclController',
+    'AppendController',
     'OssAclController',
     'MultiObjectDeleteController',
     'PartController',
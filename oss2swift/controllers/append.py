@@ -0,0 +1,290 @@
+"""
+Implementation of OSS Append Object.
+
+An appendable object is stored as a Swift Dynamic Large Object, so appending
+to it never rewrites the data already stored:
+
+ - [bucket]/[key]
+
+   The DLO manifest.  It is created by the first append, at position 0, and
+   its X-Object-Manifest points to a prefix of [bucket]+segments unique to
+   the object.  Its metadata holds the position of the next append and the
+   CRC64 of the whole object, which are updated with a POST after each
+   append.
+
+ - [bucket]+segments/[key]/[append_id]/00000000000000000000
+   [bucket]+segments/[key]/[append_id]/00000000000000000005
+     .
+     .
+
+   One segment per append, named after its position so that Swift lists
+   them in order.
+
+An append costs a HEAD of the manifest, the PUT of the segment and the POST
+or PUT of the manifest, whatever the size of the object.  The segment, and
+the manifest of the first append, are PUT with If-None-Match: *, so of two
+appends at the same position only one succeeds; the other fails with
+PositionNotEqualToLength.
+
+Each segment holds the CRC64 of the object up to its end.  The segment is
+deleted if the manifest cannot be updated; should that fail too, the next
+append at its position finds the segment and rolls the manifest forward
+from its length and CRC64 before failing with PositionNotEqualToLength.
+
+The first append to a bucket also sets a flag in the bucket's sysmeta.  PUT
+and DELETE Object look for the segments of the object they replace or
+delete only in flagged buckets, see appended_prefix, and delete them after
+the object.
+"""
+
+from urllib import quote
+
+from oss2swift.cfg import CONF
+from oss2swift.controllers.base import Controller, object_operation, \
+    check_container_existence
+from oss2swift.controllers.multi_upload import create_multipart_containers
+from oss2swift.response import HTTPOk, InvalidArgument, NoSuchKey, \
+    ObjectNotAppendable, PositionNotEqualToLength, PreconditionFailed
+from oss2swift.utils import unique_id, metadata_post_headers, \
+    sysmeta_header, APPEND_PREFIX_HEADER, MULTIUPLOAD_SUFFIX, LOGGER
+from swift.common.utils import config_true_value, json, public
+
+
+APPENDABLE_BUCKET_HEADER = sysmeta_header('container', 'appendable')
+
+
+def _is_appendable_bucket(info):
+    """
+    Returns whether the bucket of the container info info was flagged by an
+    append.
+    """
+    # the container info drops the x-container-sysmeta- of the keys
+    key = APPENDABLE_BUCKET_HEADER[len('x-container-sysmeta-'):]
+    return config_true_value(info.get('sysmeta', {}).get(key))
+
+
+def appended_prefix(req, app, info=None):
+    """
+    Returns the prefix of the segments of the object of req if it is an
+    appendable object, or None.  Only the buckets flagged by an append are
+    looked at.
+
+    :param info: the container info of the bucket, if already known
+    """
+    if info is None:
+        info = req.get_container_info(app)
+    if not _is_appendable_bucket(info):
+        return None
+    try:
+        # the manifest itself, without listing the segments
+        resp = req._get_response(app, 'HEAD', None, None,
+                                 query={'multipart-manifest': 'get'})
+    except NoSuchKey:
+        return None
+    return resp.sysmeta_headers.get(APPEND_PREFIX_HEADER)
+
+
+def delete_appended_segments(req, app, prefix):
+    """
+    Deletes the segments of an appendable object which was deleted or
+    replaced.  Errors are only logged: the segments are not reachable any
+    more.
+    """
+    container = req.container_name + MULTIUPLOAD_SUFFIX
+    query = {'format': 'json', 'prefix': prefix + '/'}
+    try:
+        while True:
+            resp = req._get_response(app, 'GET', container, '', query=query)
+            objects = json.loads(resp.body)
+            if not objects:
+                break
+            for o in objects:
+                req._get_response(app, 'DELETE', container, o['name'])
+            query['marker'] = objects[-1]['name']
+    except Exception as e:
+        LOGGER.debug(e)
+
+
+class AppendController(Controller):
+    """
+    Handles the following APIs:
+
+     - Append Object
+
+    Those APIs are logged as APPEND operations in the OSS server log.
+    """
+    @public
+    @object_operation
+    @check_container_existence
+    def POST(self, req):
+        """
+        Handles Append Object.
+        """
+        try:
+            position = int(req.params.get('position', ''))
+            if position < 0:
+                raise ValueError()
+        except ValueError:
+            raise InvalidArgument('Provided position not a positive integer',
+                                  argument_name='position',
+                                  argument_value=req.params.get('position'))
+
+        if CONF.oss_acl:
+            # The segments and the manifest are written without going
+            # through the ACL handler, so check that the user may write the
+            # bucket first.
+            req.get_response(self.app, 'HEAD', obj='')
+
+        container = req.container_name + MULTIUPLOAD_SUFFIX
+        try:
+            # the manifest itself, without listing the segments
+            resp = req._get_response(self.app, 'HEAD', None, None,
+                                     query={'multipart-manifest': 'get'})
+        except NoSuchKey:
+            resp = None
+
+        if resp is None:
+            length = crc = 0
+            prefix = '%s/%s' % (req.object_name, unique_id())
+            create_multipart_containers(req, self.app, [container])
+        else:
+            if resp.headers.get('x-oss-object-type') != 'Appendable':
+                raise ObjectNotAppendable()
+            length = int(resp.headers['x-oss-next-append-position'])
+            crc = int(resp.headers['x-oss-hash-crc64ecma'])
+            prefix = resp.sysmeta_headers[APPEND_PREFIX_HEADER]
+            # Like OSS, only the first append sets the metadata.
+            for key in [k for k in req.environ
+                        if k.startswith('HTTP_X_OSS_META_')]:
+                del req.environ[key]
+
+        if position != length:
+            raise PositionNotEqualToLength(
+                headers={'x-oss-next-append-position': str(length)})
+
+        # carry on from the CRC64 of the current object, which the segment
+        # keeps for _roll_forward
+        digest = req.digest_input(crc64_footer=True, crc64_start=crc)
+        if 'ETag' in req.headers:
+            # checked by the DigestInput
+            del req.headers['ETag']
+
+        if resp is None:
+            self._flag_bucket(req)
+
+        segment = '%s/%020d' % (prefix, position)
+        try:
+            # fails if an append at the same position got there first
+            req._get_response(self.app, 'PUT', container, segment,
+                              headers={'If-None-Match': '*'})
+        except PreconditionFailed:
+            next_position = None
+            if resp is not None:
+                next_position = self._roll_forward(req, resp, container,
+                                                   segment, position)
+            raise self._position_conflict(req, next_position)
+        except Exception:
+            digest.check()
+            raise
+
+        next_position = position + digest.bytes_read
+        if resp is None:
+            headers = self._manifest_headers(container, prefix, next_position,
+                                             digest.crc64)
+            headers[APPEND_PREFIX_HEADER] = prefix
+            headers['If-None-Match'] = '*'
+            try:
+                req._get_response(self.app, 'PUT', None, None, body='',
+                                  headers=headers)
+            except PreconditionFailed:
+                # another first append created the object
+                delete_appended_segments(req, self.app, prefix)
+                raise self._position_conflict(req)
+            except Exception:
+                delete_appended_segments(req, self.app, prefix)
+                raise
+        else:
+            try:
+                self._post_manifest(req, resp, container, prefix,
+                                    next_position, digest.crc64)
+            except Exception:
+                # the segment would be served without being accounted for
+                try:
+                    req._get_response(self.app, 'DELETE', container, segment)
+                except Exception as e:
+                    LOGGER.debug(e)
+                raise
+
+        resp = HTTPOk()
+        resp.headers['x-oss-next-append-position'] = str(next_position)
+        resp.headers['x-oss-hash-crc64ecma'] = str(digest.crc64)
+        return resp
+
+    def _manifest_headers(self, container, prefix, next_position, crc):
+        return {
+            'X-Object-Manifest': quote('%s/%s/' % (container, prefix)),
+            'x-object-meta-object-type': 'Appendable',
+            'x-object-meta-next-append-position': str(next_position),
+            'x-object-meta-hash-crc64ecma': str(crc),
+        }
+
+    def _post_manifest(self, req, resp, container, prefix, next_position,
+                       crc):
+        """
+        Updates the position and the CRC64 of the manifest of the HEAD
+        response resp, keeping its other metadata.
+        """
+        headers = metadata_post_headers(resp, req.container_name)
+        headers.update(self._manifest_headers(container, prefix,
+                                              next_position, crc))
+        headers['Content-Type'] = resp.headers.get('Content-Type')
+        req._get_response(self.app, 'POST', None, None, headers=headers)
+
+    def _roll_forward(self, req, resp, container, segment, position):
+        """
+        Accounts for the segment found at position in the manifest of the
+        HEAD response resp, in case the append which wrote it failed to.
+        Returns the position following the segment, or None if the manifest
+        was not updated.  Errors are only logged.
+        """
+        try:
+            seg_resp = req._get_response(self.app, 'HEAD', container, segment)
+            crc = seg_resp.headers['x-oss-hash-crc64ecma']
+            next_position = position + int(seg_resp.headers['Content-Length'])
+            prefix = resp.sysmeta_headers[APPEND_PREFIX_HEADER]
+            self._post_manifest(req, resp, container, prefix, next_position,
+                                crc)
+            return next_position
+        except (NoSuchKey, KeyError, ValueError):
+            # the append which wrote it deleted it
+            pass
+        except Exception as e:
+            LOGGER.debug(e)
+        return None
+
+    def _flag_bucket(self, req):
+        """
+        Flags the bucket as holding appendable objects, see appended_prefix.
+        """
+        if not _is_appendable_bucket(req.get_container_info(self.app)):
+            req._get_response(self.app, 'POST', req.container_name, '',
+                              headers={APPENDABLE_BUCKET_HEADER: 'true'},
+                              body='')
+
+    def _position_conflict(self, req, next_position=None):
+        """
+        Returns the error of an append which lost the race with another
+        append at the same position.
+        """
+        if next_position is not None:
+            return PositionNotEqualToLength(
+                headers={'x-oss-next-append-position': str(next_position)})
+        headers = {}
+        try:
+            resp = req._get_response(self.app, 'HEAD', None, None,
+                                     query={'multipart-manifest': 'get'})
+            headers['x-oss-next-append-position'] = \
+                resp.headers['x-oss-next-append-position']
+        except (NoSuchKey, KeyError):
+            pass
+        return PositionNotEqualToLength(headers=headers)
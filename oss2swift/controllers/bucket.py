@@ -4,12 +4,13 @@ from urllib import unquote
 from random import choice
 from oss2swift.cfg import CONF
 from oss2swift.controllers.base import Controller
+from oss2swift.controllers.multi_upload import invalidate_container_cache
 from oss2swift.etree import Element, SubElement, tostring, fromstring, \
     XMLSyntaxError, DocumentInvalid
 from oss2swift.response import HTTPOk, OssNotImplemented, InvalidArgument, \
     MalformedXML, InvalidLocationConstraint, NoSuchBucket, \
     BucketNotEmpty, InternalError, ServiceUnavailable, NoSuchKey
-from oss2swift.utils import LOGGER, MULTIUPLOAD_SUFFIX
+from oss2swift.utils import LOGGER
 from swift.common.http import HTTP_OK
 from swift.common.utils import json, public
 
@@ -25,10 +26,6 @@ class BucketController(Controller):
         """
         Before delete bucket, delete segments bucket if existing.
         """
-        container = req.container_name + MULTIUPLOAD_SUFFIX
-        marker = ''
-        seg = ''
-
         try:
             resp = req.get_response(self.app, 'HEAD')
             if int(resp.sw_headers['X-Container-Object-Count']) > 0:
@@ -41,6 +38,19 @@ class BucketController(Controller):
         except NoSuchBucket:
             pass
 
+        # The upload index and every shard of the segments containers are
+        # named [bucket]+...
+        resp = req.get_response(self.app, 'GET', '',
+                                query={'format': 'json',
+                                       'prefix': req.container_name + '+'})
+        for container in json.loads(resp.body or '[]'):
+            self._delete_multiupload_container(
+                req, container['name'].encode('utf8'))
+
+    def _delete_multiupload_container(self, req, container):
+        marker = ''
+        seg = ''
+
         try:
             while True:
                 # delete all segments
@@ -60,6 +70,7 @@ class BucketController(Controller):
                     marker = seg['name']
                 else:
                     break
+            invalidate_container_cache(req, container)
             req.get_response(self.app, 'DELETE', container)
         except NoSuchBucket:
             return
@@ -71,7 +82,7 @@ class BucketController(Controller):
         """
         Handle HEAD Bucket (Get Metadata) request
         """
-        resp = req.get_response(self.app)
+        resp = req.get_response(self.app, 'HEAD')
 
         return HTTPOk(headers=resp.headers)
 
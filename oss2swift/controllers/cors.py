@@ -50,7 +50,8 @@ class CorsController(Controller):
         max_keys = req.get_validated_param('max-keys', CONF.max_corerule_listing)
         # TODO: Separate max_corerule_listing and default_corerule_listing
         max_keys = min(max_keys, CONF.max_corerule_listing)
-        resp = req.get_response(self.app)
+        # the rules are in the container metadata, no need of a listing
+        resp = req.get_response(self.app, 'HEAD')
 	if 'x-oss-meta-access-control-allow-origin' not in resp.headers:
 	    raise NoSuchCORSConfiguration()
         allowed_origins=resp.headers['x-oss-meta-access-control-allow-origin']
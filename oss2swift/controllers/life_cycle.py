@@ -28,7 +28,8 @@ class LifecycleController(Controller):
 
     @public
     def GET(self, req):
-        resp = req.get_response(self.app)
+        # the rules are in the container metadata, no need of a listing
+        resp = req.get_response(self.app, 'HEAD')
         if 'x-oss-meta-rules' in resp.headers:
             rules_string = resp.headers['x-oss-meta-rules']
             if rules_string.startswith(','):
@@ -44,11 +45,15 @@ class LifecycleController(Controller):
             SubElement(xml_rule, 'ID').text = rule['ruleId']
             SubElement(xml_rule, 'Prefix').text = rule['rulePrefix']
             SubElement(xml_rule, 'Status').text = rule['ruleStatus']
-            expiration = SubElement(xml_rule, 'Expiration')
             if rule['expireDay'] != '':
+                expiration = SubElement(xml_rule, 'Expiration')
                 SubElement(expiration, 'Days').text = rule['expireDay']
-            else:
+            elif rule['createDate'] != '':
+                expiration = SubElement(xml_rule, 'Expiration')
                 SubElement(expiration, 'Date').text = rule['createDate']
+            if rule.get('abortDay'):
+                abort = SubElement(xml_rule, 'AbortMultipartUpload')
+                SubElement(abort, 'Days').text = rule['abortDay']
             body = tostring(elem)
             return HTTPOk(body=body, content_type='application/xml')
         else:
@@ -66,7 +71,7 @@ class LifecycleController(Controller):
         xml = req.xml(MAX_PUT_BUCKET_BODY_SIZE)
         if xml:
             # query bucket metadata
-            resp = req.get_response(self.app, method='GET')
+            resp = req.get_response(self.app, method='HEAD')
             if 'x-oss-meta-rules' in resp.headers:
                 rules_string = resp.headers['x-oss-meta-rules']
                 rules_num = len(rules_string.split(','))
@@ -86,31 +91,33 @@ class LifecycleController(Controller):
                         rule_prefix = ''
                     rule_status = r.find('Status').text
                     expiration = r.find('Expiration')
-                    if expiration.find('Days') is not None:
+                    abort_days = r.find('./AbortMultipartUpload/Days')
+                    if abort_days is not None:
+                        abort_days = abort_days.text
+                    if expiration is not None and expiration.find('Days') is not None:
                         rule = LifecycleRule(rule_id, rule_prefix, status=rule_status,
-                                             expiration=LifecycleExpiration(days=expiration.find('Days').text))
-                    elif expiration.find('Date') is not None:
+                                             expiration=LifecycleExpiration(days=expiration.find('Days').text),
+                                             abort_days=abort_days)
+                    elif expiration is not None and expiration.find('Date') is not None:
                         rule = LifecycleRule(rule_id, rule_prefix, status=rule_status,
-                                             expiration=LifecycleExpiration(date=expiration.find('Date').text))
+                                             expiration=LifecycleExpiration(date=expiration.find('Date').text),
+                                             abort_days=abort_days)
+                    elif abort_days is not None:
+                        rule = LifecycleRule(rule_id, rule_prefix, status=rule_status,
+                                             expiration=LifecycleExpiration(),
+                                             abort_days=abort_days)
                     else:
                         raise MalformedXML()
                     if rules_string == '':
                         req.headers['X-Container-Meta-Rules'] = rule_id + ':' + rule_prefix
                     else:
                         req.headers['X-Container-Meta-Rules'] = rules_string + ',' + rule_id + ':' + rule_prefix
-                    keys = ("ruleId", "rulePrefix", "ruleStatus", "expireDay", "createDate")
-                    if rule.expiration.days is not None:
-                        values = (rule.id, rule.prefix, rule.status, rule.expiration.days, '')
-                        rule_dict = dict(zip(keys, values))
-                        meta_name = 'X-Container-Meta-' + rule.id
-                        req.headers[meta_name] = str(rule_dict)
-                    elif rule.expiration.date is not None:
-                        values = (rule.id, rule.prefix, rule.status, '', rule.expiration.date)
-                        rule_dict = dict(zip(keys, values))
-                        meta_name = 'X-Container-Meta-' + rule.id
-                        req.headers[meta_name] = str(rule_dict)
-                    else:
-                        pass
+                    keys = ("ruleId", "rulePrefix", "ruleStatus", "expireDay", "createDate", "abortDay")
+                    values = (rule.id, rule.prefix, rule.status, rule.expiration.days or '',
+                              rule.expiration.date or '', rule.abort_days or '')
+                    rule_dict = dict(zip(keys, values))
+                    meta_name = 'X-Container-Meta-' + rule.id
+                    req.headers[meta_name] = str(rule_dict)
             except (XMLSyntaxError, DocumentInvalid):
                 raise MalformedXML()
             except Exception as e:
@@ -125,7 +132,7 @@ class LifecycleController(Controller):
 
     @public
     def DELETE(self, req):
-        resp = req.get_response(self.app, method='GET')
+        resp = req.get_response(self.app, method='HEAD')
         # if 'x-oss-meta-rules' is None should raise exception
         if 'x-oss-meta-rules' in resp.headers and resp.headers['x-oss-meta-rules'] != '':
             rules_string = resp.headers['x-oss-meta-rules']
@@ -150,11 +157,12 @@ class LifecycleRule(object):
     DISABLED = 'Disabled'
 
     def __init__(self, id, prefix,
-                 status=ENABLED, expiration=None):
+                 status=ENABLED, expiration=None, abort_days=None):
         self.id = id
         self.prefix = prefix
         self.status = status
         self.expiration = expiration
+        self.abort_days = abort_days
 
 
 class LifecycleExpiration(object):
@@ -1,6 +1,8 @@
 import sys
 
 from oss2swift.cfg import CONF
+from oss2swift.controllers.append import appended_prefix, \
+    delete_appended_segments
 from oss2swift.controllers.base import Controller, bucket_operation
 from oss2swift.etree import Element, SubElement, fromstring, tostring, \
     XMLSyntaxError, DocumentInvalid
@@ -88,7 +90,10 @@ class MultiObjectDeleteController(Controller):
 
             try:
                 query = req.gen_multipart_manifest_delete_query(self.app)
+                prefix = appended_prefix(req, self.app)
                 req.get_response(self.app, method='DELETE', query=query)
+                if prefix:
+                    delete_appended_segments(req, self.app, prefix)
             except NoSuchKey:
                 pass
             except ErrorResponse as e:
@@ -6,32 +6,56 @@ The following explains how oss2swift uses swift container and objects to store O
 upload information:
 
  - [bucket]+segments
+   [bucket]+1+segments
+     .
+     .
 
-   A container to store upload information.  [bucket] is the original bucket
-   where multipart upload is initiated.
+   Containers to store uploaded parts.  [bucket] is the original bucket
+   where multipart upload is initiated.  There are segments_container_shards
+   of them and the parts of an upload all go to the one chosen by hashing its
+   upload id.
 
- - [bucket]+segments/[upload_id]
+ - [bucket]+uploads/[upload_id]
 
    A object of the ongoing upload id.  The object is empty and used for
    checking the target upload status.  If the object exists, it means that the
-   upload is initiated but not either completed or aborted.
+   upload is initiated but not either completed or aborted.  The container
+   holds nothing else, so List Multipart Uploads lists it without wading
+   through the parts.  The name of the container holding the parts is kept
+   in its sysmeta.
 
+   Uploads initiated before the [bucket]+uploads container was introduced
+   kept this object in [bucket]+segments.  The first List Multipart Uploads
+   of a bucket copies those objects here and flags the container, so the
+   parts container is scanned once per bucket.
 
- - [bucket]+segments/[upload_id]/1
-   [bucket]+segments/[upload_id]/2
-   [bucket]+segments/[upload_id]/3
+
+ - [bucket]+segments/[upload_id]/00001
+   [bucket]+segments/[upload_id]/00002
+   [bucket]+segments/[upload_id]/00003
      .
      .
 
    Uploaded part objects.  Those objects are directly used as segments of Swift
-   Static Large Object.
+   Static Large Object.  Part numbers are zero padded so that Swift lists the
+   parts in numeric order.
+
+ - [bucket]+segments/[upload_id]/manifest/00001
+   [bucket]+segments/[upload_id]/manifest/00002
+     .
+     .
+
+   When an upload has more parts than a single SLO manifest may hold
+   (max_manifest_segments of the slo middleware), Complete Multipart Upload
+   stores the parts in these sub-manifests of up to that many parts each and
+   the object is a manifest of the sub-manifests.
 """
 
-import os
+from hashlib import md5
 import re
 import sys
 
-import crcmod
+from oss2swift.cache import Cache
 from oss2swift.cfg import CONF
 from oss2swift.controllers.base import Controller, bucket_operation, \
     object_operation, check_container_existence
@@ -42,8 +66,11 @@ from oss2swift.response import InvalidArgument, ErrorResponse, MalformedXML, \
     InvalidPart, BucketAlreadyExists, EntityTooSmall, InvalidPartOrder, \
     InvalidRequest, HTTPOk, HTTPNoContent, NoSuchKey, NoSuchUpload, \
     NoSuchBucket
-from oss2swift.utils import LOGGER, unique_id, MULTIUPLOAD_SUFFIX, OssTimestamp
-from six.moves.urllib.parse import urlparse  # pylint: disable=F0401
+from oss2swift.utils import LOGGER, unique_id, MULTIUPLOAD_SUFFIX, \
+    MULTIUPLOAD_INDEX_SUFFIX, OssTimestamp, sysmeta_header, \
+    max_manifest_segments
+from six.moves.urllib.parse import quote, urlparse  # pylint: disable=F0401
+from swift.common.constraints import CONTAINER_LISTING_LIMIT
 from swift.common.db import utf8encode
 from swift.common.swob import Range
 from swift.common.utils import json, public
@@ -54,21 +81,233 @@ DEFAULT_MAX_UPLOADS = 1000
 
 MAX_COMPLETE_UPLOAD_BODY_SIZE = 4096 * 1024
 
+SEGMENTS_CONTAINER_HEADER = sysmeta_header('object', 'segments-container')
+# Set on [bucket]+uploads by _migrate_legacy_uploads
+UPLOADS_MIGRATED_HEADER = sysmeta_header('container', 'uploads-migrated')
 
-def _get_upload_info(req, app, upload_id):
+# Upload sessions verified by Upload Part, see _get_upload_session
+UPLOAD_CACHE = Cache('upload', 'upload_cache_ttl', shared_only=True)
+# Multipart containers known to exist, see create_multipart_containers
+CONTAINER_CACHE = Cache('container', 'container_cache_ttl')
+# Results of Complete Multipart Upload, see UploadController.POST
+COMPLETE_CACHE = Cache('complete', 'complete_cache_ttl')
 
-    container = req.container_name + MULTIUPLOAD_SUFFIX
-    obj = '%s/%s' % (req.object_name, upload_id)
 
+def _segments_containers(bucket):
+    """
+    Returns the names of all the shards of the segments containers.
+    """
+    shards = max(CONF.segments_container_shards, 1)
+    return [bucket + MULTIUPLOAD_SUFFIX] + \
+        ['%s+%d%s' % (bucket, i, MULTIUPLOAD_SUFFIX) for i in range(1, shards)]
+
+
+def _choose_segments_container(bucket, upload_id):
+    containers = _segments_containers(bucket)
+    return containers[int(md5(upload_id).hexdigest(), 16) % len(containers)]
+
+
+def _segments_container(req, info):
+    """
+    Returns the container holding the parts of the upload, given the response
+    of _get_upload_info.
+    """
+    return info.sysmeta_headers.get(SEGMENTS_CONTAINER_HEADER) or \
+        req.container_name + MULTIUPLOAD_SUFFIX
+
+
+def _part_object_name(key, upload_id, part_number):
+    return '%s/%s/%05d' % (key, upload_id, part_number)
+
+
+def _part_number(name):
+    """
+    Returns the part number of a part object name, or None if the name is not
+    a part.  Parts uploaded before the numbers were zero padded are accepted
+    too.
+    """
     try:
-        return req.get_response(app, 'HEAD', container=container, obj=obj)
-    except NoSuchKey:
+        return int(name.rsplit('/', 1)[-1])
+    except ValueError:
+        return None
+
+
+def _get_upload_info(req, app, upload_id):
+    """
+    Returns the container holding the upload id object and the response of
+    a HEAD on it.
+    """
+    obj = '%s/%s' % (req.object_name, upload_id)
+
+    for container in (req.container_name + MULTIUPLOAD_INDEX_SUFFIX,
+                      req.container_name + MULTIUPLOAD_SUFFIX):
+        try:
+            return container, req.get_response(app, 'HEAD',
+                                               container=container, obj=obj)
+        except (NoSuchKey, NoSuchBucket):
+            pass
+
+    raise NoSuchUpload(upload_id=upload_id)
+
+
+def _migrate_legacy_uploads(req, app):
+    """
+    Copies the upload id objects which the uploads initiated before
+    [bucket]+uploads existed left in [bucket]+segments to [bucket]+uploads,
+    then flags [bucket]+uploads so that this is done once per bucket.
+    """
+    index = req.container_name + MULTIUPLOAD_INDEX_SUFFIX
+    legacy = req.container_name + MULTIUPLOAD_SUFFIX
+    create_multipart_containers(req, app, [index])
+
+    # the pattern matcher drops the parts like as object_name/upload_id/1
+    pattern = re.compile('/[0-9]+$')
+    query = {'format': 'json', 'marker': ''}
+    while True:
+        try:
+            resp = req._get_response(app, 'GET', legacy, '', query=query)
+        except NoSuchBucket:
+            break
+        objects = json.loads(resp.body)
+        if not objects:
+            break
+        for obj in objects:
+            name = obj['name'].encode('utf-8')
+            if pattern.search(name) is not None:
+                continue
+            headers = {'X-Copy-From': quote('/%s/%s' % (legacy, name)),
+                       'Content-Length': '0',
+                       SEGMENTS_CONTAINER_HEADER: legacy}
+            try:
+                req._get_response(app, 'PUT', index, name, headers=headers,
+                                  body='')
+                req._get_response(app, 'DELETE', legacy, name)
+            except (NoSuchKey, NoSuchBucket):
+                # completed or aborted meanwhile
+                pass
+        query['marker'] = objects[-1]['name'].encode('utf-8')
+
+    req._get_response(app, 'POST', index, '',
+                      headers={UPLOADS_MIGRATED_HEADER: 'true'})
+
+
+def _container_cache_key(req, container):
+    return '%s/%s' % (req.account, container)
+
+
+def create_multipart_containers(req, app, containers, force=False):
+    """
+    Creates the multipart containers which are not known to exist.  With
+    force, all of them are created regardless of the cache.
+    """
+    for container in containers:
+        key = _container_cache_key(req, container)
+        if force or not CONTAINER_CACHE.get(req.environ, key):
+            try:
+                req.get_response(app, 'PUT', container, '')
+            except BucketAlreadyExists:
+                pass
+            CONTAINER_CACHE.set(req.environ, key, True)
+        req.existing_containers.add(container)
+
+
+def invalidate_container_cache(req, container):
+    CONTAINER_CACHE.delete(req.environ, _container_cache_key(req, container))
+
+
+def _upload_cache_key(req, upload_id):
+    return '/'.join([req.container_name, req.object_name, upload_id])
+
+
+def _closed_upload_cache_key(req, upload_id):
+    return 'closed:' + _upload_cache_key(req, upload_id)
+
+
+def _check_upload_open(req, upload_id):
+    key = _closed_upload_cache_key(req, upload_id)
+    if UPLOAD_CACHE.get(req.environ, key):
         raise NoSuchUpload(upload_id=upload_id)
 
 
-def _check_upload_info(req, app, upload_id):
+def _get_upload_session(req, app, upload_id):
+    """
+    Returns the session of the upload for Upload Part.  A session is a dict
+    holding the segments container of the upload and the access keys which
+    were already checked against the upload.  It is cached in memcache for
+    upload_cache_ttl seconds when it has just been checked against the
+    upload id object, so the following parts skip that HEAD.
+
+    Complete and Abort leave a tombstone of the upload, see _close_upload,
+    which is checked on every part.  A session cached by a part which raced
+    with them is dropped by the check following the caching.
+    """
+    key = _upload_cache_key(req, upload_id)
+    _check_upload_open(req, upload_id)
+    session = UPLOAD_CACHE.get(req.environ, key)
+    if session and req.access_key in session['access_keys']:
+        # the segments container was there when the session was cached
+        req.existing_containers.add(session['segments_container'])
+        return session
+
+    _, info = _get_upload_info(req, app, upload_id)
+    access_keys = session['access_keys'] if session else []
+    session = {'segments_container': _segments_container(req, info),
+               'access_keys': access_keys + [req.access_key]}
+    UPLOAD_CACHE.set(req.environ, key, session)
+    try:
+        _check_upload_open(req, upload_id)
+    except NoSuchUpload:
+        UPLOAD_CACHE.delete(req.environ, key)
+        raise
+    return session
+
+
+def _close_upload(req, upload_id):
+    """
+    Leaves the tombstone of an upload being completed or aborted, before its
+    parts are used or deleted, and drops its session.
+    """
+    UPLOAD_CACHE.set(req.environ, _closed_upload_cache_key(req, upload_id),
+                     True)
+    UPLOAD_CACHE.delete(req.environ, _upload_cache_key(req, upload_id))
+
+
+def _reopen_upload(req, upload_id):
+    UPLOAD_CACHE.delete(req.environ, _closed_upload_cache_key(req, upload_id))
 
-    _get_upload_info(req, app, upload_id)
+
+def _complete_parts(req, upload_id):
+    """
+    Reads the body of Complete Multipart Upload and returns the list of its
+    [part number, etag] pairs.
+    """
+    parts = []
+    previous_number = 0
+    try:
+        xml = req.xml(MAX_COMPLETE_UPLOAD_BODY_SIZE)
+        complete_elem = fromstring(xml, 'CompleteMultipartUpload')
+        for part_elem in complete_elem.iterchildren('Part'):
+            part_number = int(part_elem.find('./PartNumber').text)
+
+            if part_number <= previous_number:
+                raise InvalidPartOrder(upload_id=upload_id)
+            previous_number = part_number
+
+            etag = part_elem.find('./ETag').text
+            if len(etag) >= 2 and etag[0] == '"' and etag[-1] == '"':
+                # strip double quotes
+                etag = etag[1:-1]
+
+            parts.append([part_number, etag])
+    except (XMLSyntaxError, DocumentInvalid):
+        raise MalformedXML()
+    except ErrorResponse:
+        raise
+    except Exception as e:
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        LOGGER.error(e)
+        raise exc_type, exc_value, exc_traceback
+    return parts
 
 
 class PartController(Controller):
@@ -100,13 +339,13 @@ class PartController(Controller):
                       ' inclusive' % CONF.max_upload_part_num
             raise InvalidArgument('partNumber', req.params['partNumber'],
                                   err_msg)
-        data = req.body
+        digest = req.digest_input()
         upload_id = req.params['uploadId']
-        _check_upload_info(req, self.app, upload_id)
+        session = _get_upload_session(req, self.app, upload_id)
 
-        req.container_name += MULTIUPLOAD_SUFFIX
-        req.object_name = '%s/%s/%d' % (req.object_name, upload_id,
-                                        part_number)
+        req.container_name = session['segments_container']
+        req.object_name = _part_object_name(req.object_name, upload_id,
+                                            part_number)
 
         req_timestamp = OssTimestamp.now()
         req.headers['X-Timestamp'] = req_timestamp.internal
@@ -139,14 +378,17 @@ class PartController(Controller):
             req.headers['range'] = rng
             del req.headers['x-oss-copy-source-range']
             
-        resp = req.get_response(self.app)
-         
-        do_crc64 = crcmod.mkCrcFun(0x142F0E1EBA9EA3693L, initCrc=0L, xorOut=0xffffffffffffffffL, rev=True)
+        try:
+            resp = req.get_response(self.app)
+        except Exception:
+            digest.check()
+            raise
+
         if 'x-oss-copy-source' in req.headers:
             resp.append_copy_resp_body(req.controller_name,
                                        req_timestamp.ossxmlformat)
         resp.status = 200
-        resp.headers['x-oss-hash-crc64ecma']=do_crc64(data)
+        resp.headers['x-oss-hash-crc64ecma'] = digest.crc64
         return resp
 
 
@@ -212,7 +454,8 @@ class UploadsController(Controller):
         keymarker = req.params.get('key-marker', '')
         uploadid = req.params.get('upload-id-marker', '')
         maxuploads = req.get_validated_param(
-            'max-uploads', DEFAULT_MAX_UPLOADS, DEFAULT_MAX_UPLOADS)
+            'max-uploads', DEFAULT_MAX_UPLOADS, DEFAULT_MAX_UPLOADS,
+            strict=True)
 
         query = {
             'format': 'json',
@@ -226,13 +469,13 @@ class UploadsController(Controller):
         if 'prefix' in req.params:
             query.update({'prefix': req.params['prefix']})
 
-        container = req.container_name + MULTIUPLOAD_SUFFIX
-        try:
-            resp = req.get_response(self.app, container=container, query=query)
-            objects = json.loads(resp.body)
-        except NoSuchBucket:
-            # Assume NoSuchBucket as no uploads
-            objects = []
+        resp = self._list_uploads(req, query)
+        if resp is None or \
+                not resp.sysmeta_headers.get(UPLOADS_MIGRATED_HEADER):
+            _migrate_legacy_uploads(req, self.app)
+            resp = self._list_uploads(req, query)
+        # Assume NoSuchBucket as no uploads
+        objects = json.loads(resp.body) if resp is not None else []
 
         def object_to_upload(object_info):
             obj, upid = object_info['name'].rsplit('/', 1)
@@ -242,11 +485,7 @@ class UploadsController(Controller):
             return obj_dict
 
         # uploads is a list consists of dict, {key, upload_id, last_modified}
-        # Note that pattern matcher will drop whole segments objects like as
-        # object_name/upload_id/1.
-        pattern = re.compile('/[0-9]+$')
-        uploads = [object_to_upload(obj) for obj in objects if
-                   pattern.search(obj.get('name', '')) is None]
+        uploads = [object_to_upload(obj) for obj in objects]
 
         prefixes = []
         if 'delimiter' in req.params:
@@ -263,7 +502,7 @@ class UploadsController(Controller):
 
         nextkeymarker = ''
         nextuploadmarker = ''
-        if len(uploads) > 1:
+        if uploads:
             nextuploadmarker = uploads[-1]['upload_id']
             nextkeymarker = uploads[-1]['key']
 
@@ -308,6 +547,14 @@ class UploadsController(Controller):
 
         return HTTPOk(body=body, content_type='application/xml')
 
+    def _list_uploads(self, req, query):
+        container = req.container_name + MULTIUPLOAD_INDEX_SUFFIX
+        try:
+            return req.get_response(self.app, container=container,
+                                    query=query)
+        except NoSuchBucket:
+            return None
+
     @public
     @object_operation
     @check_container_existence
@@ -318,15 +565,25 @@ class UploadsController(Controller):
 
         upload_id = unique_id()
 
-        container = req.container_name + MULTIUPLOAD_SUFFIX
-        try:
-            req.get_response(self.app, 'PUT', container, '')
-        except BucketAlreadyExists:
-            pass
+        segments_container = _choose_segments_container(req.container_name,
+                                                         upload_id)
+        container = req.container_name + MULTIUPLOAD_INDEX_SUFFIX
+        containers = (segments_container, container)
+        create_multipart_containers(req, self.app, containers)
 
         obj = '%s/%s' % (req.object_name, upload_id)
-
-        req.get_response(self.app, 'PUT', container, obj, body='')
+        headers = {SEGMENTS_CONTAINER_HEADER: segments_container}
+        try:
+            req.get_response(self.app, 'PUT', container, obj, body='',
+                             headers=headers)
+        except NoSuchBucket:
+            # The bucket was deleted and created again since the containers
+            # were cached, so none of them can be trusted.
+            for c in _segments_containers(req.container_name):
+                invalidate_container_cache(req, c)
+            create_multipart_containers(req, self.app, containers, force=True)
+            req.get_response(self.app, 'PUT', container, obj, body='',
+                             headers=headers)
 
         result_elem = Element('InitiateMultipartUploadResult')
         SubElement(result_elem, 'Bucket').text = req.container_name
@@ -355,23 +612,17 @@ class UploadController(Controller):
         """
         Handles List Parts.
         """
-        def filter_part_num_marker(o):
-            try:
-                num = int(os.path.basename(o['name']))
-                return num > part_num_marker
-            except ValueError:
-                return False
-
         encoding_type = req.params.get('encoding-type')
         if encoding_type is not None and encoding_type != 'url':
             err_msg = 'Invalid Encoding Method specified in Request'
             raise InvalidArgument('encoding-type', encoding_type, err_msg)
 
         upload_id = req.params['uploadId']
-        _check_upload_info(req, self.app, upload_id)
+        _, info = _get_upload_info(req, self.app, upload_id)
 
         maxparts = req.get_validated_param(
-            'max-parts', DEFAULT_MAX_PARTS_LISTING, CONF.max_parts_listing)
+            'max-parts', DEFAULT_MAX_PARTS_LISTING, CONF.max_parts_listing,
+            strict=True)
         part_num_marker = req.get_validated_param(
             'part-number-marker', 0)
 
@@ -381,33 +632,31 @@ class UploadController(Controller):
             'prefix': '%s/%s/' % (req.object_name, upload_id),
             'delimiter': '/'
         }
+        if part_num_marker:
+            query['marker'] = _part_object_name(req.object_name, upload_id,
+                                                part_num_marker)
 
-        container = req.container_name + MULTIUPLOAD_SUFFIX
+        container = _segments_container(req, info)
         resp = req.get_response(self.app, container=container, obj='',
                                 query=query)
         objects = json.loads(resp.body)
 
         last_part = 0
 
-        # If the caller requested a list starting at a specific part number,
-        # construct a sub-set of the object list.
-        objList = filter(filter_part_num_marker, objects)
-
-        # pylint: disable-msg=E1103
-        objList.sort(key=lambda o: int(o['name'].split('/')[-1]))
+        # Swift lists the parts in numeric order from the marker on, except
+        # for unpadded parts of uploads initiated by an older version.
+        objList = [o for o in objects
+                   if _part_number(o.get('name', '')) > part_num_marker]
+        objList.sort(key=lambda o: _part_number(o['name']))
 
-        if len(objList) > maxparts:
+        if len(objects) > maxparts:
             objList = objList[:maxparts]
             truncated = True
         else:
             truncated = False
-        # TODO: We have to retrieve object list again when truncated is True
-        # and some objects filtered by invalid name because there could be no
-        # enough objects for limit defined by maxparts.
 
         if objList:
-            o = objList[-1]
-            last_part = os.path.basename(o['name'])
+            last_part = _part_number(objList[-1]['name'])
 
         result_elem = Element('ListPartsResult')
         SubElement(result_elem, 'Bucket').text = req.container_name
@@ -433,7 +682,8 @@ class UploadController(Controller):
 
         for i in objList:
             part_elem = SubElement(result_elem, 'Part')
-            SubElement(part_elem, 'PartNumber').text = i['name'].split('/')[-1]
+            SubElement(part_elem, 'PartNumber').text = \
+                str(_part_number(i['name']))
             SubElement(part_elem, 'LastModified').text = \
                 i['last_modified'][:-6] + '000Z'
             SubElement(part_elem, 'ETag').text = '"%s"' % i['hash']
@@ -451,14 +701,15 @@ class UploadController(Controller):
         Handles Abort Multipart Upload.
         """
         upload_id = req.params['uploadId']
-        _check_upload_info(req, self.app, upload_id)
+        marker_container, info = _get_upload_info(req, self.app, upload_id)
 
         # First check to see if this multi-part upload was already
         # completed.  Look in the primary container, if the object exists,
         # then it was completed and we return an error here.
-        container = req.container_name + MULTIUPLOAD_SUFFIX
+        container = _segments_container(req, info)
         obj = '%s/%s' % (req.object_name, upload_id)
-        req.get_response(self.app, container=container, obj=obj)
+        _close_upload(req, upload_id)
+        req.get_response(self.app, container=marker_container, obj=obj)
 
         # The completed object was not found so this
         # must be a multipart upload abort.
@@ -475,7 +726,6 @@ class UploadController(Controller):
         #  Iterate over the segment objects and delete them individually
         objects = json.loads(resp.body)
         for o in objects:
-            container = req.container_name + MULTIUPLOAD_SUFFIX
             req.get_response(self.app, container=container, obj=o['name'])
 
         return HTTPNoContent()
@@ -488,8 +738,20 @@ class UploadController(Controller):
         Handles Complete Multipart Upload.
         """
         upload_id = req.params['uploadId']
+        cache_key = _upload_cache_key(req, upload_id)
+
+        # A client retrying a Complete which succeeded gets the same result
+        # for complete_cache_ttl seconds, though the upload no longer exists.
+        completed = COMPLETE_CACHE.get(req.environ, cache_key)
+        if completed and completed['access_key'] == req.access_key:
+            parts = _complete_parts(req, upload_id)
+            if completed['parts'] == md5(json.dumps(parts)).hexdigest():
+                return self._complete_result(req, HTTPOk(), completed['etag'])
+            raise NoSuchUpload(upload_id=upload_id)
+
         req.headers['x-object-meta-object-type'] = 'Multipart'
-        resp = _get_upload_info(req, self.app, upload_id)
+        marker_container, resp = _get_upload_info(req, self.app, upload_id)
+        container = _segments_container(req, resp)
         headers = {}
         for key, val in resp.headers.iteritems():
             _key = key.lower()
@@ -498,6 +760,37 @@ class UploadController(Controller):
             elif _key == 'content-type':
                 headers['Content-Type'] = val
 
+        # Parts uploaded from now on would not match the manifest.
+        _close_upload(req, upload_id)
+        try:
+            resp, info, parts = self._put_manifest(req, container, upload_id,
+                                                   headers)
+        except Exception:
+            _reopen_upload(req, upload_id)
+            raise
+
+        if int(info['size_bytes']) == 0:
+            # clean up the zero-byte segment
+            empty_seg_cont, empty_seg_name = info['path'].split('/', 2)[1:]
+            req.get_response(self.app, 'DELETE',
+                             container=empty_seg_cont, obj=empty_seg_name)
+
+        # clean up the multipart-upload record
+        obj = '%s/%s' % (req.object_name, upload_id)
+        req.get_response(self.app, 'DELETE', marker_container, obj)
+        COMPLETE_CACHE.set(req.environ, cache_key,
+                           {'etag': resp.etag,
+                            'parts': md5(json.dumps(parts)).hexdigest(),
+                            'access_key': req.access_key})
+
+        return self._complete_result(req, resp, resp.etag)
+
+    def _put_manifest(self, req, container, upload_id, headers):
+        """
+        Puts the SLO manifest of the parts listed in the body of Complete
+        Multipart Upload.  Returns the response of the manifest PUT, the last
+        part and the [part number, etag] pairs.
+        """
         # Query for the objects in the segments area to make sure it completed
         query = {
             'format': 'json',
@@ -505,46 +798,30 @@ class UploadController(Controller):
             'delimiter': '/'
         }
 
-        container = req.container_name + MULTIUPLOAD_SUFFIX
-        resp = req.get_response(self.app, 'GET', container, '', query=query)
-        objinfo = json.loads(resp.body)
-        objtable = dict((o['name'],
-                         {'path': '/'.join(['', container, o['name']]),
-                          'etag': o['hash'],
-                          'size_bytes': o['bytes']}) for o in objinfo)
+        objtable = {}
+        while True:
+            resp = req.get_response(self.app, 'GET', container, '',
+                                    query=query)
+            objinfo = json.loads(resp.body)
+            objtable.update((_part_number(o['name']),
+                             {'path': '/'.join(['', container, o['name']]),
+                              'etag': o['hash'],
+                              'size_bytes': o['bytes']})
+                            for o in objinfo if 'name' in o)
+            if len(objinfo) < CONTAINER_LISTING_LIMIT:
+                break
+            last = objinfo[-1]
+            query['marker'] = last.get('name', last.get('subdir'))
 
         manifest = []
-        previous_number = 0
-        try:
-            xml = req.xml(MAX_COMPLETE_UPLOAD_BODY_SIZE)
-            complete_elem = fromstring(xml, 'CompleteMultipartUpload')
-            for part_elem in complete_elem.iterchildren('Part'):
-                part_number = int(part_elem.find('./PartNumber').text)
-
-                if part_number <= previous_number:
-                    raise InvalidPartOrder(upload_id=upload_id)
-                previous_number = part_number
-
-                etag = part_elem.find('./ETag').text
-                if len(etag) >= 2 and etag[0] == '"' and etag[-1] == '"':
-                    # strip double quotes
-                    etag = etag[1:-1]
-
-                info = objtable.get("%s/%s/%s" % (req.object_name, upload_id,
-                                                  part_number))
-                if info is None or info['etag'] != etag:
-                    raise InvalidPart(upload_id=upload_id,
-                                      part_number=part_number)
-
-                manifest.append(info)
-        except (XMLSyntaxError, DocumentInvalid):
-            raise MalformedXML()
-        except ErrorResponse:
-            raise
-        except Exception as e:
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            LOGGER.error(e)
-            raise exc_type, exc_value, exc_traceback
+        parts = _complete_parts(req, upload_id)
+        for part_number, etag in parts:
+            info = objtable.get(part_number)
+            if info is None or info['etag'] != etag:
+                raise InvalidPart(upload_id=upload_id,
+                                  part_number=part_number)
+
+            manifest.append(info)
 
         # Following swift commit 7f636a5, zero-byte segments aren't allowed,
         # even as the final segment
@@ -559,6 +836,10 @@ class UploadController(Controller):
             if manifest and int(manifest[-1]['size_bytes']) == 0:
                 raise EntityTooSmall()
 
+        if len(manifest) > max_manifest_segments():
+            manifest = self._put_sub_manifests(req, container, upload_id,
+                                               manifest)
+
         try:
             # TODO: add support for versioning
             if manifest:
@@ -588,16 +869,12 @@ class UploadController(Controller):
             else:
                 raise
 
-        if int(info['size_bytes']) == 0:
-            # clean up the zero-byte segment
-            empty_seg_cont, empty_seg_name = info['path'].split('/', 2)[1:]
-            req.get_response(self.app, 'DELETE',
-                             container=empty_seg_cont, obj=empty_seg_name)
-
-        # clean up the multipart-upload record
-        obj = '%s/%s' % (req.object_name, upload_id)
-        req.get_response(self.app, 'DELETE', container, obj)
+        return resp, info, parts
 
+    def _complete_result(self, req, resp, etag):
+        """
+        Makes resp the success response of Complete Multipart Upload.
+        """
         result_elem = Element('CompleteMultipartUploadResult')
 
         # NOTE: boto with sig v4 appends port to HTTP_HOST value at the
@@ -615,10 +892,36 @@ class UploadController(Controller):
         SubElement(result_elem, 'Location').text = host_url + req.path
         SubElement(result_elem, 'Bucket').text = req.container_name
         SubElement(result_elem, 'Key').text = req.object_name
-        SubElement(result_elem, 'ETag').text = resp.etag
+        SubElement(result_elem, 'ETag').text = etag
 
         resp.body = tostring(result_elem)
         resp.status = 200
         resp.content_type = "application/xml"
 
         return resp
+
+    def _put_sub_manifests(self, req, container, upload_id, manifest):
+        """
+        Splits the manifest into SLO sub-manifests stored in the segments
+        container and returns the manifest of the sub-manifests.
+        """
+        size = max_manifest_segments()
+        if len(manifest) > size * size:
+            raise InvalidRequest('Too many parts; the maximum is %d' %
+                                 (size * size))
+
+        sub_manifests = []
+        for i in range(0, len(manifest), size):
+            segments = manifest[i:i + size]
+            obj = '%s/%s/manifest/%05d' % (req.object_name, upload_id,
+                                           len(sub_manifests) + 1)
+            req.get_response(self.app, 'PUT', container, obj,
+                             body=json.dumps(segments),
+                             query={'multipart-manifest': 'put'})
+            # the ETag of an SLO is the MD5 of the ETags of its segments
+            etag = md5(''.join(s['etag'] for s in segments)).hexdigest()
+            sub_manifests.append({
+                'path': '/'.join(['', container, obj]),
+                'etag': etag,
+                'size_bytes': sum(int(s['size_bytes']) for s in segments)})
+        return sub_manifests
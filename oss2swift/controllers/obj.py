@@ -1,14 +1,35 @@
+from hashlib import md5
 import sys
+from urllib import unquote
 import zlib
 
-import crcmod
+from eventlet import GreenPool
+from oss2swift.cfg import CONF
+from oss2swift.controllers.append import appended_prefix, \
+    delete_appended_segments
 from oss2swift.controllers.base import Controller
+from oss2swift.controllers.multi_upload import create_multipart_containers
 from oss2swift.response import OssNotImplemented, InvalidRange, NoSuchKey, \
-    InvalidArgument, ObjectInvalid
-from oss2swift.utils import OssTimestamp, time_slow, to_unixtime
+    InvalidArgument, ObjectInvalid, IncompleteBody, HTTPOk
+from oss2swift.utils import OssTimestamp, time_slow, to_unixtime, \
+    unique_id, sysmeta_header, metadata_post_headers, LOGGER, \
+    MULTIUPLOAD_SUFFIX, FAST_POST_SUPPORTED, max_manifest_segments
 from swift.common.http import HTTP_OK, HTTP_PARTIAL_CONTENT, HTTP_NO_CONTENT
 from swift.common.swob import Range, content_range_header_value
-from swift.common.utils import public
+from swift.common.utils import json, public, split_path
+
+
+ETAG_HEADER = sysmeta_header('object', 'etag')
+
+# Request headers of PUT Object which describe the object, and so must not
+# be copied to its segments, see ObjectController._segment_headers
+OBJECT_ENVIRON_KEYS = ('CONTENT_TYPE', 'HTTP_CONTENT_ENCODING',
+                       'HTTP_CONTENT_DISPOSITION', 'HTTP_CONTENT_MD5',
+                       'HTTP_CACHE_CONTROL', 'HTTP_EXPIRES',
+                       'HTTP_X_DELETE_AT', 'HTTP_X_DELETE_AFTER')
+OBJECT_ENVIRON_PREFIXES = ('HTTP_X_OSS_', 'HTTP_X_OBJECT_META_',
+                           'HTTP_X_OBJECT_SYSMETA_',
+                           'HTTP_X_OBJECT_TRANSIENT_SYSMETA_')
 
 
 class ObjectController(Controller):
@@ -148,20 +169,16 @@ class ObjectController(Controller):
         req_timestamp = OssTimestamp.now()
         expireDay = ''
         createDate = ''
-        data = req.body
-        do_crc64 = crcmod.mkCrcFun(0x142F0E1EBA9EA3693L, initCrc=0L, xorOut=0xffffffffffffffffL, rev=True)
-        crcValue = do_crc64(data)
 
         req.headers['X-Timestamp'] = req_timestamp.internal
         req.headers['x-object-meta-object-type'] = 'Normal'
-        req.headers['x-object-meta-hash-crc64ecma'] = str(crcValue)
 
         if all(h in req.headers
                for h in ('x-oss-copy-source', 'x-oss-copy-source-range')):
             raise InvalidArgument('x-oss-copy-source-range',
                                   req.headers['x-oss-copy-source-range'],
                                   'Illegal copy header')
-        req.check_copy_source(self.app)
+        src_resp = req.check_copy_source(self.app)
         bucket_headers = {}
         bucket_headers = req.get_container_info(self.app)
         expireDay, createDate = self._parse_lifecycle(bucket_headers, req.object_name)
@@ -181,7 +198,27 @@ class ObjectController(Controller):
                     req.headers['X-Object-Meta-ValidDate'] = unix_time
             except:
                 raise InvalidArgument('X-Object-Meta-ValidDate', createDate)
-        resp = req.get_response(self.app)
+
+        if self._is_metadata_replace(req, src_resp):
+            return self._replace_metadata(req, src_resp, req_timestamp)
+
+        # the segments of the appendable object replaced, if any
+        prefix = appended_prefix(req, self.app, bucket_headers)
+        if self._should_segment(req):
+            resp = self._put_segmented(req)
+        else:
+            resp = self._put(req, req_timestamp)
+        if prefix:
+            delete_appended_segments(req, self.app, prefix)
+        return resp
+
+    def _put(self, req, req_timestamp):
+        digest = req.digest_input(crc64_footer=True)
+        try:
+            resp = req.get_response(self.app)
+        except Exception:
+            digest.check()
+            raise
 
         if 'x-oss-copy-source' in req.headers:
             resp.append_copy_resp_body(req.controller_name,
@@ -193,9 +230,161 @@ class ObjectController(Controller):
                     del resp.headers[key]
 
         resp.status = HTTP_OK
-        resp.headers['x-oss-hash-crc64ecma'] = crcValue
+        resp.headers['x-oss-hash-crc64ecma'] = digest.crc64
+        return resp
+
+    def _is_metadata_replace(self, req, src_resp):
+        """
+        Returns whether the request copies the object onto itself to replace
+        its metadata.  Swift before 2.10.0 can't change the Content-Type of an
+        object by a POST, so the object is then copied onto itself instead.
+        """
+        if not FAST_POST_SUPPORTED or src_resp is None or \
+                req.headers.get('x-oss-metadata-directive') != 'REPLACE':
+            return False
+        src_bucket, src_obj = \
+            split_path(unquote(req.headers['x-oss-copy-source']), 2, 2, True)
+        return (src_bucket, src_obj) == (req.container_name, req.object_name)
+
+    def _replace_metadata(self, req, src_resp, req_timestamp):
+        """
+        Replaces the metadata of the object with a POST, so Swift does not
+        read and write the whole object again as it would for a copy.  The
+        system metadata, and so the SLO manifest, are kept by Swift.
+        """
+        if CONF.oss_acl:
+            # POST is not mapped by the ACL handler, so check that the user
+            # may write the bucket first.
+            req.get_response(self.app, 'HEAD', obj='')
+
+        headers = metadata_post_headers(src_resp, req.container_name,
+                                        user_meta=False)
+        headers['X-Copy-From'] = None
+        req._get_response(self.app, 'POST', None, None, headers=headers)
+
+        resp = HTTPOk()
+        resp.etag = src_resp.etag
+        resp.append_copy_resp_body(req.controller_name,
+                                   req_timestamp.ossxmlformat)
+        if 'x-oss-hash-crc64ecma' in src_resp.headers:
+            resp.headers['x-oss-hash-crc64ecma'] = \
+                src_resp.headers['x-oss-hash-crc64ecma']
+        return resp
+
+    def _should_segment(self, req):
+        if CONF.put_segment_threshold <= 0 or \
+                'x-oss-copy-source' in req.headers or \
+                req.content_length is None:
+            return False
+        return req.content_length > CONF.put_segment_threshold
+
+    def _read(self, wsgi_input, size):
+        chunks = []
+        while size > 0:
+            chunk = wsgi_input.read(min(size, 65536))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        return ''.join(chunks)
+
+    def _segment_headers(self, req, etag):
+        """
+        Returns the headers of the PUT of a segment, which drop the metadata
+        of the object sent by the client.  It is stored on the manifest only.
+        """
+        headers = {'ETag': etag}
+        for key in req.environ:
+            if key.startswith('HTTP_X_OSS_META_'):
+                # sent to Swift as X-Object-Meta-*, see to_swift_req
+                key = 'HTTP_X_OBJECT_META_' + key[16:]
+            if key in OBJECT_ENVIRON_KEYS or \
+                    key.startswith(OBJECT_ENVIRON_PREFIXES):
+                name = key[5:] if key.startswith('HTTP_') else key
+                headers[name.replace('_', '-')] = None
+        return headers
+
+    def _put_segmented(self, req):
+        """
+        Stores the body of PUT Object as segments in [bucket]+segments and the
+        object as an SLO manifest of them.  Up to put_segment_concurrency
+        segments are written at a time, and the data of a segment is dropped
+        as soon as it is written, so no more than that many plus the one being
+        read are buffered.
+        """
+        if CONF.oss_acl:
+            # The segments are written without going through the ACL handler,
+            # so check that the user may write the bucket first.
+            req.get_response(self.app, 'HEAD', obj='')
+        container = req.container_name + MULTIUPLOAD_SUFFIX
+        create_multipart_containers(req, self.app, [container])
+
+        length = req.content_length
+        segment_size = max(CONF.put_segment_size,
+                           -(-length // max_manifest_segments()))
+        # Each segment is checked against its own ETag and the whole body
+        # against the Content-MD5 by the DigestInput.
+        digest = req.digest_input()
+        if 'ETag' in req.headers:
+            del req.headers['ETag']
+
+        prefix = '%s/%s' % (req.object_name, unique_id())
+        pool = GreenPool(max(CONF.put_segment_concurrency, 1))
+        manifest = []
+        errors = []
+
+        def put_segment(obj, etag, data):
+            # The response is not kept: its environ holds the data.
+            try:
+                req._get_response(self.app, 'PUT', container, obj,
+                                  self._segment_headers(req, etag), data)
+            except Exception:
+                if not errors:
+                    errors.append(sys.exc_info())
+
+        try:
+            while length > 0 and not errors:
+                data = self._read(digest, min(segment_size, length))
+                if not data:
+                    raise IncompleteBody()
+                length -= len(data)
+
+                obj = '%s/%05d' % (prefix, len(manifest) + 1)
+                etag = md5(data).hexdigest()
+                manifest.append({'path': '/'.join(['', container, obj]),
+                                 'etag': etag, 'size_bytes': len(data)})
+                # blocks while put_segment_concurrency segments are in flight
+                pool.spawn_n(put_segment, obj, etag, data)
+                data = None
+            pool.waitall()
+            if errors:
+                exc_type, exc_value, exc_traceback = errors.pop()
+                raise exc_type, exc_value, exc_traceback
+        except Exception:
+            pool.waitall()
+            self._delete_segments(req, manifest)
+            digest.check()
+            raise
+
+        headers = {'x-object-meta-hash-crc64ecma': str(digest.crc64),
+                   ETAG_HEADER: digest.md5}
+        resp = req.get_response(self.app, 'PUT',
+                                body=json.dumps(manifest),
+                                query={'multipart-manifest': 'put'},
+                                headers=headers)
+        resp.status = HTTP_OK
+        resp.etag = digest.md5
+        resp.headers['x-oss-hash-crc64ecma'] = digest.crc64
         return resp
 
+    def _delete_segments(self, req, manifest):
+        for segment in manifest:
+            container, obj = segment['path'].split('/', 2)[1:]
+            try:
+                req._get_response(self.app, 'DELETE', container, obj)
+            except Exception as e:
+                LOGGER.debug(e)
+
     @public
     def POST(self, req):
         raise OssNotImplemented()
@@ -207,6 +396,7 @@ class ObjectController(Controller):
         """
         try:
             query = req.gen_multipart_manifest_delete_query(self.app)
+            prefix = appended_prefix(req, self.app)
             req.headers['Content-Type'] = None  # Ignore client content-type
             resp = req.get_response(self.app, query=query)
             if query and resp.status_int == HTTP_OK:
@@ -219,4 +409,6 @@ class ObjectController(Controller):
             exc_type, exc_value, exc_traceback = sys.exc_info()
             req.get_container_info(self.app)
             raise exc_type, exc_value, exc_traceback
+        if prefix:
+            delete_appended_segments(req, self.app, prefix)
         return resp
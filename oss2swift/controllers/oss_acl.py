@@ -4,6 +4,7 @@ from urllib import quote
 from oss2swift.controllers.base import Controller
 from oss2swift.etree import tostring
 from oss2swift.response import HTTPOk, OssNotImplemented
+from oss2swift.utils import TRANSIENT_SYSMETA_SUPPORTED
 from swift.common.utils import public
 
 
@@ -29,13 +30,17 @@ class OssAclController(Controller):
         """
         Handles PUT Bucket acl and PUT Object acl.
         """
-        if req.is_object_request:
+        if req.is_object_request and not TRANSIENT_SYSMETA_SUPPORTED:
+            # Swift before 2.9.0 drops transient sysmeta, so the object is
+            # copied onto itself with its new ACL in sysmeta.
             headers = {}
             src_path = '/%s/%s' % (req.container_name, req.object_name)
             headers['X-Copy-From'] = quote(src_path)
             headers['Content-Length'] = 0
             req.get_response(self.app, 'PUT', headers=headers)
         else:
+            # The object ACL is kept in transient sysmeta, so that it is
+            # changed by a POST instead of a copy of the object onto itself.
             req.get_response(self.app, 'POST')
 
         return HTTPOk()
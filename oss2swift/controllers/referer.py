@@ -58,7 +58,7 @@ class RefererController(Controller):
         """
         Handle GET Bucket Referer  request
         """
-        resp = req.get_response(self.app)
+        resp = req.get_response(self.app, 'HEAD')
         referers=resp.headers['X-Container-Read']
 	real_referers=get_oss_refer(referers)
         elem = Element('RefererConfiguration')
@@ -27,7 +27,7 @@ class WebsiteController(Controller):
         """
         Handle GET Bucket website request
         """
-        resp = req.get_response(self.app)
+        resp = req.get_response(self.app, 'HEAD')
 	if resp.bucket_acl =='private':
 	   raise AccessDenied()
 	if 'x-oss-web-index' not in resp.headers:
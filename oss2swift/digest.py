@@ -0,0 +1,76 @@
+"""
+Single pass digests of request bodies.
+
+DigestInput wraps wsgi.input and computes the MD5 and the CRC64 of the body
+while Swift (or oss2swift) reads it, so the body is neither buffered nor
+hashed twice.  The expected MD5 from Content-MD5 is checked as soon as the
+last byte is read.  A mismatch fails that read, so the proxy aborts the
+backend PUT before the object servers commit it.
+"""
+
+from hashlib import md5
+
+import crcmod
+from oss2swift.response import InvalidDigest
+from swift.common.swob import HTTPUnprocessableEntity
+
+
+crc64 = crcmod.mkCrcFun(0x142F0E1EBA9EA3693L, initCrc=0L,
+                        xorOut=0xffffffffffffffffL, rev=True)
+
+
+class DigestInput(object):
+    """
+    File-like wrapper computing the MD5 and the CRC64 of the data read
+    through it.
+
+    :param wsgi_input: the file to read
+    :param content_length: number of bytes of the body, or None if unknown
+    :param etag: expected MD5 of the body as a hex digest, or None
+    """
+    def __init__(self, wsgi_input, content_length=None, etag=None):
+        self.wsgi_input = wsgi_input
+        self.content_length = content_length
+        self.etag = etag
+        self.bytes_read = 0
+        self.crc64 = crc64('')
+        self.bad_digest = False
+        self._md5 = md5()
+        self._finished = False
+
+    @property
+    def md5(self):
+        return self._md5.hexdigest()
+
+    def _update(self, chunk, size):
+        if chunk:
+            self.bytes_read += len(chunk)
+            self._md5.update(chunk)
+            self.crc64 = crc64(chunk, self.crc64)
+        if (not chunk and size != 0) or \
+                self.bytes_read == self.content_length:
+            self._finish()
+        return chunk
+
+    def _finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        if self.etag and self.md5 != self.etag:
+            self.bad_digest = True
+            raise HTTPUnprocessableEntity()
+
+    def read(self, size=-1):
+        return self._update(self.wsgi_input.read(size), size)
+
+    def readline(self, size=-1):
+        return self._update(self.wsgi_input.readline(size), size)
+
+    def check(self):
+        """
+        Raises InvalidDigest if the body did not match the expected MD5.
+        Call it when a request reading the body failed, to tell the client
+        why.
+        """
+        if self.bad_digest:
+            raise InvalidDigest()
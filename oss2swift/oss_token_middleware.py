@@ -5,21 +5,50 @@ This WSGI component:
   access key.
 * Validates oss token in Keystone.
 * Transforms the account name to AUTH_%(tenant_name).
+
+The tokens obtained from Keystone are cached, in memcache when the cache
+middleware is in the pipeline and in a LRU local to the worker otherwise, so
+Keystone is only asked again when the token is about to expire.  The
+requests to Keystone reuse the connections of a pool kept by each worker.
+
+With secret_cache_duration, the signature of a request is checked against
+the secret of its access key rather than a shared password.  The secret is
+read once from the EC2 credential of the access key in Keystone and cached,
+encrypted, for secret_cache_duration seconds, so the signatures of the
+following requests are checked locally.  A signature that does not match
+the cached secret makes the middleware read the credential again, so the
+new secret of a rotated credential is accepted at once.  The old secret of
+a rotated or deleted credential, however, keeps matching the cached secret
+and is accepted for up to secret_cache_duration seconds.
+
+An access key which fails to authenticate from a client address, because of
+its signature or because Keystone denies it, is rejected without asking
+Keystone for auth_failure_damping seconds, twice as long after each
+consecutive failure, up to auth_failure_max_damping seconds.  The client
+address is the peer address of the request, or the one in its
+X-Forwarded-For when the peer is one of auth_failure_trusted_proxies.
+Keystone errors other than the denial of the credentials are not counted.
 """
 
 import base64
-from hashlib import sha1
+from hashlib import sha1, sha256, md5
 import hmac
 import json
 import logging
+import os
 import sys
+import time
 
-from oss2swift.utils import is_valid_ipv6
+from cryptography.fernet import Fernet, InvalidToken
+from oss2swift.cache import LRUCache, is_damped, record_failure
+from oss2swift.utils import client_address, is_valid_ipv6, keystone_expires
 import requests
+from requests.adapters import HTTPAdapter
 import six
 from six.moves.urllib.parse import unquote
 from swift.common.swob import Request, Response, HTTPUnauthorized
-from swift.common.utils import config_true_value, split_path
+from swift.common.utils import cache_from_env, config_true_value, \
+    get_logger, list_from_csv, split_path, streq_const_time
 from swift.common.wsgi import ConfigFileError
 
 
@@ -30,6 +59,44 @@ class ServiceError(Exception):
     pass
 
 
+def _token_expires(token):
+    """
+    Returns the expiry of a Keystone v2 token as seconds since the epoch, or
+    None if it is unknown.
+    """
+    return keystone_expires({'access': {'token': token}})
+
+
+def _sign(key, msg):
+    return base64.encodestring(hmac.new(key, msg, sha1).digest()).strip()
+
+
+def _fernet(key):
+    """
+    Returns the Fernet of the 256 bit key derived from key.
+    """
+    return Fernet(base64.urlsafe_b64encode(sha256(key).digest()))
+
+
+def encrypt_secret(key, secret):
+    """
+    Encrypts a secret with key before it is cached, as a Fernet token
+    (AES-128-CBC authenticated with HMAC-SHA256).
+    """
+    return _fernet(key).encrypt(secret)
+
+
+def decrypt_secret(key, value):
+    """
+    Returns the secret encrypted by encrypt_secret, or None if value was not
+    encrypted with key.
+    """
+    try:
+        return _fernet(key).decrypt(value)
+    except (InvalidToken, TypeError, ValueError):
+        return None
+
+
 class OssToken(object):
     """Middleware that handles Oss authentication."""
 
@@ -38,6 +105,8 @@ class OssToken(object):
         self._app = app
         self._logger = logging.getLogger(conf.get('log_name', __name__))
         self._logger.debug('Starting the %s component', PROTOCOL_NAME)
+        # StatsD metrics of the Keystone requests
+        self._metrics = get_logger(conf, log_route='osstoken')
         self._reseller_prefix = conf.get('reseller_prefix', 'AUTH_')
         # where to find the auth service (we use this to validate tokens)
         self.passwd=conf.get('passwd')
@@ -77,10 +146,133 @@ class OssToken(object):
         else:
             self._verify = None
 
+        # Keystone connections, kept alive between requests.  The proxy
+        # server monkey patches the sockets, so they are green.
+        self._timeout = (float(conf.get('keystone_conn_timeout', 5)),
+                         float(conf.get('keystone_timeout', 10)))
+        pool_size = int(conf.get('keystone_pool_size', 10))
+        self._session = requests.Session()
+        for prefix in ('http://', 'https://'):
+            self._session.mount(prefix, HTTPAdapter(pool_connections=1,
+                                                    pool_maxsize=pool_size))
+
+        # Token cache
+        self._token_cache_time = int(conf.get('token_cache_time', 300))
+        self._token_cache_refresh = int(conf.get('token_cache_refresh', 60))
+        self._token_cache = LRUCache(int(conf.get('local_cache_size', 10000)))
+
+        # Secrets of the access keys, read from Keystone with the service
+        # credentials.  Without a secret_cache_key shared by the workers,
+        # each worker encrypts with its own key and only caches locally.
+        self._secret_cache_duration = int(conf.get('secret_cache_duration',
+                                                   0))
+        self._admin_user = conf.get('admin_user')
+        self._admin_password = conf.get('admin_password')
+        self._admin_tenant_name = conf.get('admin_tenant_name')
+        self._secret_cache_key = conf.get('secret_cache_key')
+        self._secret_key = self._secret_cache_key or os.urandom(32)
+        self._secret_cache = LRUCache(
+            int(conf.get('local_cache_size', 10000)))
+        if self._secret_cache_duration > 0 and not self._admin_user:
+            raise ConfigFileError(
+                'admin_user required with secret_cache_duration')
+
+        # Negative cache of the access keys failing to authenticate
+        self._auth_failure_damping = float(conf.get('auth_failure_damping',
+                                                    1))
+        self._auth_failure_max_damping = int(conf.get(
+            'auth_failure_max_damping', 60))
+        self._failure_cache = LRUCache(
+            int(conf.get('local_cache_size', 10000)))
+        self._trusted_proxies = set(list_from_csv(
+            conf.get('auth_failure_trusted_proxies', '')))
+
+    def _token_cache_key(self, access, force_tenant):
+        return 'oss2swift/token/%s' % md5(
+            '%s\n%s' % (access, force_tenant or '')).hexdigest()
+
+    def _get_cached_token(self, environ, key):
+        """
+        Returns the cached token of the key as a dict with the token id, the
+        tenant id and the expiry of the token, or None.
+        """
+        if self._token_cache_time <= 0:
+            return None
+        memcache = cache_from_env(environ, True)
+        if memcache is None:
+            cached = self._token_cache.get(key)
+        else:
+            cached = memcache.get(key)
+        # Get a new token a bit before this one expires, so that it does not
+        # expire while the request is served.
+        if cached and \
+                cached['expires'] - self._token_cache_refresh > time.time():
+            return cached
+        return None
+
+    def _cache_token(self, environ, key, token_id, tenant_id, expires):
+        if expires is None:
+            return
+        ttl = int(min(self._token_cache_time,
+                      expires - self._token_cache_refresh - time.time()))
+        if ttl <= 0:
+            return
+        value = {'token': token_id, 'tenant': tenant_id, 'expires': expires}
+        memcache = cache_from_env(environ, True)
+        if memcache is None:
+            self._token_cache.set(key, value, ttl)
+        else:
+            memcache.set(key, value, time=ttl)
+
+    def _get_failure(self, environ, key):
+        if self._auth_failure_max_damping <= 0:
+            return None
+        memcache = cache_from_env(environ, True)
+        if memcache is None:
+            return self._failure_cache.get(key)
+        return memcache.get(key)
+
+    def _record_failure(self, environ, key, failure, access, reason):
+        """
+        Remembers that an access key failed to authenticate, and returns the
+        response rejecting it.
+        """
+        self._metrics.increment('rejected.%s' % reason)
+        if self._auth_failure_max_damping > 0:
+            failure = record_failure(failure, reason,
+                                     self._auth_failure_damping,
+                                     self._auth_failure_max_damping)
+            memcache = cache_from_env(environ, True)
+            if memcache is None:
+                self._failure_cache.set(key, failure,
+                                        self._auth_failure_max_damping)
+            else:
+                memcache.set(key, failure,
+                             time=self._auth_failure_max_damping)
+            self._logger.info('Rejected access key %s: %s (%d failures)',
+                              access, reason, failure['failures'])
+
+    def _clear_failure(self, environ, key, failure):
+        if not failure:
+            return
+        memcache = cache_from_env(environ, True)
+        if memcache is None:
+            self._failure_cache.delete(key)
+        else:
+            memcache.delete(key)
+
+    def _reject(self, req, reason, signature):
+        if reason == 'SignatureDoesNotMatch':
+            auth = 'Swift realm="%s"' % signature
+            return HTTPUnauthorized(request=req,
+                                    headers={'Www-Authenticate': auth})
+        return self._deny_request(reason)
+
     def _deny_request(self, code):
         error_table = {
             'AccessDenied': (401, 'Access denied'),
             'InvalidURI': (400, 'Could not parse the specified URI'),
+            'ServiceUnavailable': (503, 'Service unavailable'),
 	    'Unauthorized': (403, 'Unauthorized'),
         }
         resp = Response(content_type='text/xml')
@@ -94,25 +286,152 @@ class OssToken(object):
         resp.body = error_msg
         return resp
 
-    def _json_request(self, creds_json):
-        headers = {'Content-Type': 'application/json'}
+    def _keystone_request(self, method, path, **kwargs):
+        start = time.time()
         try:
-            response = requests.post('%s/v2.0/tokens' % self._request_uri,
-                                     headers=headers, data=creds_json,
-                                     verify=self._verify)
+            return getattr(self._session, method)(
+                self._request_uri + path, verify=self._verify,
+                timeout=self._timeout, **kwargs)
         except requests.exceptions.RequestException as e:
             self._logger.info('HTTP connection exception: %s', e)
-            resp = self._deny_request('InvalidURI')
+            self._metrics.increment('keystone.errors')
+            resp = self._deny_request('ServiceUnavailable')
             raise ServiceError(resp)
+        finally:
+            self._metrics.timing_since('keystone.timing', start)
+            self._logger.debug('Keystone request took %.3fs',
+                               time.time() - start)
 
+    def _json_request(self, creds_json):
+        headers = {'Content-Type': 'application/json'}
+        response = self._keystone_request('post', '/v2.0/tokens',
+                                          headers=headers, data=creds_json)
         if response.status_code < 200 or response.status_code >= 300:
             self._logger.debug('Keystone reply error: status=%s reason=%s',
                                response.status_code, response.reason)
-            resp = self._deny_request('AccessDenied')
+            if response.status_code in (401, 403):
+                resp = self._deny_request('AccessDenied')
+            else:
+                # not the fault of the credentials
+                resp = self._deny_request('ServiceUnavailable')
             raise ServiceError(resp)
 
         return response
 
+    def _service_token(self, environ, refresh=False):
+        """
+        Returns a token of the service credentials, which read the
+        credentials of the access keys.
+        """
+        key = 'oss2swift/service-token/%s' % md5('%s\n%s' % (
+            self._admin_user, self._admin_tenant_name or '')).hexdigest()
+        cached = None if refresh else self._get_cached_token(environ, key)
+        if cached:
+            return cached['token']
+        creds = {'auth': {'passwordCredentials': {
+            'username': self._admin_user,
+            'password': self._admin_password},
+            'tenantName': self._admin_tenant_name}}
+        try:
+            resp = self._json_request(json.dumps(creds))
+        except ServiceError:
+            # the service credentials are not the ones of the client
+            raise ServiceError(self._deny_request('ServiceUnavailable'))
+        try:
+            token = resp.json()['access']['token']
+            token_id = str(token['id'])
+        except (ValueError, KeyError, TypeError):
+            self._logger.debug('Error on keystone reply: %d %s',
+                               resp.status_code, resp.content)
+            raise ServiceError(self._deny_request('InvalidURI'))
+        self._cache_token(environ, key, token_id,
+                          token.get('tenant', {}).get('id'),
+                          _token_expires(token))
+        return token_id
+
+    def _fetch_secret(self, environ, access):
+        """
+        Returns the secret of the EC2 credential of an access key in
+        Keystone, or None if the access key has no credential.
+        """
+        path = '/v3/credentials/%s' % sha256(access).hexdigest()
+        for refresh in (False, True):
+            headers = {'X-Auth-Token': self._service_token(environ, refresh)}
+            response = self._keystone_request('get', path, headers=headers)
+            # a cached service token may have been revoked
+            if response.status_code != 401:
+                break
+
+        if response.status_code == 404:
+            return None
+        if response.status_code < 200 or response.status_code >= 300:
+            self._logger.debug('Keystone reply error: status=%s reason=%s',
+                               response.status_code, response.reason)
+            raise ServiceError(self._deny_request('ServiceUnavailable'))
+        try:
+            blob = response.json()['credential']['blob']
+            if isinstance(blob, six.string_types):
+                blob = json.loads(blob)
+            if blob.get('access') != access:
+                return None
+            secret = blob['secret']
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self._logger.debug('Error on keystone reply: %d %s',
+                               response.status_code, response.content)
+            raise ServiceError(self._deny_request('InvalidURI'))
+        if isinstance(secret, six.text_type):
+            secret = secret.encode('utf-8')
+        return secret
+
+    def _get_secret(self, environ, access, refresh=False):
+        """
+        Returns the secret of an access key, or None if it has none, and
+        whether the secret came from the cache.
+        """
+        key = 'oss2swift/secret/%s' % md5(access).hexdigest()
+        memcache = None
+        if self._secret_cache_key:
+            memcache = cache_from_env(environ, True)
+        if not refresh:
+            if memcache is None:
+                cached = self._secret_cache.get(key)
+            else:
+                cached = memcache.get(key)
+            secret = cached and decrypt_secret(self._secret_key, cached)
+            if secret:
+                return secret, True
+
+        secret = self._fetch_secret(environ, access)
+        if not secret:
+            if memcache is None:
+                self._secret_cache.delete(key)
+            else:
+                memcache.delete(key)
+            return None, False
+        value = encrypt_secret(self._secret_key, secret)
+        if memcache is None:
+            self._secret_cache.set(key, value, self._secret_cache_duration)
+        else:
+            memcache.set(key, value, time=self._secret_cache_duration)
+        return secret, False
+
+    def _check_signature(self, environ, access, msg, signature):
+        """
+        Checks a signature against the secret of the access key.  When it
+        does not match the cached secret, it is checked against the secret
+        in Keystone, which may have been rotated since.  A signature matching
+        the cached secret is accepted until the secret expires from the
+        cache, even if the credential was deleted since.
+        """
+        secret, cached = self._get_secret(environ, access)
+        if secret and streq_const_time(_sign(secret, msg), signature):
+            return True
+        if not cached:
+            return False
+        secret, _ = self._get_secret(environ, access, refresh=True)
+        return bool(secret) and streq_const_time(_sign(secret, msg),
+                                                 signature)
+
     def __call__(self, environ, start_response):
         """Handle incoming request. authenticate and send downstream."""
         req = Request(environ)
@@ -162,20 +481,48 @@ class OssToken(object):
         if ':' in access:
             access, force_tenant = access.split(':')
 
+        # Reject at once an access key which keeps failing.
+        client = client_address(environ, self._trusted_proxies)
+        failure_key = 'oss2swift/auth-failure/%s' % md5(
+            '%s\n%s' % (access, client)).hexdigest()
+        failure = self._get_failure(environ, failure_key)
+        if is_damped(failure):
+            self._logger.debug('Access key %s rejected until %s', access,
+                               failure['until'])
+            self._metrics.increment('damped')
+            resp = self._reject(req, failure['reason'], signature)
+            return resp(environ, start_response)
+
         # Authenticate request.
-	msg = base64.urlsafe_b64decode(unquote(token))
-	key = self.passwd
-	s = base64.encodestring(hmac.new(key, msg, sha1).digest()).strip()
-	if s != signature:
-	    #resp = self._deny_request('Unauthorized')
-            #raise ServiceError(resp)
-	    auth='Swift realm="%s"' % signature
-	    return HTTPUnauthorized(request=req,
-                   headers={'Www-Authenticate': auth})
+        msg = base64.urlsafe_b64decode(unquote(token))
+        try:
+            if self._secret_cache_duration > 0:
+                valid = self._check_signature(environ, access, msg,
+                                              signature)
+            else:
+                valid = streq_const_time(_sign(self.passwd, msg), signature)
+        except ServiceError as e:
+            resp = e.args[0]
+            self._logger.debug('Could not check the signature: %s',
+                               resp.status_int)
+            return resp(environ, start_response)
+        if not valid:
+            self._record_failure(environ, failure_key, failure, access,
+                                 'SignatureDoesNotMatch')
+            resp = self._reject(req, 'SignatureDoesNotMatch', signature)
+            return resp(environ, start_response)
+        cache_key = self._token_cache_key(access, force_tenant)
+        cached = self._get_cached_token(environ, cache_key)
+        if cached:
+            self._logger.debug('Using the cached token of %s', access)
+            self._clear_failure(environ, failure_key, failure)
+            return self._connect(environ, start_response, req, account,
+                                 cached['token'], cached['tenant'])
+
         creds = {"auth":
 			{"passwordCredentials":
 				{"username": access, 
-				"password": key},
+				"password": self.passwd},
 				"tenantName": force_tenant}}
 		
         creds_json = json.dumps(creds)
@@ -195,6 +542,9 @@ class OssToken(object):
             resp = e.args[0]  # NB: swob.Response, not requests.Response
             msg = 'Received error, exiting middleware with error: %s'
             self._logger.debug(msg, resp.status_int)
+            if resp.status_int == 401:
+                self._record_failure(environ, failure_key, failure, access,
+                                     'AccessDenied')
             return resp(environ, start_response)
 
         self._logger.debug('Keystone Reply: Status: %d, Output: %s',
@@ -202,15 +552,27 @@ class OssToken(object):
 
         try:
             identity_info = resp.json()
-            token_id = str(identity_info['access']['token']['id'])
-            tenant = identity_info['access']['token']['tenant']
+            token = identity_info['access']['token']
+            token_id = str(token['id'])
+            tenant = token['tenant']
         except (ValueError, KeyError):
             error = 'Error on keystone reply: %d %s'
             self._logger.debug(error, resp.status_code, resp.content)
             return self._deny_request('InvalidURI')(environ, start_response)
 
-        req.headers['X-Auth-Token'] = token_id
-        tenant_to_connect =  tenant['id']
+        self._cache_token(environ, cache_key, token_id, tenant['id'],
+                          _token_expires(token))
+        self._clear_failure(environ, failure_key, failure)
+        return self._connect(environ, start_response, req, account,
+                             token_id, tenant['id'])
+
+    def _connect(self, environ, start_response, req, account, token_id,
+                 tenant_to_connect):
+        """
+        Sends the request downstream with the Keystone token, to the account
+        of the tenant.
+        """
+        req.headers['X-Auth-Token'] = str(token_id)
         if six.PY2 and isinstance(tenant_to_connect, six.text_type):
             tenant_to_connect = tenant_to_connect.encode('utf-8')
         self._logger.debug('Connecting with tenant: %s', tenant_to_connect)
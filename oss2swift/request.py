@@ -1,18 +1,22 @@
 import base64
 from email.header import Header
-from hashlib import sha256, md5
+from hashlib import sha256
 import os
 import re
 import string
 import sys
 from urllib import quote, unquote
 
-from oss2swift.acl_handlers import get_acl_handler
+from oss2swift.acl_handlers import get_acl_handler, invalidate_acl_cache
 from oss2swift.acl_utils import handle_acl_header
 from oss2swift.acl_utils import swift_acl_translate
+from oss2swift.cache import Cache, is_damped, record_failure
 from oss2swift.cfg import CONF
+from oss2swift.digest import DigestInput
+from oss2swift.single_flight import SingleFlight
 from oss2swift.controllers import ServiceController, BucketController, \
-    ObjectController, AclController, MultiObjectDeleteController, \
+    ObjectController, AclController, AppendController, \
+    MultiObjectDeleteController, \
     LocationController, LoggingStatusController, PartController, \
     UploadController, UploadsController, VersioningController, \
     UnsupportedController, OssAclController, CorsController, LifecycleController,WebsiteController, RefererController
@@ -26,9 +30,10 @@ from oss2swift.response import AccessDenied, InvalidArgument, InvalidDigest, \
     BadDigest, AuthorizationHeaderMalformed, AuthorizationQueryParametersError, MalformedACLError, \
     InvalidObjectName
 from oss2swift.subresource import decode_acl, encode_acl
-from oss2swift.utils import sysmeta_header, validate_bucket_name
+from oss2swift.utils import sysmeta_header, validate_bucket_name, \
+    is_multiupload_container
 from oss2swift.utils import utf8encode, LOGGER, check_path_header, OssTimestamp, \
-    mktime
+    mktime, client_address, keystone_expires, SWIFT_VERSION
 import six
 from swift.common import swob
 from swift.common.constraints import check_utf8
@@ -38,7 +43,7 @@ from swift.common.http import HTTP_OK, HTTP_CREATED, HTTP_ACCEPTED, \
     HTTP_PARTIAL_CONTENT, HTTP_NOT_MODIFIED, HTTP_PRECONDITION_FAILED, \
     HTTP_REQUESTED_RANGE_NOT_SATISFIABLE, HTTP_LENGTH_REQUIRED,HTTP_MOVED_PERMANENTLY, \
     HTTP_BAD_REQUEST, HTTP_REQUEST_TIMEOUT, is_success
-from swift.common.utils import split_path,json
+from swift.common.utils import split_path,json, list_from_csv
 from swift.proxy.controllers.base import get_container_info, \
     headers_to_container_info
 
@@ -46,8 +51,8 @@ from swift.proxy.controllers.base import get_container_info, \
 # List of sub-resources that must be maintained as part of the HMAC
 # signature string.
 ALLOWED_SUB_RESOURCES = sorted([
-    'acl', 'delete', 'lifecycle', 'location', 'logging', 'notification',
-    'partNumber', 'policy', 'requestPayment', 'torrent', 'uploads', 'uploadId',
+    'acl', 'append', 'delete', 'lifecycle', 'location', 'logging', 'notification',
+    'partNumber', 'policy', 'position', 'requestPayment', 'torrent', 'uploads', 'uploadId',
     'versionId', 'versioning', 'versions', 'website', 'objectMeta','referer',
     'response-cache-control', 'response-content-disposition',
     'response-content-encoding', 'response-content-language',
@@ -55,6 +60,34 @@ ALLOWED_SUB_RESOURCES = sorted([
 ])
 CAN_NOT_CAPTURE='cnc'
 MAX_ACL_BODY_SIZE = 200 * 1024
+# seconds a signed request is accepted for around its Date
+MAX_TIME_SKEW = 60 * 5
+
+# Identities authenticated by OssAclRequest.authenticate
+IDENTITY_CACHE = Cache('identity', 'identity_cache_ttl')
+# Identical HEADs and listings in flight in the worker, see _get_response
+SUBREQUESTS = SingleFlight('subrequest', 'coalesce_max_wait')
+# Headers besides the path and the query which change the response of a
+# HEAD or of a listing
+COALESCE_HEADERS = ('HTTP_ACCEPT', 'HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH',
+                    'HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_UNMODIFIED_SINCE',
+                    'HTTP_RANGE', 'HTTP_X_NEWEST')
+# Environment keys of a coalesced request which the requests sharing its
+# response take over: the account and container info cached by the proxy.
+# The rest, such as the identity set by the auth middleware, is not theirs.
+COALESCED_ENVIRON_PREFIXES = ('swift.account/', 'swift.container/',
+                              'swift.infocache')
+# 404s of the GETs and HEADs of buckets and objects, see
+# Request._get_response
+NOT_FOUND_CACHE = Cache('not_found', 'not_found_cache_ttl',
+                        'not_found_cache_size')
+# Presigned URLs verified by OssAclRequest.authenticate
+PRESIGNED_URL_CACHE = Cache('presigned_url', 'presigned_url_cache_ttl')
+# Swift stores the footers of an object PUT, from
+# swift.callback.update_footers, since 2.9.0
+PUT_FOOTERS_SUPPORTED = SWIFT_VERSION >= (2, 9, 0)
+# Access keys which failed to authenticate, see OssAclRequest.authenticate
+AUTH_FAILURE_CACHE = Cache('auth_failure', 'auth_failure_cache_ttl')
 MAX_32BIT_INT = 2147483647
 X_OSS_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
 X_OSS_DATE_FORMAT2 = '%Y%m%dT%H%M%SZ'
@@ -98,16 +131,22 @@ class Request(swob.Request):
         swob.Request.__init__(self, env)
         self.req = swob.Request(env)
         self._timestamp = None
-        self.access_key, signature = self._parse_auth_info()
+        self.access_key, self.signature = self._parse_auth_info()
         self.bucket_in_host = self._parse_host()
         self.container_name, self.object_name = self._parse_uri()
         self._validate_headers()
-        self.token = base64.urlsafe_b64encode(self._string_to_sign())
+        self.verified_url = self._verified_url()
+        if self.verified_url:
+            self.token = utf8encode(self.verified_url['signed_token'])
+        else:
+            self.token = base64.urlsafe_b64encode(self._string_to_sign())
         self.account = None
         self.user_id = None
         self.slo_enabled = slo_enabled
+        # containers known to exist, see _check_container_existence
+        self.existing_containers = set()
         self.headers['Authorization'] = 'OSS %s:%s' % (
-            self.access_key, signature)
+            self.access_key, self.signature)
         self.environ['swift.leave_relative_location'] = True
     @property
     def timestamp(self):
@@ -213,6 +252,20 @@ class Request(swob.Request):
             # oss2swift regard this as not oss request
             raise NotOssRequest()
 
+    def _verified_url(self):
+        """
+        Returns the identity which signed this presigned URL if it was
+        already verified, or None.  See OssAclRequest.
+        """
+        return None
+
+    def _forget_identity(self):
+        """
+        Forgets the identity this request was authenticated as, when Swift
+        no longer accepts its token.  See OssAclRequest.
+        """
+        pass
+
     def _validate_expire_param(self):
         """
         Validate Expires in query parameters
@@ -256,10 +309,19 @@ class Request(swob.Request):
 
         # If the standard date is too far ahead or behind, it is an
         # error
-        delta = 60 * 5
-        if abs(int(self.timestamp) - int(OssTimestamp.now())) > delta:
+        if abs(int(self.timestamp) - int(OssTimestamp.now())) > \
+                MAX_TIME_SKEW:
             raise RequestTimeTooSkewed()
 
+    def signature_expires(self):
+        """
+        Returns the time since the epoch at which the signature of this
+        request stops being accepted.
+        """
+        if self._is_query_auth:
+            return float(self.params['Expires'])
+        return int(self.timestamp) + MAX_TIME_SKEW
+
     def _validate_headers(self):
         if 'CONTENT_LENGTH' in self.environ:
             try:
@@ -345,22 +407,53 @@ class Request(swob.Request):
         if self.message_length() > max_length:
             raise MalformedXML()
 
+        if check_md5 and 'HTTP_CONTENT_MD5' not in self.environ:
+            raise InvalidRequest('Missing required header for this request: '
+                                 'Content-MD5')
+
         # Limit the read similar to how SLO handles manifests
-        body = self.body_file.read(max_length)
+        digest = DigestInput(self.body_file)
+        body = digest.read(max_length)
 
-        if check_md5:
-            self.check_md5(body)
+        if check_md5 and digest.md5 != self.headers['ETag']:
+            raise BadDigest(content_md5=self.environ['HTTP_CONTENT_MD5'])
 
         return body
 
-    def check_md5(self, body):
-        if 'HTTP_CONTENT_MD5' not in self.environ:
-            raise InvalidRequest('Missing required header for this request: '
-                                 'Content-MD5')
+    def digest_input(self, crc64_footer=False, crc64_start=0):
+        """
+        Wraps wsgi.input with a DigestInput checking the body against the
+        Content-MD5 and returns it.  With crc64_footer, the CRC64 of the body
+        is sent to Swift as object metadata in the footer of the PUT, once
+        the body has been read.  Swift before 2.9.0 ignores the footers, so
+        the body is then read first and its CRC64 sent as a header.
 
-        digest = md5(body).digest().encode('base64').strip()
-        if self.environ['HTTP_CONTENT_MD5'] != digest:
-            raise BadDigest(content_md5=self.environ['HTTP_CONTENT_MD5'])
+        :param crc64_start: the CRC64 of the data preceding the body
+        """
+        digest = DigestInput(self.environ['wsgi.input'], self.content_length,
+                             self.headers.get('ETag'))
+        digest.crc64 = crc64_start
+        self.environ['wsgi.input'] = digest
+
+        if crc64_footer and not PUT_FOOTERS_SUPPORTED:
+            try:
+                body = ''.join(iter(lambda: digest.read(65536), ''))
+            except Exception:
+                digest.check()
+                raise
+            self.environ['wsgi.input'] = six.BytesIO(body)
+            self.headers['X-Object-Meta-Hash-Crc64ecma'] = str(digest.crc64)
+        elif crc64_footer:
+            inner_callback = self.environ.get('swift.callback.update_footers')
+
+            def footers_callback(footers):
+                if inner_callback:
+                    inner_callback(footers)
+                footers['X-Object-Meta-Hash-Crc64ecma'] = str(digest.crc64)
+
+            self.environ['swift.callback.update_footers'] = footers_callback
+
+        return digest
 
     def _copy_source_headers(self):
         env = {}
@@ -474,6 +567,8 @@ class Request(swob.Request):
         #     return ObjectController
         if 'acl' in self.params:
             return AclController
+        if 'append' in self.params:
+            return AppendController
         if 'cors' in self.params:
             return CorsController
         if 'delete' in self.params:
@@ -680,10 +775,12 @@ class Request(swob.Request):
                     HTTP_REQUESTED_RANGE_NOT_SATISFIABLE: InvalidRange,
                 },
                 'PUT': {
+                    HTTP_NOT_FOUND: (NoSuchBucket, container),
                     HTTP_UNPROCESSABLE_ENTITY: InvalidDigest,
                     HTTP_REQUEST_ENTITY_TOO_LARGE: EntityTooLarge,
                     HTTP_LENGTH_REQUIRED: MissingContentLength,
                     HTTP_REQUEST_TIMEOUT: RequestTimeout,
+                    HTTP_PRECONDITION_FAILED: PreconditionFailed,
                 },
                 'POST': {
                     HTTP_NOT_FOUND: (NoSuchKey, obj),
@@ -696,11 +793,111 @@ class Request(swob.Request):
 
         return code_map[method]
 
+    def _check_container_existence(self, app, container):
+        """
+        HEADs the container once per request and raises NoSuchBucket if it
+        does not exist.
+        """
+        if container in self.existing_containers:
+            return
+        self._check_not_found('HEAD', container, '')
+        req = self.to_swift_req('HEAD', container, obj='')
+        # don't show log message of this request
+        req.environ['swift.proxy_access_log_made'] = True
+        resp = self._coalesced_response(
+            app, req, self._coalesce_key(req, 'HEAD', container, '', None,
+                                         None))
+        if resp.status_int == HTTP_NOT_FOUND or is_success(resp.status_int):
+            # reuse account, as _get_response does
+            _, account, _ = split_path(resp.environ['PATH_INFO'], 2, 3, True)
+            self.account = utf8encode(account)
+        if resp.status_int == HTTP_NOT_FOUND:
+            self._remember_not_found('HEAD', container, '')
+            raise NoSuchBucket(container)
+        if is_success(resp.status_int):
+            self.existing_containers.add(container)
+
+    def _not_found_cache_key(self, container, obj):
+        return '%s/%s/%s' % (self.account, container, obj or '')
+
+    def _check_not_found(self, method, container, obj):
+        """
+        Raises NoSuchBucket or NoSuchKey if a GET or a HEAD of the bucket or
+        of the object was answered 404 a moment ago.  Only authenticated
+        requests are answered from the cache.
+        """
+        if method not in ('GET', 'HEAD') or not container or \
+                not self.is_authenticated:
+            return
+        key = self._not_found_cache_key(container, obj)
+        if NOT_FOUND_CACHE.get(self.environ, key):
+            err_resp = self._swift_error_codes(
+                method, container, obj)[HTTP_NOT_FOUND]
+            raise err_resp[0](*err_resp[1:])
+
+    def _remember_not_found(self, method, container, obj):
+        if method not in ('GET', 'HEAD') or not container or \
+                not self.is_authenticated:
+            return
+        NOT_FOUND_CACHE.set(self.environ,
+                            self._not_found_cache_key(container, obj), True)
+
+    def _coalesce_key(self, sw_req, method, container, obj, headers, body):
+        """
+        Returns the key of a HEAD or a listing of a Swift request, which
+        identical concurrent requests may share the response of, or None.
+        """
+        if SUBREQUESTS.max_wait <= 0 or body is not None or not container:
+            return None
+        if method != 'HEAD' and not (method == 'GET' and not obj):
+            return None
+        env = sw_req.environ
+        if env.get('swift.authorize_override'):
+            # authenticated already, see OssAclRequest.to_swift_req
+            identity = None
+        else:
+            identity = [env.get('HTTP_X_AUTH_TOKEN'),
+                        env.get('HTTP_AUTHORIZATION')]
+        return json.dumps([method, env['PATH_INFO'], env['QUERY_STRING'],
+                           identity, sorted((headers or {}).items()),
+                           [env.get(key) for key in COALESCE_HEADERS]])
+
+    def _coalesced_response(self, app, sw_req, key):
+        """
+        Calls the application, or waits for the response of the identical
+        request in flight.
+
+        :param key: the key of the request, see _coalesce_key, or None to
+                    call the application anyway
+        """
+        if key is None:
+            return sw_req.get_response(app)
+
+        def call():
+            sw_resp = sw_req.get_response(app)
+            # read once for all the callers
+            return (sw_resp.status, sw_resp.headers.items(), sw_resp.body,
+                    sw_resp.environ)
+
+        status, headers, body, environ = SUBREQUESTS.do(key, call)
+        # what the pipeline learned: the account the auth middleware put in
+        # the path and the info of the account and of the container
+        sw_req.environ['PATH_INFO'] = environ['PATH_INFO']
+        for env_key, value in environ.items():
+            if env_key.startswith(COALESCED_ENVIRON_PREFIXES):
+                sw_req.environ.setdefault(env_key, value)
+        return swob.Response(status=status,
+                             headers=swob.HeaderKeyDict(headers), body=body,
+                             request=sw_req, conditional_response=True)
+
     def _get_response(self, app, method, container, obj,
                       headers=None, body=None, query=None):
         """
         Calls the application with this request's environment.  Returns a
         Response object that wraps up the application's result.
+
+        Identical concurrent HEADs and listings share one Swift request, see
+        SUBREQUESTS.
         """
 
         method = method or self.environ['REQUEST_METHOD']
@@ -710,24 +907,25 @@ class Request(swob.Request):
             obj = self.object_name
         if str(obj).startswith('/'):
             raise InvalidObjectName
-        
+        self._check_not_found(method, container, obj)
+
         sw_req = self.to_swift_req(method, container,obj, headers=headers,
                                     body=body, query=query)
         if container and obj:
-	       # before obj request container
-           req = self.to_swift_req(method, container,obj='', headers=headers,
-                                   body=body, query=query)
-           resp = req.get_response(app)
-    	   if resp.status_int==HTTP_NOT_FOUND:
-                raise NoSuchBucket(container)
-	   else:
-		sw_resp	=sw_req.get_response(app)
-	else:
- 	   sw_resp=sw_req.get_response(app)
-           # reuse account and tokens
+            # Swift answers 404 for a missing object and a missing container
+            # alike, so make sure the container exists first.
+            self._check_container_existence(app, container)
+        sw_resp = self._coalesced_response(
+            app, sw_req, self._coalesce_key(sw_req, method, container, obj,
+                                            headers, body))
+        # reuse account and tokens
         _, self.account, _ = split_path(sw_resp.environ['PATH_INFO'],
                                         2, 3, True)
         self.account = utf8encode(self.account)
+        if method in ('PUT', 'POST', 'DELETE') and container:
+            # the bucket or the object may exist now
+            NOT_FOUND_CACHE.delete(self.environ,
+                                   self._not_found_cache_key(container, obj))
 
         resp = Response.from_swift_resp(sw_resp)
         if 'X-Container-Read' in sw_resp.headers:
@@ -766,6 +964,8 @@ class Request(swob.Request):
                             return resp
         err_msg = resp.body
         if status in error_codes:
+            if status == HTTP_NOT_FOUND:
+                self._remember_not_found(method, container, obj)
             err_resp = \
                 error_codes[sw_resp.status_int]  # pylint: disable-msg=E1101
             if isinstance(err_resp, tuple):
@@ -775,6 +975,7 @@ class Request(swob.Request):
         if status == HTTP_BAD_REQUEST:
             raise BadSwiftRequest(err_msg)
         if status == HTTP_UNAUTHORIZED:
+            self._forget_identity()
             raise SignatureDoesNotMatch()
         if status == HTTP_FORBIDDEN:
             raise AccessDenied()
@@ -798,11 +999,16 @@ class Request(swob.Request):
         return self._get_response(app, method, container, obj,
                                   headers, body, query)
 
-    def get_validated_param(self, param, default, limit=MAX_32BIT_INT):
+    def get_validated_param(self, param, default, limit=MAX_32BIT_INT,
+                            strict=False):
+        """
+        Get an integer parameter clamped to limit.  Values below the default
+        fall back to it unless strict is set.
+        """
         value = default
         if param in self.params:
             try:
-                if value < int(self.params[param]):
+                if strict or value < int(self.params[param]):
                     value = int(self.params[param])
                 if value < 0:
                     err_msg = 'Argument %s must be an integer between 0 and' \
@@ -841,8 +1047,10 @@ class Request(swob.Request):
         else:
             # otherwise we do naive HEAD request with the authentication
             resp = self.get_response(app, 'HEAD', self.container_name, '')
-            return headers_to_container_info(
-                resp.sw_headers, resp.status_int)  # pylint: disable-msg=E1101
+            # pylint: disable-msg=E1101
+            headers = swob.HeaderKeyDict(resp.sw_headers)
+            headers.update(resp.sysmeta_headers)
+            return headers_to_container_info(headers, resp.status_int)
 
     def gen_multipart_manifest_delete_query(self, app):
         if not CONF.allow_multipart_uploads:
@@ -858,6 +1066,8 @@ class OssAclRequest(Request):
     """
     def __init__(self, env, app, slo_enabled=True):
         super(OssAclRequest, self).__init__(env, slo_enabled)
+        # the cache entries of the identity, see _forget_identity
+        self.identity_cache_keys = []
 	if app is not None:
 
            self.authenticate(app)
@@ -867,21 +1077,111 @@ class OssAclRequest(Request):
             return OssAclController
         return super(OssAclRequest, self).controller
 
+    def _identity_cache_key(self):
+        # The signature is a HMAC of the string to sign, so a request with
+        # the same access key, signature and string to sign was signed by
+        # the same user, who was already authenticated.
+        return sha256('\n'.join([self.access_key, self.signature,
+                                  self.token])).hexdigest()
+
+    def _presigned_url_cache_key(self):
+        # Everything the string to sign of a presigned URL is made of, the
+        # signature and the Expires being in the query string.
+        oss_headers = sorted((key.lower(), value)
+                             for key, value in self.headers.items()
+                             if key.lower().startswith('x-oss-'))
+        return sha256(json.dumps([
+            self.method, self.bucket_in_host,
+            self.environ.get('RAW_PATH_INFO', self.path), self.query_string,
+            self.headers.get('Content-MD5', ''),
+            self.headers.get('Content-Type') or '', oss_headers])).hexdigest()
+
+    def _verified_url(self):
+        if not self._is_query_auth:
+            return None
+        return PRESIGNED_URL_CACHE.get(self.environ,
+                                       self._presigned_url_cache_key())
+
+    def _forget_identity(self):
+        for cache, key in self.identity_cache_keys:
+            cache.delete(self.environ, key)
+
+    def _client_address(self):
+        return client_address(
+            self.environ, list_from_csv(CONF.auth_failure_trusted_proxies))
+
+    def _auth_failure_cache_key(self):
+        # Per client address, so that a client failing in a loop does not
+        # lock the other clients of the access key out.
+        return '%s\n%s' % (self.access_key, self._client_address())
+
+    def _record_auth_failure(self, key, failure, reason):
+        failure = record_failure(failure, reason, CONF.auth_failure_damping,
+                                 AUTH_FAILURE_CACHE.ttl)
+        AUTH_FAILURE_CACHE.set(self.environ, key, failure)
+        LOGGER.increment('auth_failure.%s' % reason)
+        LOGGER.info('Rejected access key %s from %s: %s (%d failures)',
+                    self.access_key, self._client_address(), reason,
+                    failure['failures'])
+
     def authenticate(self, app):
         """
         authenticate method will run pre-authenticate request and retrieve
         account information.
         Note that it currently supports only keystone and tempauth.
         (no support for the third party authentication middleware)
+
+        The identity is cached for identity_cache_ttl seconds, at most until
+        the signature expires, so a presigned URL or a retried request is
+        authenticated once.  A presigned URL is also remembered as verified
+        for presigned_url_cache_ttl seconds, at most until it expires, so
+        that its next requests neither compute the string to sign again nor
+        look the identity up by it.  With Keystone, neither is kept beyond
+        the expiry of the token, and both are forgotten when Swift rejects
+        the token, e.g. because it was revoked.
+
+        An access key which fails to authenticate from a client address is
+        rejected without the pre-authenticate request for a while, longer
+        after each consecutive failure.
         """
+        cache_key = self._identity_cache_key()
+        self.identity_cache_keys = [(IDENTITY_CACHE, cache_key)]
+        if self._is_query_auth:
+            url_key = self._presigned_url_cache_key()
+            self.identity_cache_keys.append((PRESIGNED_URL_CACHE, url_key))
+        identity = self.verified_url or \
+            IDENTITY_CACHE.get(self.environ, cache_key)
+        if identity:
+            self.account = utf8encode(identity['account'])
+            self.user_id = utf8encode(identity['user_id'])
+            if identity['token']:
+                # keystone, see below
+                self.token = utf8encode(identity['token'])
+                del self.headers['Authorization']
+            return
+
+        failure_key = self._auth_failure_cache_key()
+        failure = AUTH_FAILURE_CACHE.get(self.environ, failure_key)
+        if is_damped(failure):
+            LOGGER.increment('auth_failure.damped')
+            raise SignatureDoesNotMatch()
+
         sw_req = self.to_swift_req('TEST', None, None, body='')
         # don't show log message of this request
         sw_req.environ['swift.proxy_access_log_made'] = True
 
         sw_resp = sw_req.get_response(app)
+        signed_token = self.token
 
         if not sw_req.remote_user:
+            if sw_resp.status_int == HTTP_UNAUTHORIZED:
+                # not when the auth middleware could not tell, e.g. because
+                # Keystone is unavailable
+                self._record_auth_failure(failure_key, failure,
+                                          'SignatureDoesNotMatch')
             raise SignatureDoesNotMatch()
+        if failure:
+            AUTH_FAILURE_CACHE.delete(self.environ, failure_key)
 
         _, self.account, _ = split_path(sw_resp.environ['PATH_INFO'],
                                         2, 3, True)
@@ -896,9 +1196,23 @@ class OssAclRequest(Request):
             # Need to skip Oss authorization since authtoken middleware
             # overwrites account in PATH_INFO
             del self.headers['Authorization']
+            token = self.token
+            token_expires = keystone_expires(
+                sw_resp.environ.get('keystone.token_info', {}))
         else:
             # tempauth
             self.user_id = self.access_key
+            token = token_expires = None
+
+        identity = {'account': self.account, 'user_id': self.user_id,
+                    'token': token}
+        ttl = min(self.signature_expires(), token_expires or float('inf')) \
+            - float(OssTimestamp.now())
+        IDENTITY_CACHE.set(self.environ, cache_key, identity, ttl=ttl)
+        if self._is_query_auth:
+            PRESIGNED_URL_CACHE.set(self.environ, url_key,
+                                    dict(identity, signed_token=signed_token),
+                                    ttl=ttl)
 
     def to_swift_req(self, method, container, obj, query=None,
                      body=None, headers=None):
@@ -924,6 +1238,19 @@ class OssAclRequest(Request):
                 sw_req.headers[header] = acl
         return sw_req
 
+    def _get_response(self, app, method, container, obj,
+                      headers=None, body=None, query=None):
+        resp = super(OssAclRequest, self)._get_response(
+            app, method, container, obj, headers, body, query)
+        method = method or self.environ['REQUEST_METHOD']
+        container = self.container_name if container is None else container
+        obj = self.object_name if obj is None else obj
+        if method in ('PUT', 'POST', 'DELETE') and container and \
+                not is_multiupload_container(container):
+            # The ACL of the bucket or of the object may have changed.
+            invalidate_acl_cache(self, container, obj)
+        return resp
+
     def get_acl_response(self, app, method=None, container=None, obj=None,
                          headers=None, body=None, query=None):
         """
@@ -963,7 +1290,9 @@ class OssAclRequest(Request):
         # None (e.g. HEAD)
         if resp:
             return resp
-        return self.get_acl_response(app, method, container, obj,
+        resp = self.get_acl_response(app, method, container, obj,
                                      headers, body, query)
+        acl_handler.check_response(resp)
+        return resp
 
 
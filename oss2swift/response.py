@@ -3,7 +3,8 @@ from functools import partial
 import re
 import sys
 from oss2swift.etree import Element, SubElement, tostring
-from oss2swift.utils import snake_to_camel, sysmeta_prefix
+from oss2swift.utils import snake_to_camel, sysmeta_prefix, sysmeta_header, \
+    TRANSIENT_SYSMETA_PREFIX
 from swift.common import swob
 from swift.common.utils import config_true_value
 
@@ -72,7 +73,8 @@ class Response(ResponseBase, swob.Response):
         for key, val in self.headers.iteritems():
             _key = key.lower()
             if _key.startswith(sysmeta_prefix('object')) or \
-                    _key.startswith(sysmeta_prefix('container')):
+                    _key.startswith(sysmeta_prefix('container')) or \
+                    _key.startswith(TRANSIENT_SYSMETA_PREFIX):
                 sw_sysmeta_headers[key] = val
             else:
                 sw_headers[key] = val
@@ -82,7 +84,8 @@ class Response(ResponseBase, swob.Response):
             _key = key.lower()
 
             if _key.startswith('x-object-meta-'):
-                if any(_str in _key for _str in ('object-type', 'hash-crc64ecma')):
+                if any(_str in _key for _str in ('object-type', 'hash-crc64ecma',
+                                                 'next-append-position')):
                     headers['x-oss-' + _key[14:]] = val
                 else:
                     headers['x-oss-meta-' + _key[14:]] = val
@@ -98,6 +101,12 @@ class Response(ResponseBase, swob.Response):
                 # for delete slo
                 self.is_slo = config_true_value(val)
 
+        # the MD5 of the body of an object PUT as SLO segments, see
+        # ObjectController._put_segmented
+        etag = sw_sysmeta_headers.get(sysmeta_header('object', 'etag'))
+        if etag:
+            headers['etag'] = etag
+
         if headers['x-oss-meta-location'] is None:
             headers['x-oss-meta-location'] = ''
         self.headers = headers
@@ -590,6 +599,11 @@ class NotSuchBucketPolicy(ErrorResponse):
     _msg = 'The specified bucket does not have a bucket policy.'
 
 
+class ObjectNotAppendable(ErrorResponse):
+    _status = '409 Conflict'
+    _msg = 'The object is not appendable.'
+
+
 class OperationAborted(ErrorResponse):
     _status = '409 Conflict'
     _msg = 'A conflicting conditional operation is currently in progress ' \
@@ -603,6 +617,11 @@ class PermanentRedirect(ErrorResponse):
            'endpoint.'
 
 
+class PositionNotEqualToLength(ErrorResponse):
+    _status = '409 Conflict'
+    _msg = 'Position is not equal to file length.'
+
+
 class PreconditionFailed(ErrorResponse):
     _status = '412 Precondition Failed'
     _msg = 'At least one of the preconditions you specified did not hold.'
@@ -0,0 +1,91 @@
+"""
+Coalescing of identical concurrent calls.
+
+A SingleFlight runs one call per key at a time in the worker.  While the
+call of a key is in flight, the greenthreads calling with the same key wait
+for its result instead of making the same call again.  A greenthread waits
+at most the max wait read from CONF, then makes the call itself; 0 disables
+the coalescing.
+
+Each SingleFlight counts the calls it made and the calls it coalesced, and
+reports them as the oss2swift.<name>_flight.call and .coalesced StatsD
+metrics, with .timeout for the waits given up, when StatsD logging is
+configured.
+"""
+
+import sys
+
+from eventlet import Timeout
+from eventlet.event import Event
+
+from oss2swift.cfg import CONF
+from oss2swift.utils import LOGGER
+
+
+# sent to the waiters when the call in flight was killed
+_ABANDONED = object()
+
+
+class SingleFlight(object):
+    """
+    A set of calls in flight in the worker, by key.
+
+    :param name: name of the calls, used in the metrics
+    :param max_wait_option: name of the CONF option giving the maximum
+                            number of seconds to wait for a call in flight
+    """
+    def __init__(self, name, max_wait_option):
+        self.name = name
+        self.max_wait_option = max_wait_option
+        self._flights = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    @property
+    def max_wait(self):
+        return CONF[self.max_wait_option]
+
+    def __len__(self):
+        return len(self._flights)
+
+    def _call(self, func):
+        self.calls += 1
+        LOGGER.increment('%s_flight.call' % self.name)
+        return func()
+
+    def do(self, key, func):
+        """
+        Returns func(), or the result of the call of key already in flight.
+        The exception raised by a call is raised to all its callers.
+
+        The result is shared by all the callers, so they must not modify it.
+        """
+        if self.max_wait <= 0:
+            return self._call(func)
+
+        event = self._flights.get(key)
+        if event is not None:
+            with Timeout(self.max_wait, False):
+                result = event.wait()
+                if result is not _ABANDONED:
+                    self.coalesced += 1
+                    LOGGER.increment('%s_flight.coalesced' % self.name)
+                    return result
+                return self._call(func)
+            LOGGER.increment('%s_flight.timeout' % self.name)
+            return self._call(func)
+
+        event = self._flights[key] = Event()
+        try:
+            result = self._call(func)
+        except Exception:
+            event.send_exception(*sys.exc_info())
+            raise
+        else:
+            event.send(result)
+            return result
+        finally:
+            del self._flights[key]
+            if not event.ready():
+                # killed, e.g. by a timeout of its caller
+                event.send(_ABANDONED)
@@ -7,7 +7,7 @@ from oss2swift.etree import Element, SubElement
 from oss2swift.exception import InvalidSubresource
 from oss2swift.response import InvalidArgument, MalformedACLError, \
     OssNotImplemented, InvalidRequest, AccessDenied
-from oss2swift.utils import LOGGER, sysmeta_header
+from oss2swift.utils import LOGGER, sysmeta_header, transient_sysmeta_header
 from swift.common.utils import json
 
 
@@ -29,6 +29,9 @@ def decode_acl(resource, headers,owner):
     key = sysmeta_header(resource, 'acl')
     if key in headers:
         value = headers[key]
+    if resource == 'object':
+        # set by PUT Object acl, see OssAclController.PUT
+        value = headers.get(transient_sysmeta_header('acl')) or value
     if value == '':
       
         return ACL(Owner(None, None), [])
@@ -0,0 +1,92 @@
+# Copyright (c) 2014 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures the requests per second the osstoken middleware authenticates,
+with and without its token cache and with the secrets of the access keys,
+against a local Keystone stand-in.
+
+    python -m oss2swift.test.bench_oss_token [-n REQUESTS] [-d DELAY]
+"""
+
+import base64
+from hashlib import sha1
+import hmac
+from optparse import OptionParser
+import time
+
+from oss2swift.oss_token_middleware import OssToken
+from oss2swift.test.unit.helpers import FakeKeystone
+from swift.common.swob import Request, Response
+
+
+PASSWD = 'secret'
+
+
+def _app(env, start_response):
+    return Response()(env, start_response)
+
+
+def _signed_request(i):
+    string_to_sign = 'GET\n\n\n%d\n/bucket/object' % i
+    signature = base64.encodestring(
+        hmac.new(PASSWD, string_to_sign, sha1).digest()).strip()
+    req = Request.blank('/v1/AUTH_test/bucket/object')
+    req.headers['Authorization'] = 'OSS test:%s' % signature
+    req.headers['X-Auth-Token'] = base64.urlsafe_b64encode(string_to_sign)
+    return req
+
+
+def run(url, requests, conf):
+    """
+    Returns the requests per second authenticated by the middleware.
+    """
+    conf = dict(conf, auth_uri=url, passwd=PASSWD, admin_user='admin')
+    middleware = OssToken(_app, conf)
+    start = time.time()
+    for i in range(requests):
+        resp = _signed_request(i).get_response(middleware)
+        if resp.status_int != 200:
+            raise Exception('unexpected status %s' % resp.status)
+    return requests / (time.time() - start)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('-n', '--requests', type='int', default=1000,
+                      help='number of requests of each run')
+    parser.add_option('-d', '--delay', type='float', default=0.005,
+                      help='seconds Keystone takes to issue a token')
+    options, _ = parser.parse_args()
+
+    keystone = FakeKeystone(delay=options.delay)
+    keystone.credentials['test'] = PASSWD
+    url, server = keystone.serve()
+    try:
+        for name, conf in (
+                ('without cache', {'token_cache_time': '0'}),
+                ('with cache', {'token_cache_time': '300'}),
+                ('with secrets', {'token_cache_time': '300',
+                                  'secret_cache_duration': '300'})):
+            keystone.calls = keystone.credential_calls = 0
+            rate = run(url, options.requests, conf)
+            print('%-14s %8.1f req/s  %d Keystone requests' %
+                  (name, rate, keystone.calls + keystone.credential_calls))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -56,6 +56,12 @@ class Oss2swiftTestCase(unittest.TestCase):
 
         CONF.log_level = 'debug'
         CONF.storage_domain = 'localhost'
+        # the tests count the ACL checks and change the ACLs between requests
+        CONF.acl_cache_ttl = 0
+        CONF.identity_cache_ttl = 0
+        CONF.presigned_url_cache_ttl = 0
+        CONF.not_found_cache_ttl = 0
+        CONF.auth_failure_cache_ttl = 0
 
     def setUp(self):
         self.app = FakeApp()
@@ -15,8 +15,14 @@
 
 # This stuff can't live in test/unit/__init__.py due to its swob dependency.
 
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
 from copy import deepcopy
-from hashlib import md5
+from datetime import datetime
+from hashlib import md5, sha256
+import json
+import threading
+import time
 
 from oss2swift.cfg import CONF
 from swift.common import swob
@@ -34,6 +40,8 @@ class FakeSwift(object):
         self.req_method_paths = []
         self.swift_sources = []
         self.uploaded = {}
+        # mapping of path --> footers sent after the body of a PUT
+        self.footers = {}
         # mapping of (method, path) --> (response class, headers, body)
         self._responses = {}
 
@@ -109,17 +117,22 @@ class FakeSwift(object):
             etag = md5(input).hexdigest()
             headers.setdefault('Etag', etag)
             headers.setdefault('Content-Length', len(input))
+            if 'swift.callback.update_footers' in env:
+                footers = swob.HeaderKeyDict()
+                env['swift.callback.update_footers'](footers)
+                self.footers[path] = footers
 
             # keep it for subsequent GET requests later
             self.uploaded[path] = (deepcopy(headers), input)
             if "CONTENT_TYPE" in env:
                 self.uploaded[path][0]['Content-Type'] = env["CONTENT_TYPE"]
 
-        # range requests ought to work, but copies are special
+        # range requests ought to work, but copies are special, and the
+        # object server answers a conditional PUT itself
         support_range_and_conditional = not (
             method == 'PUT' and
-            'X-Copy-From' in req.headers and
-            'Range' in req.headers)
+            ('X-Copy-From' in req.headers and 'Range' in req.headers or
+             'If-None-Match' in req.headers))
         resp = resp_class(req=req, headers=headers, body=body,
                           conditional_response=support_range_and_conditional)
         return resp(env, start_response)
@@ -152,3 +165,95 @@ class FakeSwift(object):
 
         self._responses[(method, path)] = (response_class, headers, body)
 
+
+
+class FakeKeystone(object):
+    """
+    A stand-in for the token API of Keystone v2 and the credentials API of
+    Keystone v3 used by the osstoken middleware.  Every authentication
+    issues a new token valid for token_lifetime seconds, and credentials
+    holds the secrets of the EC2 credentials by access key.  Use it as a
+    requests_mock callback, or run it as a local HTTP server with serve().
+    """
+
+    def __init__(self, token_lifetime=3600, delay=0):
+        self.token_lifetime = token_lifetime
+        # seconds an authentication takes
+        self.delay = delay
+        self.calls = 0
+        self.credentials = {}
+        self.credential_calls = 0
+
+    def authenticate(self, creds):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        expires = datetime.utcfromtimestamp(time.time() + self.token_lifetime)
+        tenant = creds['auth'].get('tenantName') or 'TENANT_ID'
+        return {'access': {
+            'token': {'id': 'TOKEN_%d' % self.calls,
+                      'expires': expires.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                      'tenant': {'id': tenant, 'name': tenant}},
+            'user': {'name': creds['auth']['passwordCredentials']['username']},
+        }}
+
+    def credential(self, path):
+        """
+        Returns the status and the body of a GET of a credential.
+        """
+        self.credential_calls += 1
+        for access, secret in self.credentials.items():
+            credential_id = sha256(access).hexdigest()
+            if path.endswith('/v3/credentials/%s' % credential_id):
+                blob = json.dumps({'access': access, 'secret': secret})
+                return 200, {'credential': {'id': credential_id,
+                                            'type': 'ec2', 'blob': blob}}
+        return 404, {'error': {'code': 404, 'title': 'Not Found'}}
+
+    def __call__(self, request, context):
+        if request.method == 'GET':
+            context.status_code, body = self.credential(request.path)
+            return body
+        context.status_code = 200
+        return self.authenticate(request.json())
+
+    def serve(self):
+        """
+        Serves the Keystone APIs on localhost in a thread.  Returns the URL of
+        the server and the server, to shut it down.
+        """
+        keystone = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, and a reply sent at once rather than waiting
+            # for delayed ACKs between its writes
+            protocol_version = 'HTTP/1.1'
+            wbufsize = -1
+
+            def _reply(self, status, body):
+                body = json.dumps(body)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._reply(*keystone.credential(self.path))
+
+            def do_POST(self):
+                length = int(self.headers['Content-Length'])
+                creds = json.loads(self.rfile.read(length))
+                self._reply(200, keystone.authenticate(creds))
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        server = Server(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return 'http://127.0.0.1:%d' % server.server_port, server
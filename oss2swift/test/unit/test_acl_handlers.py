@@ -15,9 +15,57 @@
 
 import unittest
 
+from mock import patch, MagicMock
+
 from oss2swift.acl_handlers import OssAclHandler, BucketAclHandler, \
     ObjectAclHandler, BaseAclHandler, PartAclHandler, UploadAclHandler, \
-    UploadsAclHandler, get_acl_handler
+    UploadsAclHandler, MultiObjectDeleteAclHandler, MultiUploadAclHandler, \
+    get_acl_handler, ACL_CACHE, ACL_MAP, invalidate_acl_cache
+from oss2swift.controllers import BucketController, ObjectController, \
+    OssAclController, MultiObjectDeleteController, PartController, \
+    UploadsController, UploadController
+from oss2swift.response import AccessDenied
+from oss2swift.request import _header_acl_property
+from oss2swift.subresource import ACL, Owner
+
+
+class FakeResponse(object):
+    def __init__(self):
+        owner = Owner('test:tester', 'test:tester')
+        self.headers = {}
+        self.sysmeta_headers = {}
+        self.bucket_acl = ACL(owner, 'private')
+        self.object_acl = ACL(owner, 'private')
+
+
+class FakeRequest(object):
+    """
+    Records the methods of the Swift requests issued by an ACL handler.
+    """
+    bucket_acl = _header_acl_property('container')
+    object_acl = _header_acl_property('object')
+
+    def __init__(self, method, obj):
+        self.environ = {'REQUEST_METHOD': method}
+        self.account = 'AUTH_test'
+        self.container_name = 'bucket'
+        self.object_name = obj
+        self.is_bucket_request = not obj
+        self.is_object_request = bool(obj)
+        self.user_id = 'test:tester'
+        self.headers = {}
+        self.params = {'uploadId': 'X'}
+        self.methods = []
+
+    def get_acl_response(self, app, method=None, container=None, obj=None,
+                         headers=None, body=None, query=None):
+        self.methods.append(method or self.environ['REQUEST_METHOD'])
+        return FakeResponse()
+
+    _get_response = get_acl_response
+
+    def xml(self, max_length):
+        return ''
 
 
 class TestAclHandlers(unittest.TestCase):
@@ -37,6 +85,86 @@ class TestAclHandlers(unittest.TestCase):
         # we have already have tests for oss_acl checking at test_oss_acl.py
         pass
 
+    @patch('oss2swift.cfg.CONF.acl_cache_ttl', 0)
+    @patch('oss2swift.acl_handlers.get_acl',
+           lambda *args: ACL(Owner('test:tester', 'test:tester'), 'private'))
+    def test_acl_handlers_never_get(self):
+        # The ACLs are in the metadata, so a GET would only read an object
+        # body or a bucket listing for nothing.
+        controllers = (BucketController, ObjectController, OssAclController,
+                       MultiObjectDeleteController, PartController,
+                       UploadsController, UploadController)
+        handlers = [(BaseAclHandler, None)] + \
+            [(get_acl_handler(c.__name__[:-len('Controller')]), c)
+             for c in controllers]
+        checked = 0
+        for handler, controller in handlers:
+            for method, sw_method, resource in ACL_MAP:
+                if controller is not None and not hasattr(controller, method):
+                    # not a request the controller serves
+                    continue
+                if issubclass(handler, MultiUploadAclHandler) and \
+                        not hasattr(handler, sw_method):
+                    # not checked at all
+                    continue
+                if (handler, method, sw_method) == \
+                        (ObjectAclHandler, 'DELETE', 'HEAD'):
+                    # DELETE Object doesn't check the object permission
+                    continue
+                obj = 'object' if resource == 'object' else ''
+                req = FakeRequest(method, obj)
+                handler(req, None, None, None).handle_acl(None, sw_method)
+                case = (handler.__name__, method, sw_method, resource)
+                self.assertTrue(req.methods, case)
+                self.assertNotIn('GET', req.methods, case)
+                checked += 1
+        self.assertTrue(checked > len(ACL_MAP))
+
+    @patch('oss2swift.cfg.CONF.acl_cache_ttl', 10)
+    def test_acl_cache(self):
+        ACL_CACHE.local.clear()
+
+        def check(method):
+            req = FakeRequest(method, 'object')
+            ObjectAclHandler(req, None, None, None).handle_acl(None, method)
+            return req.methods
+
+        self.assertEqual(check('GET'), ['HEAD'])
+        self.assertEqual(check('GET'), [])
+        # HEAD Object needs the response of the HEAD
+        self.assertEqual(check('HEAD'), ['HEAD'])
+
+        invalidate_acl_cache(FakeRequest('PUT', 'object'), 'bucket', 'object')
+        self.assertEqual(check('GET'), ['HEAD'])
+        self.assertEqual(check('GET'), [])
+
+    @patch('oss2swift.cfg.CONF.oss_acl', True)
+    @patch('oss2swift.cfg.CONF.acl_cache_ttl', 0)
+    def test_inline_object_acl_check(self):
+        for method in ('GET', 'HEAD'):
+            req = FakeRequest(method, 'object')
+            handler = ObjectAclHandler(req, None, None, None)
+            with patch('oss2swift.cfg.CONF.inline_object_acl_check', True):
+                handler.handle_acl(None, 'GET')
+            # no HEAD before the GET
+            self.assertEqual(req.methods, [])
+
+            resp = FakeResponse()
+            handler.check_response(resp)
+
+            resp.object_acl = ACL(Owner('other', 'other'), 'private')
+            resp.app_iter = MagicMock()
+            self.assertRaises(AccessDenied, handler.check_response, resp)
+            resp.app_iter.close.assert_called_once_with()
+
+    @patch('oss2swift.cfg.CONF.acl_cache_ttl', 0)
+    def test_inline_object_acl_check_disabled(self):
+        req = FakeRequest('GET', 'object')
+        handler = ObjectAclHandler(req, None, None, None)
+        handler.handle_acl(None, 'GET')
+        self.assertEqual(req.methods, ['HEAD'])
+        self.assertIsNone(handler.response_permission)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,311 @@
+# Copyright (c) 2014 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mock import patch
+
+from oss2swift.controllers import multi_upload
+from oss2swift.digest import crc64
+from oss2swift.test.unit import Oss2swiftTestCase
+from swift.common import swob
+from swift.common.swob import Request
+from swift.common.utils import json
+
+
+class TestOss2swiftAppend(Oss2swiftTestCase):
+
+    def setUp(self):
+        super(TestOss2swiftAppend, self).setUp()
+        multi_upload.CONTAINER_CACHE.local.clear()
+        self.segments = '/v1/AUTH_test/bucket+segments'
+        # looked at by the container info of the bucket
+        self.swift.register('HEAD', '/v1/AUTH_test', swob.HTTPNoContent, {},
+                            None)
+        self.swift.register('HEAD', self.segments, swob.HTTPNoContent, {},
+                            None)
+        self.swift.register('PUT', self.segments, swob.HTTPAccepted, {},
+                            None)
+        self.swift.register('PUT', self.segments + '/object/X/%020d' % 0,
+                            swob.HTTPCreated, {}, None)
+        self.swift.register('PUT', self.segments + '/object/X/%020d' % 5,
+                            swob.HTTPCreated, {}, None)
+        self.swift.register('POST', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPAccepted, {}, None)
+
+    def _append(self, position, body):
+        req = Request.blank('/bucket/object?append&position=%s' % position,
+                            environ={'REQUEST_METHOD': 'POST'},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()},
+                            body=body)
+        return self.call_oss2swift(req)
+
+    def _register_appendable_bucket(self):
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket',
+                            swob.HTTPNoContent,
+                            {'x-container-sysmeta-oss2swift-appendable':
+                             'true'}, None)
+
+    def _register_segments(self):
+        segment = 'object/X/%020d' % 0
+        listing = self.segments + '?format=json&prefix=object/X/'
+        self.swift.register('GET', listing, swob.HTTPOk, {},
+                            json.dumps([{'name': segment}]))
+        self.swift.register('GET', self.segments +
+                            '?format=json&marker=%s&prefix=object/X/' %
+                            segment, swob.HTTPOk, {}, json.dumps([]))
+        self.swift.register('DELETE', self.segments + '/' + segment,
+                            swob.HTTPNoContent, {}, None)
+
+    def _register_appendable(self, length, crc, object_type='Appendable'):
+        self.swift.register(
+            'HEAD', '/v1/AUTH_test/bucket/object', swob.HTTPOk,
+            {'x-object-meta-object-type': object_type,
+             'x-object-meta-next-append-position': str(length),
+             'x-object-meta-hash-crc64ecma': str(crc),
+             'x-object-meta-foo': 'bar',
+             'x-object-sysmeta-oss2swift-append-prefix': 'object/X'},
+            None)
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.controllers.append.unique_id', lambda: 'X')
+    def test_append_new_object(self):
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPNotFound, {}, None)
+        status, headers, body = self._append(0, 'hello')
+        self.assertEqual(status.split()[0], '200')
+        self.assertEqual(headers['x-oss-next-append-position'], '5')
+        self.assertEqual(headers['x-oss-hash-crc64ecma'],
+                         str(crc64('hello')))
+
+        segment = self.segments + '/object/X/%020d' % 0
+        self.assertEqual(self.swift.uploaded[segment][1], 'hello')
+        method, path, req_headers = self.swift.calls_with_headers[-1]
+        self.assertEqual((method, path),
+                         ('PUT', '/v1/AUTH_test/bucket/object'))
+        self.assertEqual(req_headers['X-Object-Manifest'],
+                         'bucket%2Bsegments/object/X/')
+        self.assertEqual(req_headers['X-Object-Meta-Object-Type'],
+                         'Appendable')
+        self.assertEqual(req_headers['X-Object-Meta-Next-Append-Position'],
+                         '5')
+        self.assertEqual(
+            req_headers['X-Object-Sysmeta-Oss2swift-Append-Prefix'],
+            'object/X')
+        self.assertEqual(req_headers['If-None-Match'], '*')
+        # the segment is not written over either
+        _, _, req_headers = self.swift.calls_with_headers[-2]
+        self.assertEqual(req_headers['If-None-Match'], '*')
+        # the bucket is flagged before the segment is written
+        method, path, req_headers = self.swift.calls_with_headers[-3]
+        self.assertEqual((method, path), ('POST', '/v1/AUTH_test/bucket'))
+        self.assertEqual(
+            req_headers['X-Container-Sysmeta-Oss2swift-Appendable'], 'true')
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.controllers.append.unique_id', lambda: 'X')
+    def test_append_new_object_flagged_bucket(self):
+        self._register_appendable_bucket()
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPNotFound, {}, None)
+        status, headers, body = self._append(0, 'hello')
+        self.assertEqual(status.split()[0], '200')
+        self.assertNotIn(('POST', '/v1/AUTH_test/bucket'), self.swift.calls)
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.controllers.append.unique_id', lambda: 'X')
+    def test_append_new_object_race(self):
+        # another append at position 0 created the object first
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPNotFound, {}, None)
+        self.swift.register('PUT', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPPreconditionFailed, {}, None)
+        self._register_segments()
+        status, headers, body = self._append(0, 'hello')
+        self.assertEqual(self._get_error_code(body),
+                         'PositionNotEqualToLength')
+        # our segment is not left behind
+        self.assertIn(
+            ('DELETE', self.segments + '/object/X/%020d' % 0),
+            self.swift.calls)
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_append_existing_object(self):
+        self._register_appendable(5, crc64('hello'))
+        status, headers, body = self._append(5, 'world')
+        self.assertEqual(status.split()[0], '200')
+        self.assertEqual(headers['x-oss-next-append-position'], '10')
+        # the CRC64 covers the whole object
+        self.assertEqual(headers['x-oss-hash-crc64ecma'],
+                         str(crc64('helloworld')))
+
+        segment = self.segments + '/object/X/%020d' % 5
+        self.assertEqual(self.swift.uploaded[segment][1], 'world')
+        # only the manifest is looked at, not the segments listing
+        self.assertNotIn(('GET', self.segments), self.swift.calls)
+        method, path, req_headers = self.swift.calls_with_headers[-1]
+        self.assertEqual((method, path),
+                         ('POST', '/v1/AUTH_test/bucket/object'))
+        self.assertEqual(req_headers['X-Object-Manifest'],
+                         'bucket%2Bsegments/object/X/')
+        self.assertEqual(req_headers['X-Object-Meta-Next-Append-Position'],
+                         '10')
+        self.assertEqual(req_headers['X-Object-Meta-Foo'], 'bar')
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_append_position_not_equal_to_length(self):
+        self._register_appendable(5, crc64('hello'))
+        status, headers, body = self._append(3, 'world')
+        self.assertEqual(self._get_error_code(body),
+                         'PositionNotEqualToLength')
+        self.assertEqual(headers['x-oss-next-append-position'], '5')
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_append_position_race(self):
+        # another append at position 5 wrote its segment first, and has not
+        # updated the manifest yet or failed to
+        self._register_appendable(5, crc64('hello'))
+        segment = self.segments + '/object/X/%020d' % 5
+        self.swift.register('PUT', segment, swob.HTTPPreconditionFailed, {},
+                            None)
+        self.swift.register('HEAD', segment, swob.HTTPOk,
+                            {'content-length': '3',
+                             'x-object-meta-hash-crc64ecma':
+                             str(crc64('hellofoo'))}, None)
+        status, headers, body = self._append(5, 'world')
+        self.assertEqual(self._get_error_code(body),
+                         'PositionNotEqualToLength')
+        self.assertEqual(headers['x-oss-next-append-position'], '8')
+        # the manifest is rolled forward over the segment
+        method, path, req_headers = self.swift.calls_with_headers[-1]
+        self.assertEqual((method, path),
+                         ('POST', '/v1/AUTH_test/bucket/object'))
+        self.assertEqual(req_headers['X-Object-Meta-Next-Append-Position'],
+                         '8')
+        self.assertEqual(req_headers['X-Object-Meta-Hash-Crc64ecma'],
+                         str(crc64('hellofoo')))
+        self.assertEqual(req_headers['X-Object-Meta-Foo'], 'bar')
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_append_position_race_segment_deleted(self):
+        self._register_appendable(5, crc64('hello'))
+        segment = self.segments + '/object/X/%020d' % 5
+        self.swift.register('PUT', segment, swob.HTTPPreconditionFailed, {},
+                            None)
+        self.swift.register('HEAD', segment, swob.HTTPNotFound, {}, None)
+        status, headers, body = self._append(5, 'world')
+        self.assertEqual(self._get_error_code(body),
+                         'PositionNotEqualToLength')
+        self.assertEqual(headers['x-oss-next-append-position'], '5')
+        self.assertNotIn(('POST', '/v1/AUTH_test/bucket/object'),
+                         self.swift.calls)
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_append_manifest_error_deletes_segment(self):
+        self._register_appendable(5, crc64('hello'))
+        segment = self.segments + '/object/X/%020d' % 5
+        self.swift.register('POST', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPServiceUnavailable, {}, None)
+        self.swift.register('DELETE', segment, swob.HTTPNoContent, {}, None)
+        status, headers, body = self._append(5, 'world')
+        self.assertEqual(status.split()[0], '500')
+        self.assertEqual(self.swift.calls[-1], ('DELETE', segment))
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_append_segment_crc64(self):
+        self._register_appendable(5, crc64('hello'))
+        segment = self.segments + '/object/X/%020d' % 5
+        with patch('oss2swift.request.PUT_FOOTERS_SUPPORTED', True):
+            status, headers, body = self._append(5, 'world')
+        self.assertEqual(status.split()[0], '200')
+        self.assertEqual(
+            self.swift.footers[segment]['X-Object-Meta-Hash-Crc64ecma'],
+            str(crc64('helloworld')))
+
+        with patch('oss2swift.request.PUT_FOOTERS_SUPPORTED', False):
+            status, headers, body = self._append(5, 'world')
+        self.assertEqual(status.split()[0], '200')
+        req_headers = [h for m, p, h in self.swift.calls_with_headers
+                       if (m, p) == ('PUT', segment)][-1]
+        self.assertEqual(req_headers['X-Object-Meta-Hash-Crc64ecma'],
+                         str(crc64('helloworld')))
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_delete_appendable_object(self):
+        self._register_appendable_bucket()
+        self._register_appendable(5, crc64('hello'))
+        self._register_segments()
+        req = Request.blank('/bucket/object',
+                            environ={'REQUEST_METHOD': 'DELETE'},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()})
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '204')
+        calls = self.swift.calls
+        segment = ('DELETE', self.segments + '/object/X/%020d' % 0)
+        # the segments are deleted after the object
+        self.assertLess(calls.index(('DELETE', '/v1/AUTH_test/bucket/object')),
+                        calls.index(segment))
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_put_over_appendable_object(self):
+        self._register_appendable_bucket()
+        self._register_appendable(5, crc64('hello'))
+        self._register_segments()
+        req = Request.blank('/bucket/object',
+                            environ={'REQUEST_METHOD': 'PUT'},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()},
+                            body='world')
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+        calls = self.swift.calls
+        segment = ('DELETE', self.segments + '/object/X/%020d' % 0)
+        # the segments are deleted after the object
+        self.assertLess(calls.index(('PUT', '/v1/AUTH_test/bucket/object')),
+                        calls.index(segment))
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_put_in_bucket_without_appendable_objects(self):
+        req = Request.blank('/bucket/object',
+                            environ={'REQUEST_METHOD': 'PUT'},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()},
+                            body='world')
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+        # only the flagged buckets are looked at
+        self.assertNotIn(('HEAD', '/v1/AUTH_test/bucket/object'),
+                         self.swift.calls)
+        self.assertNotIn(('HEAD', '/v1/AUTH_test/bucket/object'
+                                  '?multipart-manifest=get'),
+                         self.swift.calls)
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_append_not_appendable(self):
+        self._register_appendable(5, crc64('hello'), object_type='Normal')
+        status, headers, body = self._append(5, 'world')
+        self.assertEqual(self._get_error_code(body), 'ObjectNotAppendable')
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_append_invalid_position(self):
+        for position in ('', '-1', 'x'):
+            status, headers, body = self._append(position, 'world')
+            self.assertEqual(self._get_error_code(body), 'InvalidArgument')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -83,6 +83,104 @@ class TestOss2swiftBucket(Oss2swiftTestCase):
         status, headers, body = self.call_oss2swift(req)
         self.assertEqual(status.split()[0], '200')
 
+    def test_bucket_configuration_without_listing(self):
+        # The bucket configurations are in the container metadata, so
+        # neither reading nor changing them may list the container.
+        rule = str({'ruleId': 'rule', 'rulePrefix': 'logs/',
+                    'ruleStatus': 'Enabled', 'expireDay': '1',
+                    'createDate': '', 'abortDay': ''})
+        self.swift.register(
+            'HEAD', '/v1/AUTH_test/junk', swob.HTTPNoContent,
+            {'x-container-read': '.r:*',
+             'x-container-meta-access-control-allow-origin':
+                 'http://example.com',
+             'x-container-meta-access-control-allow-methods': 'GET',
+             'x-container-meta-access-control-allow-headers': 'x-oss-date',
+             'x-container-meta-access-control-expose-headers': 'etag',
+             'x-container-meta-access-control-max-age': '100',
+             'x-container-meta-rules': 'rule:logs/',
+             'x-container-meta-rule': rule}, None)
+        self.swift.register('POST', '/v1/AUTH_test/junk', swob.HTTPNoContent,
+                            {}, None)
+        self.swift.register('PUT', '/v1/AUTH_test/junk', swob.HTTPAccepted,
+                            {}, '')
+
+        def call(method, query, body=None):
+            req = Request.blank(
+                '/junk?' + query, environ={'REQUEST_METHOD': method},
+                headers={'Authorization': 'OSS test:tester:hmac',
+                         'Date': self.get_date_header()},
+                body=body)
+            return self.call_oss2swift(req)
+
+        status, headers, body = call('HEAD', '')
+        self.assertEqual(status.split()[0], '200')
+        self.assertEqual(body, '')
+
+        status, headers, body = call('GET', 'cors')
+        self.assertEqual(status.split()[0], '200')
+        elem = fromstring(body, 'CORSConfiguration')
+        self.assertEqual(elem.find('./CORSRule/AllowedOrigin').text,
+                         'http://example.com')
+        self.assertEqual(elem.find('./CORSRule/AllowedMethod').text, 'GET')
+        self.assertEqual(elem.find('./CORSRule/AllowedHeader').text,
+                         'x-oss-date')
+        self.assertEqual(elem.find('./CORSRule/ExposeHeader').text, 'etag')
+        self.assertEqual(elem.find('./CORSRule/MaxAgeSeconds').text, '100')
+
+        status, headers, body = call('GET', 'referer')
+        self.assertEqual(status.split()[0], '200')
+        elem = fromstring(body, 'RefererConfiguration')
+        self.assertEqual(elem.find('./AllowEmptyReferer').text, 'true')
+        self.assertEqual(elem.find('./RefererList/Referer').text, '*')
+
+        # junk has no website configuration
+        status, headers, body = call('GET', 'website')
+        self.assertEqual(status.split()[0], '404')
+        self.assertEqual(self._get_error_code(body),
+                         'NoSuchWebsiteConfiguration')
+
+        status, headers, body = call('GET', 'lifecycle')
+        self.assertEqual(status.split()[0], '200')
+        elem = fromstring(body, 'LifecycleConfiguration')
+        self.assertEqual(elem.find('./Rule/ID').text, 'rule')
+        self.assertEqual(elem.find('./Rule/Prefix').text, 'logs/')
+        self.assertEqual(elem.find('./Rule/Status').text, 'Enabled')
+        self.assertEqual(elem.find('./Rule/Expiration/Days').text, '1')
+
+        cors = '<CORSConfiguration><CORSRule>' \
+            '<AllowedOrigin>*</AllowedOrigin>' \
+            '<AllowedMethod>GET</AllowedMethod>' \
+            '<MaxAgeSeconds>100</MaxAgeSeconds>' \
+            '</CORSRule></CORSConfiguration>'
+        referer = '<RefererConfiguration>' \
+            '<AllowEmptyReferer>true</AllowEmptyReferer>' \
+            '<RefererList><Referer>http://example.com</Referer>' \
+            '</RefererList></RefererConfiguration>'
+        website = '<WebsiteConfiguration>' \
+            '<IndexDocument><Suffix>index.html</Suffix></IndexDocument>' \
+            '<ErrorDocument><Key>error.html</Key></ErrorDocument>' \
+            '</WebsiteConfiguration>'
+        lifecycle = '<LifecycleConfiguration><Rule><ID>other</ID>' \
+            '<Prefix>tmp/</Prefix><Status>Enabled</Status>' \
+            '<Expiration><Days>1</Days></Expiration></Rule>' \
+            '</LifecycleConfiguration>'
+        for method, query, body, expected in (
+                ('PUT', 'cors', cors, '200'),
+                ('DELETE', 'cors', None, '204'),
+                ('PUT', 'referer', referer, '200'),
+                ('PUT', 'website', website, '200'),
+                ('DELETE', 'website', None, '204'),
+                ('PUT', 'lifecycle', lifecycle, '204'),
+                ('DELETE', 'lifecycle', None, '204')):
+            status, headers, body = call(method, query, body)
+            self.assertEqual(status.split()[0], expected, (method, query))
+            self.assertEqual(body, '', (method, query))
+
+        self.assertEqual(
+            [path for method, path in self.swift.calls if method == 'GET'],
+            [])
+
     def test_bucket_HEAD_error(self):
         req = Request.blank('/nojunk',
                             environ={'REQUEST_METHOD': 'HEAD'},
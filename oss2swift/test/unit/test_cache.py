@@ -0,0 +1,131 @@
+# Copyright (c) 2014 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mock import patch
+
+from oss2swift.cache import Cache, LRUCache, is_damped, record_failure
+
+
+class FakeMemcache(object):
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, time=0):
+        self.store[key] = value
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = LRUCache(2)
+        cache.set('a', 1, 10)
+        cache.set('b', 2, 10)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3, 10)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_expiry(self):
+        cache = LRUCache(2)
+        with patch('oss2swift.cache.time', return_value=100):
+            cache.set('a', 1, 10)
+        with patch('oss2swift.cache.time', return_value=109):
+            self.assertEqual(cache.get('a'), 1)
+        with patch('oss2swift.cache.time', return_value=110):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = Cache('test', 'upload_cache_ttl')
+
+    def test_local(self):
+        self.cache.set({}, 'key', {'a': 1})
+        self.assertEqual(self.cache.get({}, 'key'), {'a': 1})
+        self.cache.delete({}, 'key')
+        self.assertIsNone(self.cache.get({}, 'key'))
+
+    def test_memcache(self):
+        memcache = FakeMemcache()
+        env = {'swift.cache': memcache}
+        self.cache.set(env, 'key with spaces', {'a': 1})
+        self.assertEqual(len(self.cache.local), 0)
+        key, = memcache.store.keys()
+        self.assertTrue(key.startswith('oss2swift/test/'))
+        self.assertNotIn(' ', key)
+        self.assertEqual(self.cache.get(env, 'key with spaces'), {'a': 1})
+        self.cache.delete(env, 'key with spaces')
+        self.assertEqual(memcache.store, {})
+
+    def test_entry_ttl(self):
+        with patch('oss2swift.cache.time', return_value=100):
+            self.cache.set({}, 'key', 1, ttl=5.5)
+            self.cache.set({}, 'expired', 1, ttl=-1)
+            self.assertIsNone(self.cache.get({}, 'expired'))
+        with patch('oss2swift.cache.time', return_value=104):
+            self.assertEqual(self.cache.get({}, 'key'), 1)
+        with patch('oss2swift.cache.time', return_value=105):
+            self.assertIsNone(self.cache.get({}, 'key'))
+
+    def test_counters(self):
+        self.cache.set({}, 'key', {})
+        self.assertEqual(self.cache.get({}, 'key'), {})
+        self.assertIsNone(self.cache.get({}, 'other'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_shared_only(self):
+        cache = Cache('test', 'upload_cache_ttl', shared_only=True)
+        cache.set({}, 'key', 1)
+        self.assertIsNone(cache.get({}, 'key'))
+        self.assertEqual(len(cache.local), 0)
+        env = {'swift.cache': FakeMemcache()}
+        cache.set(env, 'key', 1)
+        self.assertEqual(cache.get(env, 'key'), 1)
+
+    @patch('oss2swift.cfg.CONF.upload_cache_ttl', 0)
+    def test_disabled(self):
+        self.cache.set({}, 'key', 1)
+        self.assertIsNone(self.cache.get({}, 'key'))
+        self.assertEqual(len(self.cache.local), 0)
+
+
+class TestNegativeCache(unittest.TestCase):
+    def test_record_failure(self):
+        with patch('oss2swift.cache.time', return_value=100):
+            failure = record_failure(None, 'AccessDenied', 1, 5)
+            self.assertEqual(failure, {'reason': 'AccessDenied',
+                                       'failures': 1, 'until': 101})
+            self.assertTrue(is_damped(failure))
+            for until in (102, 104, 105, 105):
+                failure = record_failure(failure, 'AccessDenied', 1, 5)
+                self.assertEqual(failure['until'], until)
+            self.assertEqual(failure['failures'], 5)
+        with patch('oss2swift.cache.time', return_value=105):
+            self.assertFalse(is_damped(failure))
+        self.assertFalse(is_damped(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# Copyright (c) 2014 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from hashlib import md5
+from StringIO import StringIO
+import unittest
+
+from oss2swift.digest import DigestInput, crc64
+from oss2swift.response import InvalidDigest
+from swift.common.swob import HTTPException
+
+
+class TestDigestInput(unittest.TestCase):
+    def test_digests(self):
+        digest = DigestInput(StringIO('hello\nworld'))
+        self.assertEqual(digest.readline(), 'hello\n')
+        self.assertEqual(digest.read(2), 'wo')
+        self.assertEqual(digest.read(), 'rld')
+        self.assertEqual(digest.bytes_read, 11)
+        self.assertEqual(digest.md5, md5('hello\nworld').hexdigest())
+        self.assertEqual(digest.crc64, crc64('hello\nworld'))
+        digest.check()
+
+    def test_matching_etag(self):
+        digest = DigestInput(StringIO('hello'), 5, md5('hello').hexdigest())
+        self.assertEqual(digest.read(5), 'hello')
+        self.assertEqual(digest.read(5), '')
+        self.assertFalse(digest.bad_digest)
+
+    def test_bad_digest_with_content_length(self):
+        digest = DigestInput(StringIO('hello'), 5, md5('world').hexdigest())
+        self.assertEqual(digest.read(3), 'hel')
+        # the last byte fails the read
+        self.assertRaises(HTTPException, digest.read, 2)
+        self.assertTrue(digest.bad_digest)
+        self.assertRaises(InvalidDigest, digest.check)
+
+    def test_bad_digest_at_eof(self):
+        digest = DigestInput(StringIO('hello'), None, md5('world').hexdigest())
+        self.assertEqual(digest.read(5), 'hello')
+        self.assertRaises(HTTPException, digest.read, 5)
+        self.assertRaises(InvalidDigest, digest.check)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,18 +13,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from hashlib import md5
 from mock import patch
 import os
+import re
 import time
 import unittest
 from urllib import quote
 
 from oss2swift.cfg import CONF
+from oss2swift.controllers import multi_upload
 from oss2swift.etree import fromstring, tostring
 from oss2swift.request import MAX_32BIT_INT
 from oss2swift.subresource import Owner, Grant, User, ACL, encode_acl, \
     decode_acl, ACLPublicRead
 from oss2swift.test.unit import Oss2swiftTestCase
+from oss2swift.test.unit.test_cache import FakeMemcache
 from oss2swift.test.unit.test_oss_acl import ossacl
 from oss2swift.utils import sysmeta_header, mktime, OssTimestamp
 from swift.common import swob
@@ -66,6 +70,9 @@ class TestOss2swiftMultiUpload(Oss2swiftTestCase):
 
     def setUp(self):
         super(TestOss2swiftMultiUpload, self).setUp()
+        multi_upload.UPLOAD_CACHE.local.clear()
+        multi_upload.CONTAINER_CACHE.local.clear()
+        multi_upload.COMPLETE_CACHE.local.clear()
 
         segment_bucket = '/v1/AUTH_test/bucket+segments'
         self.etag = '7dfa07a8e59ddbcd1dc84d4c4f82aea1'
@@ -90,7 +97,7 @@ class TestOss2swiftMultiUpload(Oss2swiftTestCase):
                             swob.HTTPNoContent, {}, None)
         self.swift.register('GET', segment_bucket + '/object/invalid',
                             swob.HTTPNotFound, {}, None)
-        self.swift.register('PUT', segment_bucket + '/object/X/1',
+        self.swift.register('PUT', segment_bucket + '/object/X/00001',
                             swob.HTTPCreated, put_headers, None)
         self.swift.register('DELETE', segment_bucket + '/object/X/1',
                             swob.HTTPNoContent, {}, None)
@@ -103,7 +110,7 @@ class TestOss2swiftMultiUpload(Oss2swiftTestCase):
                             swob.HTTPCreated, {}, None)
         self.swift.register('DELETE', segment_bucket + '/object/Y',
                             swob.HTTPNoContent, {}, None)
-        self.swift.register('PUT', segment_bucket + '/object/Y/1',
+        self.swift.register('PUT', segment_bucket + '/object/Y/00001',
                             swob.HTTPCreated, {}, None)
         self.swift.register('DELETE', segment_bucket + '/object/Y/1',
                             swob.HTTPNoContent, {}, None)
@@ -116,13 +123,21 @@ class TestOss2swiftMultiUpload(Oss2swiftTestCase):
                             swob.HTTPCreated, {}, None)
         self.swift.register('DELETE', segment_bucket + '/object2/Z',
                             swob.HTTPNoContent, {}, None)
-        self.swift.register('PUT', segment_bucket + '/object2/Z/1',
+        self.swift.register('PUT', segment_bucket + '/object2/Z/00001',
                             swob.HTTPCreated, {}, None)
         self.swift.register('DELETE', segment_bucket + '/object2/Z/1',
                             swob.HTTPNoContent, {}, None)
         self.swift.register('DELETE', segment_bucket + '/object2/Z/2',
                             swob.HTTPNoContent, {}, None)
 
+        # the uploads above were initiated before the upload index existed
+        upload_index = '/v1/AUTH_test/bucket+uploads'
+        self.swift.register('HEAD', upload_index, swob.HTTPNotFound, {}, None)
+        self.swift.register('GET', upload_index, swob.HTTPNotFound, {}, None)
+        self.swift.register('PUT', upload_index, swob.HTTPAccepted, {}, None)
+        self.swift.register('POST', upload_index, swob.HTTPNoContent, {},
+                            None)
+
     @ossacl
     def test_bucket_upload_part(self):
         req = Request.blank('/bucket?partNumber=1&uploadId=x',
@@ -179,13 +194,15 @@ class TestOss2swiftMultiUpload(Oss2swiftTestCase):
 
     def _test_bucket_multipart_uploads_GET(self, query=None,
                                            multiparts=None):
-        segment_bucket = '/v1/AUTH_test/bucket+segments'
+        upload_index = '/v1/AUTH_test/bucket+uploads'
         objects = multiparts or multiparts_template
-        objects = map(lambda item: {'name': item[0], 'last_modified': item[1],
-                                    'hash': item[2], 'bytes': item[3]},
-                      objects)
+        # the upload index holds the upload id objects only
+        objects = [{'name': item[0], 'last_modified': item[1],
+                    'hash': item[2], 'bytes': item[3]}
+                   for item in objects if not re.search('/[0-9]+$', item[0])]
         object_list = json.dumps(objects)
-        self.swift.register('GET', segment_bucket, swob.HTTPOk, {},
+        self.swift.register('GET', upload_index, swob.HTTPOk,
+                            {multi_upload.UPLOADS_MIGRATED_HEADER: 'true'},
                             object_list)
 
         query = '?uploads&' + query if query else '?uploads'
@@ -254,6 +271,98 @@ class TestOss2swiftMultiUpload(Oss2swiftTestCase):
         self.assertEqual(status.split()[0], '404')
         self.assertEqual(self._get_error_code(body), 'NoSuchBucket')
 
+    def _register_upload_index(self, uploads):
+        upload_index = '/v1/AUTH_test/bucket+uploads'
+        objects = [{'name': name, 'last_modified': '2014-05-07T19:47:50.592270',
+                    'hash': 'd41d8cd98f00b204e9800998ecf8427e', 'bytes': 0}
+                   for name in uploads]
+        self.swift.register('HEAD', upload_index, swob.HTTPNoContent, {}, None)
+        self.swift.register('GET', upload_index, swob.HTTPOk, {},
+                            json.dumps(objects))
+        self.swift.register('DELETE', upload_index, swob.HTTPConflict, {},
+                            None)
+        for name in uploads:
+            self.swift.register('HEAD', upload_index + '/' + name,
+                                swob.HTTPOk, {}, None)
+            self.swift.register('DELETE', upload_index + '/' + name,
+                                swob.HTTPNoContent, {}, None)
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_bucket_multipart_uploads_GET_upload_index(self):
+        status, headers, body = self._test_bucket_multipart_uploads_GET(
+            'max-uploads=2', multiparts=multiparts_template[:9])
+        self.assertEqual(status.split()[0], '200')
+        elem = fromstring(body, 'ListMultipartUploadsResult')
+        self.assertEqual([u.find('UploadId').text
+                          for u in elem.findall('Upload')], ['X', 'Y'])
+        self.assertEqual(elem.find('NextKeyMarker').text, 'object')
+        self.assertEqual(elem.find('NextUploadIdMarker').text, 'Y')
+        self.assertEqual(elem.find('IsTruncated').text, 'true')
+        # a single listing of the migrated index, the parts are never read
+        self.assertEqual(
+            [c for c in self.swift.calls if c[0] != 'HEAD'],
+            [('GET', '/v1/AUTH_test/bucket+uploads?format=json&limit=3')])
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_bucket_multipart_uploads_GET_upload_index_marker(self):
+        status, headers, body = self._test_bucket_multipart_uploads_GET(
+            'key-marker=object&upload-id-marker=Y&max-uploads=1',
+            multiparts=multiparts_template[6:7])
+        elem = fromstring(body, 'ListMultipartUploadsResult')
+        self.assertEqual(elem.find('IsTruncated').text, 'false')
+        self.assertEqual(self.swift.calls[-1],
+                         ('GET', '/v1/AUTH_test/bucket+uploads?format=json'
+                                 '&limit=2&marker=object/Y'))
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_bucket_multipart_uploads_GET_migrate_legacy_uploads(self):
+        upload_index = '/v1/AUTH_test/bucket+uploads'
+        segment_bucket = '/v1/AUTH_test/bucket+segments'
+        # the index was created by an upload initiated after the upload
+        # index was introduced, but X and Y are still in the segments
+        self._register_upload_index([])
+        objects = [{'name': item[0], 'last_modified': item[1],
+                    'hash': item[2], 'bytes': item[3]}
+                   for item in multiparts_template[:6]]
+        self.swift.register('GET', segment_bucket + '?format=json&marker=',
+                            swob.HTTPOk, {}, json.dumps(objects))
+        self.swift.register('GET', segment_bucket +
+                            '?format=json&marker=object/Y/2',
+                            swob.HTTPOk, {}, json.dumps([]))
+        self.swift.register('PUT', upload_index + '/object/X',
+                            swob.HTTPCreated, {}, None)
+        # Y is completed while being migrated
+        self.swift.register('PUT', upload_index + '/object/Y',
+                            swob.HTTPNotFound, {}, None)
+
+        req = Request.blank('/bucket?uploads',
+                            environ={'REQUEST_METHOD': 'GET'},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()})
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+
+        calls = [(method, path, req_headers) for method, path, req_headers
+                 in self.swift.calls_with_headers if method != 'HEAD']
+        self.assertEqual([call[:2] for call in calls], [
+            ('GET', upload_index + '?format=json&limit=1001'),
+            ('PUT', upload_index),
+            ('GET', segment_bucket + '?format=json&marker='),
+            ('PUT', upload_index + '/object/X'),
+            ('DELETE', segment_bucket + '/object/X'),
+            ('PUT', upload_index + '/object/Y'),
+            ('GET', segment_bucket + '?format=json&marker=object/Y/2'),
+            ('POST', upload_index),
+            ('GET', upload_index + '?format=json&limit=1001')])
+        copy_headers = calls[3][2]
+        self.assertEqual(copy_headers['X-Copy-From'],
+                         quote('/bucket+segments/object/X'))
+        self.assertEqual(
+            copy_headers[multi_upload.SEGMENTS_CONTAINER_HEADER],
+            'bucket+segments')
+        self.assertEqual(
+            calls[7][2][multi_upload.UPLOADS_MIGRATED_HEADER], 'true')
+
     @ossacl
     def test_bucket_multipart_uploads_GET_encoding_type_error(self):
         query = 'encoding-type=xml'
@@ -583,6 +692,238 @@ class TestOss2swiftMultiUpload(Oss2swiftTestCase):
         self.assertEqual(acl_header.get(sysmeta_header('object', 'acl')),
                          tmpacl_header)
 
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.controllers.multi_upload.unique_id', lambda: 'X')
+    def test_object_multipart_upload_initiate_upload_index(self):
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket+uploads',
+                            swob.HTTPNoContent, {}, None)
+        self.swift.register('PUT', '/v1/AUTH_test/bucket+uploads/object/X',
+                            swob.HTTPCreated, {}, None)
+        req = Request.blank('/bucket/object?uploads',
+                            environ={'REQUEST_METHOD': 'POST'},
+                            headers={'Authorization':
+                                     'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()})
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+        self.assertEqual(self.swift.calls[-1],
+                         ('PUT', '/v1/AUTH_test/bucket+uploads/object/X'))
+
+    def _initiate(self):
+        req = Request.blank('/bucket/object?uploads',
+                            environ={'REQUEST_METHOD': 'POST'},
+                            headers={'Authorization':
+                                     'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()})
+        return self.call_oss2swift(req)
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.controllers.multi_upload.unique_id', lambda: 'X')
+    def test_object_multipart_upload_initiate_container_cache(self):
+        self.swift.register('PUT', '/v1/AUTH_test/bucket+uploads/object/X',
+                            swob.HTTPCreated, {}, None)
+        status, headers, body = self._initiate()
+        self.assertEqual(status.split()[0], '200')
+        self.assertIn(('PUT', '/v1/AUTH_test/bucket+uploads'),
+                      self.swift.calls)
+
+        count = self.swift.call_count
+        status, headers, body = self._initiate()
+        self.assertEqual(status.split()[0], '200')
+        self.assertEqual(self.swift.calls[count + 1:],
+                         [('PUT', '/v1/AUTH_test/bucket+uploads/object/X')])
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.controllers.multi_upload.unique_id', lambda: 'X')
+    def test_object_multipart_upload_initiate_stale_container_cache(self):
+        for container in ('bucket+segments', 'bucket+uploads'):
+            multi_upload.CONTAINER_CACHE.set({}, 'AUTH_test/' + container,
+                                             True)
+        self.swift.register('PUT', '/v1/AUTH_test/bucket+uploads/object/X',
+                            swob.HTTPNotFound, {}, None)
+        count = self.swift.call_count
+        status, headers, body = self._initiate()
+        self.assertEqual(self._get_error_code(body), 'NoSuchBucket')
+        self.assertEqual(self.swift.calls[count + 1:], [
+            ('PUT', '/v1/AUTH_test/bucket+uploads/object/X'),
+            ('PUT', '/v1/AUTH_test/bucket+segments'),
+            ('PUT', '/v1/AUTH_test/bucket+uploads'),
+            ('PUT', '/v1/AUTH_test/bucket+uploads/object/X')])
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.cfg.CONF.segments_container_shards', 4)
+    @patch('oss2swift.controllers.multi_upload.unique_id', lambda: 'X')
+    def test_object_multipart_upload_initiate_sharded(self):
+        self.swift.register('PUT', '/v1/AUTH_test/bucket+3+segments',
+                            swob.HTTPCreated, {}, None)
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket+uploads',
+                            swob.HTTPNoContent, {}, None)
+        self.swift.register('PUT', '/v1/AUTH_test/bucket+uploads/object/X',
+                            swob.HTTPCreated, {}, None)
+        req = Request.blank('/bucket/object?uploads',
+                            environ={'REQUEST_METHOD': 'POST'},
+                            headers={'Authorization':
+                                     'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()})
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+        self.assertIn(('PUT', '/v1/AUTH_test/bucket+3+segments'),
+                      self.swift.calls)
+        _, path, req_headers = self.swift.calls_with_headers[-1]
+        self.assertEqual(path, '/v1/AUTH_test/bucket+uploads/object/X')
+        self.assertEqual(
+            req_headers.get(sysmeta_header('object', 'segments-container')),
+            'bucket+3+segments')
+
+    def _upload_part(self, part_number, memcache=None, status='200'):
+        req = Request.blank('/bucket/object?partNumber=%d&uploadId=X' %
+                            part_number,
+                            environ={'REQUEST_METHOD': 'PUT',
+                                     'swift.cache': memcache},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()},
+                            body='part')
+        status_, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status_.split()[0], status)
+        return body
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_object_upload_part_session_cache(self):
+        memcache = FakeMemcache()
+        segment_bucket = '/v1/AUTH_test/bucket+segments'
+        self.swift.register('HEAD', segment_bucket, swob.HTTPNoContent,
+                            {}, None)
+        self.swift.register('PUT', segment_bucket + '/object/X/00002',
+                            swob.HTTPCreated, {}, None)
+        self._upload_part(1, memcache)
+        self.assertIn(('HEAD', segment_bucket + '/object/X'),
+                      self.swift.calls)
+
+        count = self.swift.call_count
+        self._upload_part(2, memcache)
+        self.assertEqual(self.swift.calls[count:],
+                         [('HEAD', '/v1/AUTH_test/bucket'),
+                          ('PUT', segment_bucket + '/object/X/00002')])
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_object_upload_part_session_cache_disabled(self):
+        memcache = FakeMemcache()
+        with patch('oss2swift.cfg.CONF.upload_cache_ttl', 0):
+            self._upload_part(1, memcache)
+            count = self.swift.call_count
+            self._upload_part(1, memcache)
+        self.assertIn(('HEAD', '/v1/AUTH_test/bucket+segments/object/X'),
+                      self.swift.calls[count:])
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_object_upload_part_session_not_cached_without_memcache(self):
+        # other workers could not see the tombstone of the upload
+        self._upload_part(1)
+        count = self.swift.call_count
+        self._upload_part(1)
+        self.assertIn(('HEAD', '/v1/AUTH_test/bucket+segments/object/X'),
+                      self.swift.calls[count:])
+        self.assertEqual(len(multi_upload.UPLOAD_CACHE.local), 0)
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_object_multipart_upload_abort_closes_session(self):
+        memcache = FakeMemcache()
+        self._upload_part(1, memcache)
+        self.swift.register('DELETE', '/v1/AUTH_test/bucket+segments',
+                            swob.HTTPConflict, {}, None)
+        req = Request.blank('/bucket/object?uploadId=X',
+                            environ={'REQUEST_METHOD': 'DELETE',
+                                     'swift.cache': memcache},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()})
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '204')
+
+        # another worker, which has not seen the upload id object go yet
+        count = self.swift.call_count
+        body = self._upload_part(1, memcache, '404')
+        self.assertEqual(self._get_error_code(body), 'NoSuchUpload')
+        self.assertEqual(self.swift.calls[count:],
+                         [('HEAD', '/v1/AUTH_test/bucket')])
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_object_upload_part_racing_complete(self):
+        memcache = FakeMemcache()
+        get_upload_info = multi_upload._get_upload_info
+
+        def complete_meanwhile(req, app, upload_id):
+            result = get_upload_info(req, app, upload_id)
+            multi_upload._close_upload(req, upload_id)
+            return result
+
+        with patch('oss2swift.controllers.multi_upload._get_upload_info',
+                   complete_meanwhile):
+            body = self._upload_part(1, memcache, '404')
+        self.assertEqual(self._get_error_code(body), 'NoSuchUpload')
+        self.assertNotIn(('PUT', '/v1/AUTH_test/bucket+segments/object/X/'
+                          '00001'), self.swift.calls)
+        # only the tombstone is left
+        self.assertEqual(len(memcache.store), 1)
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.controllers.multi_upload.max_manifest_segments',
+           lambda: 1)
+    def test_object_multipart_upload_complete_error_reopens_upload(self):
+        memcache = FakeMemcache()
+        req = Request.blank('/bucket/object?uploadId=X',
+                            environ={'REQUEST_METHOD': 'POST',
+                                     'swift.cache': memcache},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header(), },
+                            body=xml)
+        with patch.object(memcache, 'set', wraps=memcache.set) as m_set:
+            status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(self._get_error_code(body), 'InvalidRequest')
+        # closed while the manifest was put, open again after the error
+        self.assertTrue(m_set.called)
+        self.assertEqual(memcache.store, {})
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_object_upload_part_sharded(self):
+        self._register_upload_index(['object/X'])
+        self.swift.register(
+            'HEAD', '/v1/AUTH_test/bucket+uploads/object/X', swob.HTTPOk,
+            {sysmeta_header('object', 'segments-container'):
+             'bucket+3+segments'}, None)
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket+3+segments',
+                            swob.HTTPNoContent, {}, None)
+        self.swift.register('PUT', '/v1/AUTH_test/bucket+3+segments',
+                            swob.HTTPAccepted, {}, None)
+        self.swift.register(
+            'PUT', '/v1/AUTH_test/bucket+3+segments/object/X/00001',
+            swob.HTTPCreated, {}, None)
+        req = Request.blank('/bucket/object?partNumber=1&uploadId=X',
+                            environ={'REQUEST_METHOD': 'PUT'},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()},
+                            body='part')
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+        self.assertEqual(
+            self.swift.calls[-1],
+            ('PUT', '/v1/AUTH_test/bucket+3+segments/object/X/00001'))
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_object_multipart_upload_abort_upload_index(self):
+        self._register_upload_index(['object/X'])
+        self.swift.register('DELETE', '/v1/AUTH_test/bucket+segments',
+                            swob.HTTPConflict, {}, None)
+        req = Request.blank('/bucket/object?uploadId=X',
+                            environ={'REQUEST_METHOD': 'DELETE'},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()})
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '204')
+        self.assertIn(('DELETE', '/v1/AUTH_test/bucket+uploads/object/X'),
+                      self.swift.calls)
+        self.assertNotIn(('DELETE', '/v1/AUTH_test/bucket+segments/object/X'),
+                         self.swift.calls)
+
     @patch('oss2swift.controllers.multi_upload.unique_id', lambda: 'X')
     def test_object_multipart_upload_initiate_without_bucket(self):
         self.swift.register('HEAD', '/v1/AUTH_test/bucket',
@@ -649,6 +990,145 @@ class TestOss2swiftMultiUpload(Oss2swiftTestCase):
         _, _, headers = self.swift.calls_with_headers[-2]
         self.assertEqual(headers.get('X-Object-Meta-Foo'), 'bar')
 
+    def _complete(self, body=xml):
+        req = Request.blank('/bucket/object?uploadId=X',
+                            environ={'REQUEST_METHOD': 'POST'},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header(), },
+                            body=body)
+        return self.call_oss2swift(req)
+
+    def _forget_upload(self):
+        # the marker is deleted by a successful Complete
+        self.swift.register('HEAD',
+                            '/v1/AUTH_test/bucket+segments/object/X',
+                            swob.HTTPNotFound, {}, None)
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_object_multipart_upload_complete_retry(self):
+        self.swift.register('PUT', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPCreated, {'etag': 'MANIFEST'}, None)
+        status, headers, body = self._complete()
+        self.assertEqual(status.split()[0], '200')
+        self._forget_upload()
+
+        call_count = self.swift.call_count
+        status, headers, retry_body = self._complete()
+        self.assertEqual(status.split()[0], '200')
+        self.assertEqual(retry_body, body)
+        elem = fromstring(retry_body, 'CompleteMultipartUploadResult')
+        self.assertEqual(elem.find('ETag').text, 'MANIFEST')
+        # only the bucket is checked
+        self.assertEqual(self.swift.calls[call_count:],
+                         [('HEAD', '/v1/AUTH_test/bucket')])
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_object_multipart_upload_complete_retry_other_parts(self):
+        status, headers, body = self._complete()
+        self.assertEqual(status.split()[0], '200')
+        self._forget_upload()
+
+        other_xml = '<CompleteMultipartUpload><Part>' \
+            '<PartNumber>1</PartNumber><ETag>HASH</ETag>' \
+            '</Part></CompleteMultipartUpload>'
+        status, headers, body = self._complete(other_xml)
+        self.assertEqual(self._get_error_code(body), 'NoSuchUpload')
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.cfg.CONF.complete_cache_ttl', 0)
+    def test_object_multipart_upload_complete_retry_disabled(self):
+        status, headers, body = self._complete()
+        self.assertEqual(status.split()[0], '200')
+        self._forget_upload()
+
+        status, headers, body = self._complete()
+        self.assertEqual(self._get_error_code(body), 'NoSuchUpload')
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.controllers.multi_upload.max_manifest_segments',
+           lambda: 2)
+    def test_object_multipart_upload_complete_nested_manifest(self):
+        segment_bucket = '/v1/AUTH_test/bucket+segments'
+        parts = [{'name': 'object/X/%05d' % i, 'hash': 'HASH%d' % i,
+                  'bytes': i * 100, 'last_modified': '2014-05-07T19:47:51'}
+                 for i in (1, 2, 3)]
+        self.swift.register('GET', segment_bucket, swob.HTTPOk, {},
+                            json.dumps(parts))
+        for i in (1, 2):
+            self.swift.register(
+                'PUT', segment_bucket + '/object/X/manifest/%05d' % i,
+                swob.HTTPCreated, {}, None)
+        self.swift.register('DELETE', segment_bucket, swob.HTTPConflict,
+                            {}, None)
+        body = '<CompleteMultipartUpload>%s</CompleteMultipartUpload>' % \
+            ''.join('<Part><PartNumber>%d</PartNumber><ETag>HASH%d</ETag>'
+                    '</Part>' % (i, i) for i in (1, 2, 3))
+        req = Request.blank('/bucket/object?uploadId=X',
+                            environ={'REQUEST_METHOD': 'POST'},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header(), },
+                            body=body)
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+
+        _, sub_manifest = self.swift.uploaded[
+            segment_bucket + '/object/X/manifest/00002'
+            '?multipart-manifest=put']
+        self.assertEqual(json.loads(sub_manifest), [
+            {'path': '/bucket+segments/object/X/00003', 'etag': 'HASH3',
+             'size_bytes': 300}])
+        _, manifest = self.swift.uploaded[
+            '/v1/AUTH_test/bucket/object?multipart-manifest=put']
+        self.assertEqual(json.loads(manifest), [
+            {'path': '/bucket+segments/object/X/manifest/00001',
+             'etag': md5('HASH1HASH2').hexdigest(), 'size_bytes': 300},
+            {'path': '/bucket+segments/object/X/manifest/00002',
+             'etag': md5('HASH3').hexdigest(), 'size_bytes': 300}])
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.controllers.multi_upload.CONTAINER_LISTING_LIMIT', 2)
+    def test_object_multipart_upload_complete_parts_listing_pages(self):
+        segment_bucket = '/v1/AUTH_test/bucket+segments'
+        parts = [{'name': 'object/X/%05d' % i, 'hash': 'HASH%d' % i,
+                  'bytes': i * 100, 'last_modified': '2014-05-07T19:47:51'}
+                 for i in (1, 2, 3)]
+        self.swift.register('GET', segment_bucket, swob.HTTPOk, {},
+                            json.dumps(parts[:2]))
+        self.swift.register('GET', segment_bucket +
+                            '?delimiter=/&format=json&marker=object/X/00002'
+                            '&prefix=object/X/',
+                            swob.HTTPOk, {}, json.dumps(parts[2:]))
+        self.swift.register('DELETE', segment_bucket, swob.HTTPConflict,
+                            {}, None)
+        body = '<CompleteMultipartUpload>%s</CompleteMultipartUpload>' % \
+            ''.join('<Part><PartNumber>%d</PartNumber><ETag>HASH%d</ETag>'
+                    '</Part>' % (i, i) for i in (1, 2, 3))
+        req = Request.blank('/bucket/object?uploadId=X',
+                            environ={'REQUEST_METHOD': 'POST'},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header(), },
+                            body=body)
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+
+        _, manifest = self.swift.uploaded[
+            '/v1/AUTH_test/bucket/object?multipart-manifest=put']
+        self.assertEqual([s['path'] for s in json.loads(manifest)],
+                         ['/bucket+segments/object/X/%05d' % i
+                          for i in (1, 2, 3)])
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.controllers.multi_upload.max_manifest_segments',
+           lambda: 1)
+    def test_object_multipart_upload_complete_too_many_parts(self):
+        req = Request.blank('/bucket/object?uploadId=X',
+                            environ={'REQUEST_METHOD': 'POST'},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header(), },
+                            body=xml)
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(self._get_error_code(body), 'InvalidRequest')
+
     def test_object_multipart_upload_complete_segment_too_small(self):
         msgs = [
             # pre-2.6.0 swift
@@ -951,6 +1431,45 @@ class TestOss2swiftMultiUpload(Oss2swiftTestCase):
                              str(objects_template[partnum - 1][3]))
         self.assertEqual(status.split()[0], '200')
 
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_object_list_parts_part_number_marker(self):
+        objects = [{'name': 'object/X/%05d' % n, 'hash': 'HASH', 'bytes': n,
+                    'last_modified': '2014-05-07T19:47:51.000270'}
+                   for n in (3, 4)]
+        self.swift.register('GET', '/v1/AUTH_test/bucket+segments',
+                            swob.HTTPOk, {}, json.dumps(objects))
+        req = Request.blank('/bucket/object?uploadId=X&max-parts=1'
+                            '&part-number-marker=2',
+                            environ={'REQUEST_METHOD': 'GET'},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()})
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+        elem = fromstring(body, 'ListPartsResult')
+        self.assertEqual([p.find('PartNumber').text
+                          for p in elem.findall('Part')], ['3'])
+        self.assertEqual(elem.find('NextPartNumberMarker').text, '3')
+        self.assertEqual(elem.find('IsTruncated').text, 'true')
+        self.assertEqual(self.swift.calls[-1],
+                         ('GET', '/v1/AUTH_test/bucket+segments?delimiter=/'
+                                 '&format=json&limit=2'
+                                 '&marker=object/X/00002&prefix=object/X/'))
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_object_upload_part_zero_padded(self):
+        self.swift.register('PUT', '/v1/AUTH_test/bucket+segments/object/X/00012',
+                            swob.HTTPCreated, {}, None)
+        req = Request.blank('/bucket/object?partNumber=12&uploadId=X',
+                            environ={'REQUEST_METHOD': 'PUT'},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()},
+                            body='part')
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+        self.assertEqual(self.swift.calls[-1],
+                         ('PUT',
+                          '/v1/AUTH_test/bucket+segments/object/X/00012'))
+
     def test_object_list_parts_encoding_type(self):
         self.swift.register('HEAD', '/v1/AUTH_test/bucket+segments/object@@/X',
                             swob.HTTPOk, {}, None)
@@ -1518,7 +2037,7 @@ class TestOss2swiftMultiUpload(Oss2swiftTestCase):
             ('HEAD', '/v1/AUTH_test/bucket'),
             ('HEAD', '/v1/AUTH_test/bucket+segments/object/X'),
             ('HEAD', '/v1/AUTH_test/src_bucket/src_obj'),
-            ('PUT', '/v1/AUTH_test/bucket+segments/object/X/1'),
+            ('PUT', '/v1/AUTH_test/bucket+segments/object/X/00001'),
         ], self.swift.calls)
         put_headers = self.swift.calls_with_headers[-1][2]
         self.assertEqual('bytes=0-9', put_headers['Range'])
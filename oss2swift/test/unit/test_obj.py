@@ -22,7 +22,9 @@ import sys
 import time
 import unittest
 
+from oss2swift.controllers import multi_upload
 from oss2swift.etree import fromstring
+from oss2swift.request import NOT_FOUND_CACHE
 from oss2swift.subresource import ACL, User, encode_acl, Owner, Grant
 from oss2swift.test.unit import Oss2swiftTestCase
 from oss2swift.test.unit.helpers import FakeSwift
@@ -30,6 +32,7 @@ from oss2swift.test.unit.test_oss_acl import ossacl
 from oss2swift.utils import mktime, OssTimestamp
 from swift.common import swob
 from swift.common.swob import Request
+from swift.common.utils import json
 
 
 reload(sys)
@@ -120,6 +123,59 @@ class TestOss2swiftObj(Oss2swiftTestCase):
         if method == 'GET':
             self.assertEqual(body, self.object_body)
 
+    @patch('oss2swift.cfg.CONF.not_found_cache_ttl', 10)
+    def test_object_not_found_cached(self):
+        NOT_FOUND_CACHE.local.clear()
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket/missing',
+                            swob.HTTPNotFound, {}, None)
+        self.swift.register('GET', '/v1/AUTH_test/bucket/missing',
+                            swob.HTTPNotFound, {}, None)
+
+        def call(method):
+            req = Request.blank('/bucket/missing',
+                                environ={'REQUEST_METHOD': method},
+                                headers={'Authorization':
+                                         'OSS test:tester:hmac',
+                                         'Date': self.get_date_header()})
+            status, headers, body = self.call_oss2swift(req)
+            return status.split()[0]
+
+        self.assertEqual(call('HEAD'), '404')
+        self.assertEqual(call('HEAD'), '404')
+        self.assertEqual(call('GET'), '404')
+        self.assertEqual(self.swift.calls, [
+            ('HEAD', '/v1/AUTH_test/bucket'),
+            ('HEAD', '/v1/AUTH_test/bucket/missing')])
+
+    def _test_bucket_not_found_cached(self):
+        NOT_FOUND_CACHE.local.clear()
+        self.swift.register('HEAD', '/v1/AUTH_test/nobucket',
+                            swob.HTTPNotFound, {}, None)
+        for _ in range(2):
+            req = Request.blank('/nobucket/object',
+                                environ={'REQUEST_METHOD': 'HEAD'},
+                                headers={'Authorization':
+                                         'OSS test:tester:hmac',
+                                         'Date': self.get_date_header()})
+            status, headers, body = self.call_oss2swift(req)
+            self.assertEqual(status.split()[0], '404')
+        self.assertEqual(NOT_FOUND_CACHE.local.get('AUTH_test/nobucket/'),
+                         True)
+        return self.swift.calls
+
+    @patch('oss2swift.cfg.CONF.not_found_cache_ttl', 10)
+    def test_bucket_not_found_cached(self):
+        self.assertEqual(self._test_bucket_not_found_cached(),
+                         [('HEAD', '/v1/AUTH_test/nobucket')])
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.cfg.CONF.not_found_cache_ttl', 10)
+    def test_bucket_not_found_cached_without_oss_acl(self):
+        # the first Swift request of each request authenticates it, so it
+        # is never answered from the cache
+        self.assertEqual(self._test_bucket_not_found_cached(),
+                         [('HEAD', '/v1/AUTH_test/nobucket')] * 2)
+
     @ossacl
     def test_object_HEAD_error(self):
         # HEAD does not return the body even an error response in the
@@ -429,6 +485,180 @@ class TestOss2swiftObj(Oss2swiftTestCase):
         # Check that oss2swift converts a Content-MD5 header into an etag.
         self.assertEqual(headers['etag'], etag)
 
+    def _register_segments(self, count):
+        multi_upload.CONTAINER_CACHE.local.clear()
+        segments = '/v1/AUTH_test/bucket+segments'
+        self.swift.register('PUT', segments, swob.HTTPAccepted, {}, None)
+        for i in range(1, count + 1):
+            self.swift.register('PUT', '%s/object/X/%05d' % (segments, i),
+                                swob.HTTPCreated, {}, None)
+            self.swift.register('DELETE', '%s/object/X/%05d' % (segments, i),
+                                swob.HTTPNoContent, {}, None)
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.request.PUT_FOOTERS_SUPPORTED', True)
+    def test_object_PUT_crc64_footer(self):
+        req = Request.blank(
+            '/bucket/object',
+            environ={'REQUEST_METHOD': 'PUT'},
+            headers={'Authorization': 'OSS test:tester:hmac',
+                     'Date': self.get_date_header()},
+            body=self.object_body)
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+        self.assertEqual(headers['x-oss-hash-crc64ecma'],
+                         '11177612005948864433')
+        # the CRC64 is only known after the body was streamed to Swift
+        _, _, req_headers = self.swift.calls_with_headers[-1]
+        self.assertNotIn('X-Object-Meta-Hash-Crc64ecma', req_headers)
+        footers = self.swift.footers['/v1/AUTH_test/bucket/object']
+        self.assertEqual(footers['X-Object-Meta-Hash-Crc64ecma'],
+                         '11177612005948864433')
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.request.PUT_FOOTERS_SUPPORTED', False)
+    def test_object_PUT_crc64_header_without_footers(self):
+        req = Request.blank(
+            '/bucket/object',
+            environ={'REQUEST_METHOD': 'PUT'},
+            headers={'Authorization': 'OSS test:tester:hmac',
+                     'Date': self.get_date_header()},
+            body=self.object_body)
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+        self.assertEqual(headers['x-oss-hash-crc64ecma'],
+                         '11177612005948864433')
+        _, _, req_headers = self.swift.calls_with_headers[-1]
+        self.assertEqual(req_headers['X-Object-Meta-Hash-Crc64ecma'],
+                         '11177612005948864433')
+        self.assertEqual(self.swift.uploaded['/v1/AUTH_test/bucket/object'][1],
+                         self.object_body)
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    def test_object_PUT_invalid_digest(self):
+        content_md5 = hashlib.md5('world').digest().encode('base64').strip()
+        req = Request.blank(
+            '/bucket/object',
+            environ={'REQUEST_METHOD': 'PUT'},
+            headers={'Authorization': 'OSS test:tester:hmac',
+                     'Content-MD5': content_md5,
+                     'Date': self.get_date_header()},
+            body=self.object_body)
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(self._get_error_code(body), 'InvalidDigest')
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.cfg.CONF.put_segment_threshold', 4)
+    @patch('oss2swift.cfg.CONF.put_segment_size', 2)
+    @patch('oss2swift.controllers.obj.unique_id', lambda: 'X')
+    def test_object_PUT_segmented(self):
+        self._register_segments(3)
+        content_md5 = self.etag.decode('hex').encode('base64').strip()
+        req = Request.blank(
+            '/bucket/object',
+            environ={'REQUEST_METHOD': 'PUT'},
+            headers={'Authorization': 'OSS test:tester:hmac',
+                     'Content-MD5': content_md5,
+                     'Content-Type': 'text/plain',
+                     'Cache-Control': 'no-cache',
+                     'x-oss-meta-foo': 'bar',
+                     'Date': self.get_date_header()},
+            body=self.object_body)
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+        self.assertEqual(headers['etag'], '"%s"' % self.etag)
+        self.assertEqual(headers['x-oss-hash-crc64ecma'],
+                         '11177612005948864433')
+
+        segments = '/v1/AUTH_test/bucket+segments/object/X/'
+        self.assertEqual(
+            [self.swift.uploaded[segments + n][1]
+             for n in ('00001', '00002', '00003')], ['he', 'll', 'o'])
+        path = '/v1/AUTH_test/bucket/object?multipart-manifest=put'
+        manifest = json.loads(self.swift.uploaded[path][1])
+        self.assertEqual([(s['path'], s['size_bytes']) for s in manifest], [
+            ('/bucket+segments/object/X/00001', 2),
+            ('/bucket+segments/object/X/00002', 2),
+            ('/bucket+segments/object/X/00003', 1)])
+        _, _, req_headers = self.swift.calls_with_headers[-1]
+        self.assertNotIn('Etag', req_headers)
+        self.assertEqual(req_headers['X-Object-Sysmeta-Oss2swift-Etag'],
+                         self.etag)
+        self.assertEqual(req_headers['X-Object-Meta-Hash-Crc64ecma'],
+                         '11177612005948864433')
+        self.assertEqual(req_headers['X-Object-Meta-Foo'], 'bar')
+        self.assertEqual(req_headers['Cache-Control'], 'no-cache')
+        # the metadata of the object is not copied to its segments
+        for _, path, req_headers in self.swift.calls_with_headers:
+            if path.startswith(segments):
+                self.assertNotIn('X-Object-Meta-Foo', req_headers)
+                self.assertNotIn('Cache-Control', req_headers)
+                self.assertNotIn('Content-Md5', req_headers)
+                self.assertNotEqual(req_headers.get('Content-Type'),
+                                    'text/plain')
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.cfg.CONF.put_segment_threshold', 4)
+    @patch('oss2swift.cfg.CONF.put_segment_size', 2)
+    @patch('oss2swift.cfg.CONF.put_segment_concurrency', 1)
+    @patch('oss2swift.controllers.obj.unique_id', lambda: 'X')
+    def test_object_PUT_segmented_segment_error(self):
+        self._register_segments(3)
+        segments = '/v1/AUTH_test/bucket+segments/object/X/'
+        self.swift.register('PUT', segments + '00001',
+                            swob.HTTPServiceUnavailable, {}, None)
+        req = Request.blank(
+            '/bucket/object',
+            environ={'REQUEST_METHOD': 'PUT'},
+            headers={'Authorization': 'OSS test:tester:hmac',
+                     'Date': self.get_date_header()},
+            body=self.object_body)
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(self._get_error_code(body), 'InternalError')
+        # no more segments are read once one failed
+        self.assertNotIn(('PUT', segments + '00003'), self.swift.calls)
+        self.assertNotIn(('PUT', '/v1/AUTH_test/bucket/object'),
+                         self.swift.calls)
+        self.assertIn(('DELETE', segments + '00001'), self.swift.calls)
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.cfg.CONF.put_segment_threshold', 4)
+    @patch('oss2swift.cfg.CONF.put_segment_size', 2)
+    @patch('oss2swift.controllers.obj.unique_id', lambda: 'X')
+    def test_object_PUT_segmented_bad_digest(self):
+        self._register_segments(3)
+        content_md5 = hashlib.md5('world').digest().encode('base64').strip()
+        req = Request.blank(
+            '/bucket/object',
+            environ={'REQUEST_METHOD': 'PUT'},
+            headers={'Authorization': 'OSS test:tester:hmac',
+                     'Content-MD5': content_md5,
+                     'Date': self.get_date_header()},
+            body=self.object_body)
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(self._get_error_code(body), 'InvalidDigest')
+        # reading the last byte fails before the last segment is sent
+        self.assertNotIn(
+            ('PUT', '/v1/AUTH_test/bucket+segments/object/X/00003'),
+            self.swift.calls)
+        self.assertEqual(self.swift.calls[-2:], [
+            ('DELETE', '/v1/AUTH_test/bucket+segments/object/X/%05d' % i)
+            for i in (1, 2)])
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.cfg.CONF.put_segment_threshold', 5)
+    def test_object_PUT_below_segment_threshold(self):
+        req = Request.blank(
+            '/bucket/object',
+            environ={'REQUEST_METHOD': 'PUT'},
+            headers={'Authorization': 'OSS test:tester:hmac',
+                     'Date': self.get_date_header()},
+            body=self.object_body)
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+        self.assertEqual(self.swift.calls[-1],
+                         ('PUT', '/v1/AUTH_test/bucket/object'))
+
     def test_object_PUT_headers(self):
         content_md5 = self.etag.decode('hex').encode('base64').strip()
 
@@ -582,6 +812,7 @@ class TestOss2swiftObj(Oss2swiftTestCase):
         self.assertEqual(elem.find('Message').text, err_msg)
 
     @ossacl
+    @patch('oss2swift.controllers.obj.FAST_POST_SUPPORTED', True)
     def test_object_PUT_copy_self_metadata_replace(self):
         date_header = self.get_date_header()
         timestamp = mktime(date_header)
@@ -597,9 +828,113 @@ class TestOss2swiftObj(Oss2swiftTestCase):
         self.assertEqual(elem.find('LastModified').text, last_modified)
         self.assertEqual(elem.find('ETag').text, '"%s"' % self.etag)
 
-        _, _, headers = self.swift.calls_with_headers[-1]
+        # the metadata is replaced without copying the data
+        method, path, headers = self.swift.calls_with_headers[-1]
+        self.assertEqual((method, path),
+                         ('POST', '/v1/AUTH_test/bucket/object'))
+        self.assertNotIn('X-Copy-From', headers)
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.request.get_container_info',
+           lambda env, app: {'status': 204, 'meta': {}})
+    @patch('oss2swift.controllers.obj.FAST_POST_SUPPORTED', True)
+    def test_object_PUT_copy_self_metadata_replace_post(self):
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPOk,
+                            {'etag': self.etag,
+                             'x-object-meta-object-type': 'Multipart',
+                             'x-object-meta-hash-crc64ecma': '42',
+                             'x-object-meta-old': 'old'}, None)
+        self.swift.register('POST', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPAccepted, {}, None)
+        header = {'x-oss-metadata-directive': 'REPLACE',
+                  'x-oss-meta-new': 'new'}
+        status, headers, body = self._call_object_copy('/bucket/object',
+                                                       header)
+        self.assertEqual(status.split()[0], '200')
+        elem = fromstring(body, 'CopyObjectResult')
+        self.assertEqual(elem.find('ETag').text, '"%s"' % self.etag)
+        self.assertEqual(headers['x-oss-hash-crc64ecma'], '42')
+
+        self.assertNotIn(('PUT', '/v1/AUTH_test/bucket/object'),
+                         self.swift.calls)
+        method, path, headers = self.swift.calls_with_headers[-1]
+        self.assertEqual((method, path),
+                         ('POST', '/v1/AUTH_test/bucket/object'))
+        self.assertNotIn('X-Copy-From', headers)
+        self.assertEqual(headers['X-Object-Meta-New'], 'new')
+        self.assertNotIn('X-Object-Meta-Old', headers)
+        # the metadata oss2swift keeps for itself survives the POST
+        self.assertEqual(headers['X-Object-Meta-Object-Type'], 'Multipart')
+        self.assertEqual(headers['X-Object-Meta-Hash-Crc64ecma'], '42')
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.request.get_container_info',
+           lambda env, app: {'status': 204, 'meta': {}})
+    @patch('oss2swift.controllers.obj.FAST_POST_SUPPORTED', True)
+    def test_object_PUT_copy_self_metadata_replace_content_type(self):
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPOk,
+                            {'etag': self.etag,
+                             'content-type': 'application/octet-stream'},
+                            None)
+        self.swift.register('POST', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPAccepted, {}, None)
+        header = {'x-oss-metadata-directive': 'REPLACE',
+                  'Content-Type': 'image/png'}
+        status, headers, body = self._call_object_copy('/bucket/object',
+                                                       header)
+        self.assertEqual(status.split()[0], '200')
+        method, path, headers = self.swift.calls_with_headers[-1]
+        self.assertEqual((method, path),
+                         ('POST', '/v1/AUTH_test/bucket/object'))
+        self.assertEqual(headers['Content-Type'], 'image/png')
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.request.get_container_info',
+           lambda env, app: {'status': 204, 'meta': {}})
+    @patch('oss2swift.controllers.obj.FAST_POST_SUPPORTED', False)
+    def test_object_PUT_copy_self_metadata_replace_without_fast_post(self):
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPOk, {'etag': self.etag}, None)
+        header = {'x-oss-metadata-directive': 'REPLACE',
+                  'x-oss-meta-new': 'new'}
+        status, headers, body = self._call_object_copy('/bucket/object',
+                                                       header)
+        self.assertEqual(status.split()[0], '200')
+        self.assertNotIn(('POST', '/v1/AUTH_test/bucket/object'),
+                         self.swift.calls)
+        method, path, headers = self.swift.calls_with_headers[-1]
+        self.assertEqual((method, path),
+                         ('PUT', '/v1/AUTH_test/bucket/object'))
         self.assertEqual(headers['X-Copy-From'], '/bucket/object')
-        self.assertEqual(headers['Content-Length'], '0')
+        self.assertEqual(headers['X-Object-Meta-New'], 'new')
+
+    @patch('oss2swift.cfg.CONF.oss_acl', False)
+    @patch('oss2swift.request.get_container_info',
+           lambda env, app: {'status': 204, 'meta': {}})
+    @patch('oss2swift.controllers.obj.FAST_POST_SUPPORTED', True)
+    def test_object_PUT_copy_self_appendable(self):
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPOk,
+                            {'etag': self.etag,
+                             'x-object-meta-object-type': 'Appendable',
+                             'x-object-meta-next-append-position': '5',
+                             'x-object-sysmeta-oss2swift-append-prefix':
+                             'object/X'},
+                            None)
+        self.swift.register('POST', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPAccepted, {}, None)
+        header = {'x-oss-metadata-directive': 'REPLACE'}
+        status, headers, body = self._call_object_copy('/bucket/object',
+                                                       header)
+        self.assertEqual(status.split()[0], '200')
+        # the object stays a Dynamic Large Object
+        method, _, headers = self.swift.calls_with_headers[-1]
+        self.assertEqual(method, 'POST')
+        self.assertEqual(headers['X-Object-Manifest'],
+                         'bucket%2Bsegments/object/X/')
+        self.assertEqual(headers['X-Object-Meta-Next-Append-Position'], '5')
 
     @ossacl
     def test_object_PUT_copy_headers_error(self):
@@ -987,6 +1322,35 @@ class TestOss2swiftObj(Oss2swiftTestCase):
             self._test_object_copy_for_ossacl('test:write', 'READ')
         self.assertEqual(status.split()[0], '200')
 
+    @ossacl(ossacl_only=True)
+    def test_object_PUT_copy_clears_transient_acl(self):
+        # the source has an ACL set by PUT Object acl, which must not be
+        # copied to the destination
+        src_headers = {'last-modified': self.last_modified,
+                       'x-object-transient-sysmeta-oss2swift-acl':
+                       'public-read-write'}
+        src_headers.update(encode_acl('object', ACL(
+            Owner('test:tester', 'test:tester'),
+            [Grant(User('test:tester'), 'FULL_CONTROL')])))
+        self.swift.register('HEAD', '/v1/AUTH_test/src_bucket/src_obj',
+                            swob.HTTPOk, src_headers, None)
+        req = Request.blank(
+            '/bucket/object',
+            environ={'REQUEST_METHOD': 'PUT'},
+            headers={'Authorization': 'OSS test:tester:hmac',
+                     'X-Oss-Copy-Source': '/src_bucket/src_obj',
+                     'Date': self.get_date_header()})
+        status, headers, body = self.call_oss2swift(req)
+        self.assertEqual(status.split()[0], '200')
+
+        method, path, headers = self.swift.calls_with_headers[-1]
+        self.assertEqual((method, path),
+                         ('PUT', '/v1/AUTH_test/bucket/object'))
+        self.assertEqual(headers['X-Copy-From'], '/src_bucket/src_obj')
+        self.assertEqual(
+            headers['X-Object-Transient-Sysmeta-Oss2swift-Acl'], '')
+        self.assertIn('X-Object-Sysmeta-Oss2swift-Acl', headers)
+
     @ossacl(ossacl_only=True)
     def test_object_PUT_copy_without_src_obj_permission(self):
         status, headers, body = \
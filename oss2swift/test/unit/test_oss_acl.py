@@ -20,6 +20,7 @@ import traceback
 import unittest
 
 from oss2swift.cfg import CONF
+from oss2swift.controllers.oss_acl import OssAclController
 from oss2swift.etree import tostring, Element, SubElement
 from oss2swift.subresource import ACL, ACLPrivate, User, encode_acl, \
     AuthenticatedUsers, AllUsers, Owner, Grant, PERMISSIONS
@@ -563,6 +564,29 @@ class TestOss2swiftOssAcl(Oss2swiftTestCase):
         self.assertRaises(TypeError, fake_class.ossacl_ossonly_error)
         self.assertEqual(None, fake_class.ossacl_ossonly_no_error())
 
+class TestOssAclController(unittest.TestCase):
+
+    def _put_object_acl(self):
+        req = MagicMock(is_object_request=True, container_name='bucket',
+                        object_name='object')
+        resp = OssAclController(MagicMock()).PUT(req)
+        self.assertEqual(resp.status_int, 200)
+        return req.get_response.call_args
+
+    @patch('oss2swift.controllers.oss_acl.TRANSIENT_SYSMETA_SUPPORTED', True)
+    def test_object_acl_PUT_transient_sysmeta(self):
+        args, kwargs = self._put_object_acl()
+        self.assertEqual(args[1:], ('POST',))
+        self.assertNotIn('headers', kwargs)
+
+    @patch('oss2swift.controllers.oss_acl.TRANSIENT_SYSMETA_SUPPORTED', False)
+    def test_object_acl_PUT_without_transient_sysmeta(self):
+        # Swift before 2.9.0 would drop the ACL sent with a POST
+        args, kwargs = self._put_object_acl()
+        self.assertEqual(args[1:], ('PUT',))
+        self.assertEqual(kwargs['headers']['X-Copy-From'], '/bucket/object')
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -12,8 +12,12 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import base64
+from hashlib import sha1
+import hmac
 import json
 import logging
+import re
 import mock
 import time
 import unittest
@@ -21,6 +25,8 @@ import uuid
 
 import fixtures
 from oss2swift import oss_token_middleware as oss_token
+from oss2swift.test.unit.helpers import FakeKeystone
+from oss2swift.test.unit.test_cache import FakeMemcache
 import requests
 from requests_mock.contrib import fixture as rm_fixture
 from six.moves import urllib
@@ -187,7 +193,7 @@ class OssTokenMiddlewareTestGood(OssTokenMiddlewareTestBase):
         path = req.environ['PATH_INFO']
         self.assertTrue(path.startswith('/v1/AUTH_FORCED_TENANT_ID'))
 
-    @mock.patch.object(requests, 'post')
+    @mock.patch.object(requests.Session, 'post')
     def test_insecure(self, MOCK_REQUEST):
         self.middleware = oss_token.filter_factory(
             {'insecure': 'True', 'auth_uri': 'http://example.com'})(self.app)
@@ -293,18 +299,17 @@ class OssTokenMiddlewareTestBad(OssTokenMiddlewareTestBase):
             oss_invalid_req.status_int)  # pylint: disable-msg=E1101
 
     def test_fail_to_connect_to_keystone(self):
-        with mock.patch.object(self.middleware, '_json_request') as o:
-            oss_invalid_req = self.middleware._deny_request('InvalidURI')
-            o.side_effect = oss_token.ServiceError(oss_invalid_req)
-
-            req = Request.blank('/v1/AUTH_cfa/c/o')
-            req.headers['Authorization'] = 'OSS access:signature'
-            req.headers['X-Storage-Token'] = 'token'
-            resp = req.get_response(self.middleware)
-            self.assertEqual(resp.body, oss_invalid_req.body)
-            self.assertEqual(
-                resp.status_int,  # pylint: disable-msg=E1101
-                oss_invalid_req.status_int)  # pylint: disable-msg=E1101
+        self.requests_mock.post(self.TEST_URL,
+                                exc=requests.exceptions.ConnectionError)
+
+        req = Request.blank('/v1/AUTH_cfa/c/o')
+        req.headers['Authorization'] = 'OSS access:signature'
+        req.headers['X-Storage-Token'] = 'token'
+        resp = req.get_response(self.middleware)
+        oss_unavailable_req = self.middleware._deny_request(
+            'ServiceUnavailable')
+        self.assertEqual(resp.body, oss_unavailable_req.body)
+        self.assertEqual(resp.status_int, 503)  # pylint: disable-msg=E1101
 
     def test_bad_reply(self):
         self.requests_mock.post(self.TEST_URL,
@@ -320,3 +325,277 @@ class OssTokenMiddlewareTestBad(OssTokenMiddlewareTestBase):
         self.assertEqual(
             resp.status_int,  # pylint: disable-msg=E1101
             oss_invalid_req.status_int)  # pylint: disable-msg=E1101
+
+
+class OssTokenMiddlewareTestCache(OssTokenMiddlewareTestBase):
+    def setUp(self):
+        super(OssTokenMiddlewareTestCache, self).setUp()
+        self.keystone = FakeKeystone(token_lifetime=3600)
+        self.requests_mock.post('%s/v2.0/tokens' % self.TEST_AUTH_URI,
+                                json=self.keystone)
+        self.conf['passwd'] = 'secret'
+        self.middleware = oss_token.OssToken(self.app, self.conf)
+
+    def _request(self, access='access', environ=None, secret='secret'):
+        string_to_sign = 'GET\n\n\n%s\n/c/o' % time.time()
+        signature = base64.encodestring(
+            hmac.new(secret, string_to_sign, sha1).digest()).strip()
+        req = Request.blank('/v1/AUTH_cfa/c/o', environ=environ)
+        req.headers['Authorization'] = 'OSS %s:%s' % (access, signature)
+        req.headers['X-Auth-Token'] = \
+            base64.urlsafe_b64encode(string_to_sign)
+        req.response = req.get_response(self.middleware)
+        self.assertTrue(req.path.startswith('/v1/AUTH_'))
+        return req
+
+    def test_token_cached(self):
+        req = self._request()
+        self.assertEqual(req.headers['X-Auth-Token'], 'TOKEN_1')
+        req = self._request()
+        self.assertTrue(req.path.startswith('/v1/AUTH_TENANT_ID'))
+        self.assertEqual(req.headers['X-Auth-Token'], 'TOKEN_1')
+        self.assertEqual(self.keystone.calls, 1)
+
+        # the tokens are cached per access key and tenant
+        req = self._request('other')
+        self.assertEqual(req.headers['X-Auth-Token'], 'TOKEN_2')
+        req = self._request('access:FORCED_TENANT_ID')
+        self.assertTrue(req.path.startswith('/v1/AUTH_FORCED_TENANT_ID'))
+        self.assertEqual(req.headers['X-Auth-Token'], 'TOKEN_3')
+        self.assertEqual(self.keystone.calls, 3)
+
+    def test_token_refreshed_before_expiry(self):
+        self._request()
+        # token_cache_refresh seconds before the token expires
+        with mock.patch.object(time, 'time', lambda: 1234 + 3600 - 60):
+            req = self._request()
+        self.assertEqual(req.headers['X-Auth-Token'], 'TOKEN_2')
+        self.assertEqual(self.keystone.calls, 2)
+
+    def test_token_cache_time(self):
+        self.conf['token_cache_time'] = '10'
+        self.middleware = oss_token.OssToken(self.app, self.conf)
+        with mock.patch('oss2swift.cache.time', lambda: 1234):
+            self._request()
+        with mock.patch('oss2swift.cache.time', lambda: 1234 + 9):
+            self._request()
+        self.assertEqual(self.keystone.calls, 1)
+        with mock.patch('oss2swift.cache.time', lambda: 1234 + 10):
+            self._request()
+        self.assertEqual(self.keystone.calls, 2)
+
+    def test_token_cache_disabled(self):
+        self.conf['token_cache_time'] = '0'
+        self.middleware = oss_token.OssToken(self.app, self.conf)
+        self._request()
+        req = self._request()
+        self.assertEqual(req.headers['X-Auth-Token'], 'TOKEN_2')
+        self.assertEqual(self.keystone.calls, 2)
+
+    def test_token_without_expiry(self):
+        self.requests_mock.post('%s/v2.0/tokens' % self.TEST_AUTH_URI,
+                                status_code=201, json=GOOD_RESPONSE)
+        self._request()
+        self._request()
+        self.assertEqual(len(self.requests_mock.request_history), 2)
+
+    @mock.patch.object(requests.Session, 'post')
+    def test_keystone_session(self, MOCK_REQUEST):
+        MOCK_REQUEST.return_value = TestResponse({
+            'status_code': 201, 'text': json.dumps(GOOD_RESPONSE)})
+        self.conf.update({'keystone_pool_size': '3',
+                          'keystone_conn_timeout': '0.5',
+                          'keystone_timeout': '2'})
+        self.middleware = oss_token.OssToken(self.app, self.conf)
+        adapter = self.middleware._session.get_adapter(self.TEST_AUTH_URI)
+        self.assertEqual(adapter._pool_maxsize, 3)
+        self._request()
+        self._request()
+        self.assertEqual(MOCK_REQUEST.call_count, 2)
+        mock_args, mock_kwargs = MOCK_REQUEST.call_args
+        self.assertEqual(mock_kwargs['timeout'], (0.5, 2.0))
+
+    def test_failure_damped(self):
+        self.requests_mock.post('%s/v2.0/tokens' % self.TEST_AUTH_URI,
+                                status_code=401)
+        with mock.patch('oss2swift.cache.time', lambda: 1234):
+            req = self._request()
+            self.assertEqual(req.response.status_int, 401)
+            # rejected without asking Keystone
+            req = self._request()
+            self.assertEqual(req.response.status_int, 401)
+            self.assertEqual(len(self.requests_mock.request_history), 1)
+            # even if it claims to forward another client
+            self._request(environ={'HTTP_X_FORWARDED_FOR': '10.0.0.1'})
+            self.assertEqual(len(self.requests_mock.request_history), 1)
+            # but not from another client
+            self._request(environ={'REMOTE_ADDR': '10.0.0.1'})
+            self.assertEqual(len(self.requests_mock.request_history), 2)
+            # nor another access key
+            self._request('other')
+            self.assertEqual(len(self.requests_mock.request_history), 3)
+        with mock.patch('oss2swift.cache.time', lambda: 1235):
+            self._request()
+            self.assertEqual(len(self.requests_mock.request_history), 4)
+        # twice as long after the second failure
+        with mock.patch('oss2swift.cache.time', lambda: 1236.5):
+            self._request()
+            self.assertEqual(len(self.requests_mock.request_history), 4)
+
+        self.requests_mock.post('%s/v2.0/tokens' % self.TEST_AUTH_URI,
+                                json=self.keystone)
+        with mock.patch('oss2swift.cache.time', lambda: 1237):
+            req = self._request()
+            self.assertEqual(req.response.status_int, 200)
+            self.assertEqual(req.headers['X-Auth-Token'], 'TOKEN_1')
+        # the failures of the other clients and access keys remain
+        self.assertEqual(len(self.middleware._failure_cache), 2)
+
+    def test_failure_behind_trusted_proxy(self):
+        self.conf['auth_failure_trusted_proxies'] = '10.0.0.9'
+        self.middleware = oss_token.OssToken(self.app, self.conf)
+        self.requests_mock.post('%s/v2.0/tokens' % self.TEST_AUTH_URI,
+                                status_code=401)
+        proxied = {'REMOTE_ADDR': '10.0.0.9',
+                   'HTTP_X_FORWARDED_FOR': '10.0.0.1'}
+        self._request(environ=proxied)
+        self._request(environ=proxied)
+        self.assertEqual(len(self.requests_mock.request_history), 1)
+        # another client behind the same proxy
+        self._request(environ=dict(proxied,
+                                   HTTP_X_FORWARDED_FOR='10.0.0.2'))
+        self.assertEqual(len(self.requests_mock.request_history), 2)
+
+    def test_keystone_error_not_damped(self):
+        self.requests_mock.post('%s/v2.0/tokens' % self.TEST_AUTH_URI,
+                                status_code=500)
+        req = self._request()
+        self.assertEqual(req.response.status_int, 503)
+        self._request()
+        self.assertEqual(len(self.requests_mock.request_history), 2)
+        self.assertEqual(len(self.middleware._failure_cache), 0)
+
+    def test_keystone_connection_error_not_damped(self):
+        self.requests_mock.post('%s/v2.0/tokens' % self.TEST_AUTH_URI,
+                                exc=requests.exceptions.ConnectTimeout)
+        req = self._request()
+        self.assertEqual(req.response.status_int, 503)
+        self._request()
+        self.assertEqual(len(self.requests_mock.request_history), 2)
+        self.assertEqual(len(self.middleware._failure_cache), 0)
+
+    def test_bad_signature_damped(self):
+        with mock.patch('oss2swift.cache.time', lambda: 1234):
+            req = self._request(secret='wrong')
+            self.assertEqual(req.response.status_int, 401)
+            req = self._request()
+            self.assertEqual(req.response.status_int, 401)
+            self.assertEqual(self.keystone.calls, 0)
+
+    def test_failure_damping_disabled(self):
+        self.conf['auth_failure_max_damping'] = '0'
+        self.middleware = oss_token.OssToken(self.app, self.conf)
+        req = self._request(secret='wrong')
+        self.assertEqual(req.response.status_int, 401)
+        req = self._request()
+        self.assertEqual(req.response.status_int, 200)
+        self.assertEqual(len(self.middleware._failure_cache), 0)
+
+    def test_token_memcache(self):
+        memcache = FakeMemcache()
+        self._request(environ={'swift.cache': memcache})
+        self.assertEqual(len(memcache.store), 1)
+        self.assertEqual(len(self.middleware._token_cache), 0)
+        # another worker
+        self.middleware = oss_token.OssToken(self.app, self.conf)
+        req = self._request(environ={'swift.cache': memcache})
+        self.assertEqual(req.headers['X-Auth-Token'], 'TOKEN_1')
+        self.assertEqual(self.keystone.calls, 1)
+
+
+class OssTokenMiddlewareTestSecretCache(OssTokenMiddlewareTestBase):
+    def setUp(self):
+        super(OssTokenMiddlewareTestSecretCache, self).setUp()
+        self.keystone = FakeKeystone(token_lifetime=3600)
+        self.keystone.credentials['access'] = 'access-secret'
+        self.requests_mock.post('%s/v2.0/tokens' % self.TEST_AUTH_URI,
+                                json=self.keystone)
+        self.requests_mock.get(
+            re.compile('%s/v3/credentials/' % self.TEST_AUTH_URI),
+            json=self.keystone)
+        self.conf.update({'passwd': 'secret',
+                          'secret_cache_duration': '300',
+                          'admin_user': 'oss2swift',
+                          'admin_password': 'admin-secret',
+                          'admin_tenant_name': 'service'})
+        self.middleware = oss_token.OssToken(self.app, self.conf)
+
+    def _request(self, secret='access-secret', environ=None):
+        string_to_sign = 'GET\n\n\n%s\n/c/o' % time.time()
+        signature = base64.encodestring(
+            hmac.new(secret, string_to_sign, sha1).digest()).strip()
+        req = Request.blank('/v1/AUTH_cfa/c/o', environ=environ)
+        req.headers['Authorization'] = 'OSS access:%s' % signature
+        req.headers['X-Auth-Token'] = \
+            base64.urlsafe_b64encode(string_to_sign)
+        return req.get_response(self.middleware)
+
+    def test_admin_user_required(self):
+        del self.conf['admin_user']
+        self.assertRaises(ConfigFileError, oss_token.OssToken, self.app,
+                          self.conf)
+
+    def test_secret_cached(self):
+        self.assertEqual(self._request().status_int, 200)
+        self.assertEqual(self._request().status_int, 200)
+        self.assertEqual(self.keystone.credential_calls, 1)
+        # the service token and the token of the user
+        self.assertEqual(self.keystone.calls, 2)
+        cached, = self.middleware._secret_cache._entries.values()
+        self.assertNotIn('access-secret', repr(cached))
+
+    def test_secret_not_shared_password(self):
+        self.assertEqual(self._request('secret').status_int, 401)
+
+    def test_secret_rotated(self):
+        self.assertEqual(self._request().status_int, 200)
+        self.keystone.credentials['access'] = 'new-secret'
+        self.assertEqual(self._request('new-secret').status_int, 200)
+        self.assertEqual(self._request('new-secret').status_int, 200)
+        self.assertEqual(self._request().status_int, 401)
+        self.assertEqual(self.keystone.credential_calls, 3)
+
+    def test_secret_revoked(self):
+        self.assertEqual(self._request().status_int, 200)
+        del self.keystone.credentials['access']
+        self.assertEqual(self._request('other').status_int, 401)
+        self.assertEqual(len(self.middleware._secret_cache), 0)
+        self.assertEqual(self._request().status_int, 401)
+
+    def test_secret_memcache(self):
+        memcache = FakeMemcache()
+        self._request(environ={'swift.cache': memcache})
+        # without a shared key, the secrets stay in the worker
+        self.assertEqual(len(self.middleware._secret_cache), 1)
+        self.assertFalse([k for k in memcache.store
+                          if k.startswith('oss2swift/secret/')])
+
+        self.conf['secret_cache_key'] = 'shared'
+        self.middleware = oss_token.OssToken(self.app, self.conf)
+        self._request(environ={'swift.cache': memcache})
+        self.assertEqual(self.keystone.credential_calls, 2)
+        # another worker
+        self.middleware = oss_token.OssToken(self.app, self.conf)
+        resp = self._request(environ={'swift.cache': memcache})
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(self.keystone.credential_calls, 2)
+
+    def test_encrypt_secret(self):
+        value = oss_token.encrypt_secret('key', 'access-secret')
+        self.assertNotEqual(value, oss_token.encrypt_secret('key',
+                                                            'access-secret'))
+        self.assertEqual(oss_token.decrypt_secret('key', value),
+                         'access-secret')
+        self.assertIsNone(oss_token.decrypt_secret('other', value))
+        self.assertIsNone(oss_token.decrypt_secret('key', value[:-4]))
+        self.assertIsNone(oss_token.decrypt_secret('key', 'garbage'))
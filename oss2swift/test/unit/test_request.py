@@ -13,15 +13,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import base64
 from contextlib import nested
+import hashlib
+from eventlet import GreenPool, sleep
 from mock import patch, MagicMock
+import time
 import unittest
 
+from oss2swift.acl_handlers import ACL_CACHE
 from oss2swift.cfg import CONF
 from oss2swift.request import OssAclRequest, Request, X_OSS_DATE_FORMAT2, X_OSS_DATE_FORMAT
+from oss2swift.request import AUTH_FAILURE_CACHE, IDENTITY_CACHE, \
+    NOT_FOUND_CACHE, PRESIGNED_URL_CACHE
 from oss2swift.request import Request as Oss_Request
 from oss2swift.response import InvalidArgument, NoSuchBucket, InternalError, \
-    AccessDenied, SignatureDoesNotMatch
+    AccessDenied, SignatureDoesNotMatch, NoSuchKey, InvalidDigest
 from oss2swift.subresource import ACL, User, Owner, Grant, encode_acl
 from oss2swift.test.unit.test_middleware import Oss2swiftTestCase
 from oss2swift.utils import mktime
@@ -73,7 +80,8 @@ class FakeResponse(object):
 
 
 class FakeSwiftResponse(object):
-    def __init__(self):
+    def __init__(self, status_int=200):
+        self.status_int = status_int
         self.environ = {
             'PATH_INFO': '/v1/AUTH_test',
             'HTTP_X_TENANT_NAME': 'test',
@@ -113,6 +121,27 @@ class TestRequest(Oss2swiftTestCase):
             return mock_get_resp, m_check_permission,\
                 oss_req.get_response(self.oss2swift)
 
+    @patch('oss2swift.cfg.CONF.acl_cache_ttl', 10)
+    @patch('oss2swift.request.OssAclRequest.authenticate', lambda x, y: None)
+    def test_acl_cache_invalidated_by_writes(self):
+        req = Request.blank('/bucket/object',
+                            environ={'REQUEST_METHOD': 'PUT'},
+                            headers={'Authorization': 'OSS test:tester:hmac',
+                                     'Date': self.get_date_header()})
+        oss_req = OssAclRequest(req.environ, MagicMock())
+        oss_req.account = 'AUTH_test'
+        ACL_CACHE.set({}, 'AUTH_test/bucket/object', {})
+        ACL_CACHE.set({}, 'AUTH_test/bucket/', {})
+        with patch('oss2swift.request.Request._get_response'):
+            oss_req._get_response(self.oss2swift, 'HEAD', None, None)
+            self.assertEqual(
+                ACL_CACHE.get({}, 'AUTH_test/bucket/object'), {})
+            oss_req._get_response(self.oss2swift, None, None, None)
+            self.assertIsNone(ACL_CACHE.get({}, 'AUTH_test/bucket/object'))
+            self.assertEqual(ACL_CACHE.get({}, 'AUTH_test/bucket/'), {})
+            oss_req._get_response(self.oss2swift, 'POST', None, '')
+            self.assertIsNone(ACL_CACHE.get({}, 'AUTH_test/bucket/'))
+
     def test_get_response_without_oss_acl(self):
         with patch('oss2swift.cfg.CONF.oss_acl', False):
             mock_get_resp, m_check_permission, oss_resp = \
@@ -235,6 +264,339 @@ class TestRequest(Oss2swiftTestCase):
             self.assertTrue('Authorization' in oss_req.headers)
            # self.assertEqual(oss_req.token, 'token')
 
+    @patch('oss2swift.cfg.CONF.identity_cache_ttl', 60)
+    def test_authenticate_cached_identity(self):
+        IDENTITY_CACHE.local.clear()
+        date = self.get_date_header()
+
+        def authenticate(signature):
+            req = Request.blank(
+                '/bucket/obj', environ={'REQUEST_METHOD': 'GET'},
+                headers={'Authorization': 'OSS test:tester:' + signature,
+                         'Date': date})
+            return OssAclRequest(req.environ, MagicMock())
+
+        with nested(patch.object(Request, 'get_response'),
+                    patch.object(Request, 'remote_user', 'authorized')) \
+                as (m_swift_resp, m_remote_user):
+            m_swift_resp.return_value = FakeSwiftResponse()
+            authenticate('hmac')
+            oss_req = authenticate('hmac')
+            self.assertEqual(m_swift_resp.call_count, 1)
+            self.assertEqual(oss_req.account, 'AUTH_test')
+            self.assertEqual(oss_req.user_id, 'test:tester')
+            self.assertEqual(oss_req.token, 'token')
+            self.assertNotIn('Authorization', oss_req.headers)
+
+            # a different signature is authenticated again
+            authenticate('other')
+            self.assertEqual(m_swift_resp.call_count, 2)
+
+    @patch('oss2swift.cfg.CONF.auth_failure_cache_ttl', 60)
+    def test_authenticate_failure_damped(self):
+        AUTH_FAILURE_CACHE.local.clear()
+        date = self.get_date_header()
+
+        def authenticate(client='127.0.0.1', forwarded_for=None):
+            req = Request.blank(
+                '/bucket/obj', environ={'REQUEST_METHOD': 'GET',
+                                        'REMOTE_ADDR': client},
+                headers={'Authorization': 'OSS test:tester:hmac',
+                         'Date': date})
+            if forwarded_for:
+                req.headers['X-Forwarded-For'] = forwarded_for
+            return OssAclRequest(req.environ, MagicMock())
+
+        with nested(patch.object(Request, 'get_response'),
+                    patch.object(Request, 'remote_user', None)) \
+                as (m_swift_resp, m_remote_user):
+            m_swift_resp.return_value = FakeSwiftResponse(401)
+            with patch('oss2swift.cache.time', return_value=100):
+                self.assertRaises(SignatureDoesNotMatch, authenticate)
+                # rejected for a second without asking the auth middleware
+                self.assertRaises(SignatureDoesNotMatch, authenticate)
+                self.assertEqual(m_swift_resp.call_count, 1)
+                # even if it claims to forward another client
+                self.assertRaises(SignatureDoesNotMatch, authenticate,
+                                  forwarded_for='10.0.0.1')
+                self.assertEqual(m_swift_resp.call_count, 1)
+                # but not from other clients
+                self.assertRaises(SignatureDoesNotMatch, authenticate,
+                                  '10.0.0.1')
+                self.assertEqual(m_swift_resp.call_count, 2)
+            with patch('oss2swift.cache.time', return_value=101):
+                self.assertRaises(SignatureDoesNotMatch, authenticate)
+                self.assertEqual(m_swift_resp.call_count, 3)
+            # twice as long after the second failure
+            with patch('oss2swift.cache.time', return_value=102.5):
+                self.assertRaises(SignatureDoesNotMatch, authenticate)
+                self.assertEqual(m_swift_resp.call_count, 3)
+            with patch('oss2swift.cache.time', return_value=103):
+                with patch.object(Request, 'remote_user', 'authorized'):
+                    authenticate()
+                self.assertEqual(m_swift_resp.call_count, 4)
+                self.assertIsNone(AUTH_FAILURE_CACHE.get(
+                    {}, 'test:tester\n127.0.0.1'))
+
+    @patch('oss2swift.cfg.CONF.auth_failure_cache_ttl', 60)
+    @patch('oss2swift.cfg.CONF.auth_failure_trusted_proxies', '10.0.0.9')
+    def test_authenticate_failure_behind_trusted_proxy(self):
+        AUTH_FAILURE_CACHE.local.clear()
+        req = Request.blank(
+            '/bucket/obj', environ={'REQUEST_METHOD': 'GET',
+                                    'REMOTE_ADDR': '10.0.0.9'},
+            headers={'Authorization': 'OSS test:tester:hmac',
+                     'X-Forwarded-For': '1.2.3.4, 10.0.0.1',
+                     'Date': self.get_date_header()})
+        with nested(patch.object(Request, 'get_response'),
+                    patch.object(Request, 'remote_user', None)) \
+                as (m_swift_resp, m_remote_user):
+            m_swift_resp.return_value = FakeSwiftResponse(401)
+            self.assertRaises(SignatureDoesNotMatch, OssAclRequest,
+                              req.environ, MagicMock())
+        self.assertTrue(AUTH_FAILURE_CACHE.get(
+            {}, 'test:tester\n10.0.0.1'))
+
+    @patch('oss2swift.cfg.CONF.auth_failure_cache_ttl', 60)
+    def test_authenticate_auth_error_not_damped(self):
+        AUTH_FAILURE_CACHE.local.clear()
+        req = Request.blank(
+            '/bucket/obj', environ={'REQUEST_METHOD': 'GET'},
+            headers={'Authorization': 'OSS test:tester:hmac',
+                     'Date': self.get_date_header()})
+        with nested(patch.object(Request, 'get_response'),
+                    patch.object(Request, 'remote_user', None)) \
+                as (m_swift_resp, m_remote_user):
+            # e.g. Keystone is unavailable
+            m_swift_resp.return_value = FakeSwiftResponse(503)
+            self.assertRaises(SignatureDoesNotMatch, OssAclRequest,
+                              req.environ, MagicMock())
+        self.assertEqual(len(AUTH_FAILURE_CACHE.local), 0)
+
+    def test_get_response_coalesced(self):
+        def app(env, start_response):
+            sleep(0.01)
+            return self.app(env, start_response)
+
+        def head(headers=None, method='HEAD', obj=''):
+            req = Request.blank(
+                '/bucket', environ={'REQUEST_METHOD': 'GET'},
+                headers={'Authorization': 'OSS test:tester:hmac',
+                         'Date': self.get_date_header()})
+            oss_req = Oss_Request(req.environ)
+            return oss_req._get_response(app, method, 'bucket', obj,
+                                         headers=headers)
+
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket/object',
+                            swob.HTTPOk, {'Content-Length': '5'}, None)
+        pool = GreenPool()
+        threads = [pool.spawn(head) for _ in range(3)] + \
+            [pool.spawn(head, {'X-Newest': 'true'}),
+             pool.spawn(head, obj='object'), pool.spawn(head, obj='object'),
+             pool.spawn(head, method='PUT'), pool.spawn(head, method='PUT')]
+        resps = [thread.wait() for thread in threads]
+        self.assertEqual([resp.status_int for resp in resps],
+                         [204] * 4 + [200] * 2 + [201] * 2)
+        self.assertEqual(resps[4].headers['Content-Length'], '5')
+        self.assertEqual(resps[1].environ['PATH_INFO'],
+                         '/v1/AUTH_test/bucket')
+        # the container checks of the object HEADs were coalesced too
+        self.assertEqual(sorted(self.swift.calls), [
+            ('HEAD', '/v1/AUTH_test/bucket'),
+            ('HEAD', '/v1/AUTH_test/bucket'),
+            ('HEAD', '/v1/AUTH_test/bucket/object'),
+            ('PUT', '/v1/AUTH_test/bucket'),
+            ('PUT', '/v1/AUTH_test/bucket')])
+
+        # without coalescing
+        with patch('oss2swift.cfg.CONF.coalesce_max_wait', 0):
+            for thread in [pool.spawn(head) for _ in range(2)]:
+                thread.wait()
+        self.assertEqual(len(self.swift.calls), 7)
+
+    def test_get_response_coalesced_environ(self):
+        def app(env, start_response):
+            sleep(0.01)
+            env['REMOTE_USER'] = 'test:tester'
+            env['keystone.token_info'] = {'token': {}}
+            env['swift.container/AUTH_test/bucket'] = {'status': 204}
+            return self.app(env, start_response)
+
+        def head():
+            req = Request.blank(
+                '/bucket', environ={'REQUEST_METHOD': 'GET'},
+                headers={'Authorization': 'OSS test:tester:hmac',
+                         'Date': self.get_date_header()})
+            oss_req = Oss_Request(req.environ)
+            return oss_req._get_response(app, 'HEAD', 'bucket', '')
+
+        pool = GreenPool()
+        resps = [thread.wait() for thread in
+                 [pool.spawn(head) for _ in range(3)]]
+        self.assertEqual(len(self.swift.calls), 1)
+        # the container info is shared, not the identity of the caller
+        for resp in resps:
+            self.assertEqual(
+                resp.environ['swift.container/AUTH_test/bucket'],
+                {'status': 204})
+        self.assertEqual(
+            len([r for r in resps if 'REMOTE_USER' in r.environ]), 1)
+        self.assertEqual(
+            len([r for r in resps if 'keystone.token_info' in r.environ]), 1)
+
+    @patch('oss2swift.cfg.CONF.not_found_cache_ttl', 10)
+    def test_get_response_not_found_cached(self):
+        NOT_FOUND_CACHE.local.clear()
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket/missing',
+                            swob.HTTPNotFound, {}, None)
+        self.swift.register('PUT', '/v1/AUTH_test/bucket/missing',
+                            swob.HTTPCreated, {}, None)
+        req = Request.blank(
+            '/bucket', environ={'REQUEST_METHOD': 'GET'},
+            headers={'Authorization': 'OSS test:tester:hmac',
+                     'Date': self.get_date_header()})
+        oss_req = Oss_Request(req.environ)
+        for _ in range(2):
+            self.assertRaises(NoSuchKey, oss_req._get_response, self.app,
+                              'HEAD', 'bucket', 'missing')
+        self.assertEqual(self.swift.calls, [
+            ('HEAD', '/v1/AUTH_test/bucket'),
+            ('HEAD', '/v1/AUTH_test/bucket/missing')])
+        self.assertEqual(NOT_FOUND_CACHE.local.get('AUTH_test/bucket/missing'),
+                         True)
+
+        # the PUT forgets it
+        oss_req._get_response(self.app, 'PUT', 'bucket', 'missing')
+        self.assertEqual(len(NOT_FOUND_CACHE.local), 0)
+        self.swift.register('HEAD', '/v1/AUTH_test/bucket/missing',
+                            swob.HTTPOk, {}, None)
+        self.assertEqual(oss_req._get_response(
+            self.app, 'HEAD', 'bucket', 'missing').status_int, 200)
+
+    @patch('oss2swift.cfg.CONF.presigned_url_cache_ttl', 3600)
+    def test_authenticate_presigned_url_cached(self):
+        PRESIGNED_URL_CACHE.local.clear()
+        expires = int(time.time()) + 1000
+
+        def authenticate(signature='hmac', headers=None):
+            req = Request.blank(
+                '/bucket/obj?OSSAccessKeyId=test:tester&Expires=%d'
+                '&Signature=%s' % (expires, signature),
+                environ={'REQUEST_METHOD': 'GET'}, headers=headers)
+            return OssAclRequest(req.environ, MagicMock())
+
+        with nested(patch.object(Request, 'get_response'),
+                    patch.object(Request, 'remote_user', 'authorized')) \
+                as (m_swift_resp, m_remote_user):
+            m_swift_resp.return_value = FakeSwiftResponse()
+            oss_req = authenticate()
+            token = base64.urlsafe_b64encode(oss_req._string_to_sign())
+            with patch.object(OssAclRequest, '_string_to_sign') as m_sign:
+                oss_req = authenticate()
+                self.assertFalse(m_sign.called)
+            self.assertEqual(m_swift_resp.call_count, 1)
+            self.assertEqual(oss_req.account, 'AUTH_test')
+            self.assertEqual(oss_req.user_id, 'test:tester')
+            self.assertEqual(oss_req.token, 'token')
+            self.assertNotIn('Authorization', oss_req.headers)
+            self.assertEqual(PRESIGNED_URL_CACHE.local.get(
+                oss_req._presigned_url_cache_key())['signed_token'], token)
+
+            # anything in the string to sign makes another URL
+            authenticate('other')
+            authenticate(headers={'Content-Type': 'text/plain'})
+            authenticate(headers={'x-oss-meta-a': 'b'})
+            self.assertEqual(m_swift_resp.call_count, 4)
+
+        # cached until the URL expires
+        with patch('oss2swift.cache.time', return_value=expires):
+            self.assertIsNone(PRESIGNED_URL_CACHE.local.get(
+                oss_req._presigned_url_cache_key()))
+
+    def _authenticate_presigned_url(self, expires, token_expires=None):
+        req = Request.blank(
+            '/bucket/obj?OSSAccessKeyId=test:tester&Expires=%d'
+            '&Signature=hmac' % expires, environ={'REQUEST_METHOD': 'GET'})
+        sw_resp = FakeSwiftResponse()
+        if token_expires:
+            sw_resp.environ['keystone.token_info'] = {'token': {
+                'expires_at': time.strftime('%Y-%m-%dT%H:%M:%S.000000Z',
+                                            time.gmtime(token_expires))}}
+        with nested(patch.object(Request, 'get_response'),
+                    patch.object(Request, 'remote_user', 'authorized')) \
+                as (m_swift_resp, m_remote_user):
+            m_swift_resp.return_value = sw_resp
+            return OssAclRequest(req.environ, MagicMock())
+
+    @patch('oss2swift.cfg.CONF.presigned_url_cache_ttl', 3600)
+    @patch('oss2swift.cfg.CONF.identity_cache_ttl', 3600)
+    def test_authenticate_presigned_url_token_expires(self):
+        PRESIGNED_URL_CACHE.local.clear()
+        IDENTITY_CACHE.local.clear()
+        now = int(time.time())
+        # the Keystone token expires before the URL
+        oss_req = self._authenticate_presigned_url(now + 1000, now + 100)
+        url_key = oss_req._presigned_url_cache_key()
+        identity_key = oss_req.identity_cache_keys[0][1]
+        self.assertIsNotNone(PRESIGNED_URL_CACHE.local.get(url_key))
+        self.assertIsNotNone(IDENTITY_CACHE.local.get(identity_key))
+        with patch('oss2swift.cache.time', return_value=now + 100):
+            self.assertIsNone(PRESIGNED_URL_CACHE.local.get(url_key))
+            self.assertIsNone(IDENTITY_CACHE.local.get(identity_key))
+
+    @patch('oss2swift.cfg.CONF.presigned_url_cache_ttl', 3600)
+    @patch('oss2swift.cfg.CONF.identity_cache_ttl', 3600)
+    def test_rejected_token_forgets_presigned_url(self):
+        PRESIGNED_URL_CACHE.local.clear()
+        IDENTITY_CACHE.local.clear()
+        oss_req = self._authenticate_presigned_url(int(time.time()) + 1000)
+        url_key = oss_req._presigned_url_cache_key()
+        identity_key = oss_req.identity_cache_keys[0][1]
+        self.assertIsNotNone(PRESIGNED_URL_CACHE.local.get(url_key))
+
+        # e.g. the token was revoked
+        self.swift.register('GET', '/v1/AUTH_test/bucket/obj',
+                            swob.HTTPUnauthorized, {}, None)
+        self.assertRaises(SignatureDoesNotMatch, oss_req._get_response,
+                          self.swift, 'GET', 'bucket', 'obj')
+        self.assertIsNone(PRESIGNED_URL_CACHE.local.get(url_key))
+        self.assertIsNone(IDENTITY_CACHE.local.get(identity_key))
+
+    def _put_request(self, body, headers=None):
+        headers = dict(headers or {}, Authorization='OSS test:tester:hmac',
+                       Date=self.get_date_header())
+        req = Request.blank('/bucket/object',
+                            environ={'REQUEST_METHOD': 'PUT'},
+                            headers=headers, body=body)
+        return Oss_Request(req.environ)
+
+    @patch('oss2swift.request.PUT_FOOTERS_SUPPORTED', True)
+    def test_digest_input_crc64_footer(self):
+        oss_req = self._put_request('hello')
+        digest = oss_req.digest_input(crc64_footer=True)
+        self.assertEqual(oss_req.environ['wsgi.input'].read(), 'hello')
+        footers = {}
+        oss_req.environ['swift.callback.update_footers'](footers)
+        self.assertEqual(footers['X-Object-Meta-Hash-Crc64ecma'],
+                         str(digest.crc64))
+        self.assertNotIn('X-Object-Meta-Hash-Crc64ecma', oss_req.headers)
+
+    @patch('oss2swift.request.PUT_FOOTERS_SUPPORTED', False)
+    def test_digest_input_crc64_header(self):
+        # Swift before 2.9.0 ignores the footers
+        oss_req = self._put_request('hello')
+        digest = oss_req.digest_input(crc64_footer=True)
+        self.assertEqual(oss_req.headers['X-Object-Meta-Hash-Crc64ecma'],
+                         str(digest.crc64))
+        self.assertEqual(digest.bytes_read, 5)
+        self.assertEqual(oss_req.environ['wsgi.input'].read(), 'hello')
+        self.assertNotIn('swift.callback.update_footers', oss_req.environ)
+
+        content_md5 = hashlib.md5('world').digest().encode('base64').strip()
+        oss_req = self._put_request('hello', {'Content-MD5': content_md5})
+        self.assertRaises(InvalidDigest, oss_req.digest_input,
+                          crc64_footer=True)
+
     def test_to_swift_req_Authorization_not_exist_in_swreq_headers(self):
         container = 'bucket'
         obj = 'obj'
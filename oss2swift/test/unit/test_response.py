@@ -28,6 +28,27 @@ class TestRequest(unittest.TestCase):
                 ossresp = OssResponse.from_swift_resp(resp)
                 self.assertEqual(expected, ossresp.is_slo)
 
+    def test_from_swift_resp_segmented_etag(self):
+        resp = Response(headers={
+            'Etag': '"slo-etag"',
+            'X-Object-Sysmeta-Oss2swift-Etag': 'body-md5'})
+        ossresp = OssResponse.from_swift_resp(resp)
+        self.assertEqual(ossresp.headers['ETag'], 'body-md5')
+
+        resp = Response(headers={'Etag': 'etag'})
+        ossresp = OssResponse.from_swift_resp(resp)
+        self.assertEqual(ossresp.headers['ETag'], 'etag')
+
+    def test_from_swift_resp_transient_sysmeta(self):
+        resp = Response(headers={
+            'X-Object-Transient-Sysmeta-Oss2swift-Acl': 'public-read'})
+        ossresp = OssResponse.from_swift_resp(resp)
+        self.assertEqual(
+            ossresp.sysmeta_headers['x-object-transient-sysmeta-oss2swift-acl'],
+            'public-read')
+        self.assertNotIn('x-object-transient-sysmeta-oss2swift-acl',
+                         ossresp.headers)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,94 @@
+# Copyright (c) 2014 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from eventlet import GreenPool, Timeout, sleep
+from mock import patch
+
+from oss2swift.single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.flight = SingleFlight('test', 'coalesce_max_wait')
+        self.calls = []
+
+    def _func(self, result, delay=0.01):
+        def func():
+            self.calls.append(result)
+            sleep(delay)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return func
+
+    def _run(self, *calls):
+        pool = GreenPool()
+        threads = [pool.spawn(self.flight.do, key, func)
+                   for key, func in calls]
+        return [thread.wait() for thread in threads]
+
+    def test_coalesced(self):
+        results = self._run(*[('a', self._func(i)) for i in range(5)] +
+                            [('b', self._func('b'))])
+        self.assertEqual(results, [0, 0, 0, 0, 0, 'b'])
+        self.assertEqual(self.calls, [0, 'b'])
+        self.assertEqual((self.flight.calls, self.flight.coalesced), (2, 4))
+        self.assertEqual(len(self.flight), 0)
+
+        # one after the other
+        self._run(('a', self._func(1)))
+        self.assertEqual(self.calls, [0, 'b', 1])
+
+    def test_exception(self):
+        error = ValueError('failed')
+        pool = GreenPool()
+        threads = [pool.spawn(self.flight.do, 'a', self._func(error)),
+                   pool.spawn(self.flight.do, 'a', self._func(1))]
+        for thread in threads:
+            self.assertRaises(ValueError, thread.wait)
+        self.assertEqual(self.calls, [error])
+
+    @patch('oss2swift.cfg.CONF.coalesce_max_wait', 0.01)
+    def test_max_wait(self):
+        results = self._run(('a', self._func(0, delay=0.05)),
+                            ('a', self._func(1)))
+        self.assertEqual(results, [0, 1])
+        self.assertEqual(self.calls, [0, 1])
+        self.assertEqual(self.flight.coalesced, 0)
+
+    def test_abandoned(self):
+        def killed():
+            with Timeout(0.01, False):
+                self.flight.do('a', self._func(0, delay=0.05))
+            return 'killed'
+
+        pool = GreenPool()
+        threads = [pool.spawn(killed),
+                   pool.spawn(self.flight.do, 'a', self._func(1))]
+        self.assertEqual([thread.wait() for thread in threads],
+                         ['killed', 1])
+        self.assertEqual(self.calls, [0, 1])
+        self.assertEqual(len(self.flight), 0)
+
+    @patch('oss2swift.cfg.CONF.coalesce_max_wait', 0)
+    def test_disabled(self):
+        self._run(('a', self._func(0)), ('a', self._func(1)))
+        self.assertEqual(self.calls, [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,281 @@
+# Copyright (c) 2014 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from urllib import unquote
+
+from oss2swift import upload_gc
+from swift.common.internal_client import UnexpectedResponse
+from swift.common.swob import Response
+from swift.common.utils import Timestamp
+
+from mock import patch
+
+
+def _last_modified(age):
+    return Timestamp(time.time() - age).isoformat
+
+
+class FakeInternalClient(object):
+    def __init__(self, containers, metadata=None):
+        # {container: {name: (bytes, last_modified)}}
+        self.containers = containers
+        self.metadata = metadata or {}
+        self.calls = []
+
+    def make_path(self, account, container=None, obj=None):
+        return '/v1/%s' % account
+
+    def iter_containers(self, account, marker='', end_marker=''):
+        for name in sorted(self.containers):
+            yield {'name': name.decode('utf8')}
+
+    def iter_objects(self, account, container, marker='', end_marker=''):
+        for name, (size, last_modified) in \
+                sorted(self.containers.get(container, {}).items()):
+            if name <= marker or (end_marker and name >= end_marker):
+                continue
+            yield {'name': name.decode('utf8'), 'bytes': size,
+                   'last_modified': last_modified}
+
+    def get_container_metadata(self, account, container, metadata_prefix='',
+                               acceptable_statuses=(2,)):
+        return self.metadata.get(container, {})
+
+    def get_object_metadata(self, account, container, obj,
+                            acceptable_statuses=(2,)):
+        if obj not in self.containers.get(container, {}):
+            raise UnexpectedResponse('Unexpected response: 404',
+                                     Response(status=404))
+        return self.metadata.get('%s/%s' % (container, obj), {})
+
+    def delete_object(self, account, container, obj):
+        self.calls.append(('DELETE', container, obj))
+        self.containers[container].pop(obj, None)
+
+    def make_request(self, method, path, headers, acceptable_statuses,
+                     body_file=None):
+        names = [unquote(line) for line in body_file.read().split('\n')]
+        self.calls.append((method, path, names))
+        deleted = 0
+        for name in names:
+            container, obj = name.lstrip('/').split('/', 1)
+            if self.containers[container].pop(obj, None) is not None:
+                deleted += 1
+        body = json.dumps({'Number Deleted': deleted, 'Errors': [],
+                           'Response Status': '200 OK'})
+        return Response(body=body)
+
+
+class FakeLogger(object):
+    def __init__(self):
+        self.stats = {}
+
+    def increment(self, metric):
+        self.update_stats(metric, 1)
+
+    def update_stats(self, metric, amount):
+        self.stats[metric] = self.stats.get(metric, 0) + amount
+
+    def info(self, *args, **kwargs):
+        pass
+
+    warning = exception = info
+
+
+class TestUploadGC(unittest.TestCase):
+    def setUp(self):
+        self.testdir = tempfile.mkdtemp()
+        self.conf = {
+            'accounts': 'AUTH_test',
+            'max_upload_age': '3600',
+            'objects_per_second': '0',
+            'checkpoint_file': os.path.join(self.testdir, 'checkpoint.json'),
+        }
+        old = _last_modified(7200)
+        new = _last_modified(60)
+        self.swift = FakeInternalClient({
+            'bucket': {'stale': (10, old)},
+            'bucket+segments': {
+                'stale/X': (0, old),
+                'stale/X/1': (5, old),
+                'stale/X/2': (3, old),
+                'fresh/Y': (0, new),
+                'fresh/Y/1': (5, new),
+                # segments of a completed upload
+                'done/Z/1': (7, old),
+            }})
+        self.logger = FakeLogger()
+
+    def tearDown(self):
+        shutil.rmtree(self.testdir, ignore_errors=True)
+
+    def _gc(self, **conf):
+        self.conf.update(conf)
+        return upload_gc.UploadGC(self.conf, logger=self.logger,
+                                  swift=self.swift)
+
+    def test_reclaim_stale_upload(self):
+        gc = self._gc()
+        gc.run_once()
+        self.assertEqual(sorted(self.swift.containers['bucket+segments']),
+                         ['done/Z/1', 'fresh/Y', 'fresh/Y/1'])
+        self.assertEqual(self.swift.containers['bucket'].keys(), ['stale'])
+        self.assertEqual(gc.stats, {'uploads': 1, 'objects': 3, 'bytes': 8,
+                                    'errors': 0})
+        self.assertEqual(self.logger.stats,
+                         {'uploads': 1, 'objects': 3, 'bytes': 8})
+        # parts are removed before the marker
+        self.assertEqual(self.swift.calls, [
+            ('POST', '/v1/AUTH_test?bulk-delete',
+             ['/bucket+segments/stale/X/1', '/bucket+segments/stale/X/2']),
+            ('POST', '/v1/AUTH_test?bulk-delete',
+             ['/bucket+segments/stale/X'])])
+
+    def test_reclaim_upload_index(self):
+        old = _last_modified(7200)
+        self.swift.containers['bucket+uploads'] = {'indexed/W': (0, old)}
+        self.swift.containers['bucket+segments']['indexed/W/1'] = (4, old)
+        gc = self._gc()
+        gc.run_once()
+        self.assertEqual(self.swift.containers['bucket+uploads'], {})
+        self.assertEqual(sorted(self.swift.containers['bucket+segments']),
+                         ['done/Z/1', 'fresh/Y', 'fresh/Y/1'])
+        self.assertEqual(gc.stats, {'uploads': 2, 'objects': 5, 'bytes': 12,
+                                    'errors': 0})
+        self.assertEqual(self.swift.calls[-2:], [
+            ('POST', '/v1/AUTH_test?bulk-delete',
+             ['/bucket+segments/indexed/W/1']),
+            ('POST', '/v1/AUTH_test?bulk-delete',
+             ['/bucket+uploads/indexed/W'])])
+
+    def test_reclaim_sharded_upload(self):
+        old = _last_modified(7200)
+        self.swift.containers['bucket+uploads'] = {'sharded/V': (0, old)}
+        self.swift.containers['bucket+2+segments'] = {
+            'sharded/V/00001': (6, old),
+            # the shards are not scanned for markers
+            'orphan/U': (0, old)}
+        self.swift.metadata['bucket+uploads/sharded/V'] = {
+            'x-object-sysmeta-oss2swift-segments-container':
+            'bucket+2+segments'}
+        gc = self._gc()
+        gc.run_once()
+        self.assertEqual(self.swift.containers['bucket+uploads'], {})
+        self.assertEqual(self.swift.containers['bucket+2+segments'].keys(),
+                         ['orphan/U'])
+        self.assertEqual(gc.stats['uploads'], 2)
+        self.assertEqual(gc.stats['bytes'], 14)
+
+    def test_bulk_delete_size(self):
+        gc = self._gc(bulk_delete_size='1')
+        gc.run_once()
+        self.assertEqual([len(c[2]) for c in self.swift.calls], [1, 1, 1])
+
+    def test_single_delete(self):
+        gc = self._gc(bulk_delete_size='0')
+        gc.run_once()
+        self.assertEqual(self.swift.calls, [
+            ('DELETE', 'bucket+segments', 'stale/X/1'),
+            ('DELETE', 'bucket+segments', 'stale/X/2'),
+            ('DELETE', 'bucket+segments', 'stale/X')])
+        self.assertEqual(gc.stats['objects'], 3)
+
+    def test_lifecycle_abort_rule(self):
+        rule = {'ruleId': 'r1', 'rulePrefix': 'fr', 'ruleStatus': 'Enabled',
+                'expireDay': '', 'createDate': '', 'abortDay': '1'}
+        self.swift.metadata['bucket'] = {'rules': 'r1:fr', 'r1': str(rule)}
+        # neither upload is older than a day
+        gc = self._gc(max_upload_age='0')
+        gc.run_once()
+        self.assertEqual(self.swift.calls, [])
+
+        self.swift.containers['bucket+segments']['fresh/Y'] = \
+            (0, _last_modified(2 * 86400))
+        gc.run_once()
+        self.assertEqual(sorted(self.swift.containers['bucket+segments']),
+                         ['done/Z/1', 'stale/X', 'stale/X/1', 'stale/X/2'])
+
+    def test_disabled_lifecycle_rule(self):
+        rule = {'ruleId': 'r1', 'rulePrefix': '', 'ruleStatus': 'Disabled',
+                'expireDay': '', 'createDate': '', 'abortDay': '1'}
+        self.swift.metadata['bucket'] = {'rules': 'r1:', 'r1': str(rule)}
+        gc = self._gc(max_upload_age='0')
+        gc.run_once()
+        self.assertEqual(self.swift.calls, [])
+
+    def test_checkpoint_resume(self):
+        gc = self._gc()
+        gc.save_checkpoint('AUTH_test', 'bucket+segments', 'stale/X')
+        gc.run_once()
+        # the upload before the checkpoint is skipped and the checkpoint is
+        # dropped at the end of the pass
+        self.assertEqual(self.swift.calls, [])
+        self.assertFalse(os.path.exists(self.conf['checkpoint_file']))
+        gc.run_once()
+        self.assertEqual(gc.stats['uploads'], 1)
+
+    def test_checkpoint_saved(self):
+        gc = self._gc(checkpoint_interval='1')
+        with patch.object(gc, 'clear_checkpoint'):
+            gc.run_once()
+        with open(self.conf['checkpoint_file']) as f:
+            self.assertEqual(json.load(f), {'account': 'AUTH_test',
+                                            'container': 'bucket+segments',
+                                            'marker': 'stale/X'})
+
+    def test_completed_upload_skipped(self):
+        gc = self._gc()
+        # Complete removed the marker after the container was listed
+        gc.reclaim_upload('AUTH_test', 'bucket', 'bucket+segments', 'done/Z')
+        self.assertEqual(self.swift.calls, [])
+        self.assertIn('done/Z/1', self.swift.containers['bucket+segments'])
+        self.assertEqual(gc.stats['uploads'], 0)
+
+    def test_upload_completed_while_listing_parts(self):
+        iter_objects = self.swift.iter_objects
+
+        def complete_while_listing(account, container, **kwargs):
+            self.swift.containers['bucket+segments'].pop('stale/X', None)
+            return iter_objects(account, container, **kwargs)
+
+        gc = self._gc()
+        with patch.object(self.swift, 'iter_objects', complete_while_listing):
+            gc.reclaim_upload('AUTH_test', 'bucket', 'bucket+segments',
+                              'stale/X')
+        self.assertEqual(self.swift.calls, [])
+        self.assertEqual(sorted(self.swift.containers['bucket+segments']),
+                         ['done/Z/1', 'fresh/Y', 'fresh/Y/1', 'stale/X/1',
+                          'stale/X/2'])
+
+    def test_bulk_delete_error_keeps_marker(self):
+        def fake_bulk_delete(account, container, names):
+            raise Exception('boom')
+
+        gc = self._gc()
+        with patch.object(gc, 'bulk_delete', fake_bulk_delete):
+            gc.run_once()
+        self.assertIn('stale/X', self.swift.containers['bucket+segments'])
+        self.assertEqual(gc.stats['errors'], 1)
+        self.assertEqual(gc.stats['uploads'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
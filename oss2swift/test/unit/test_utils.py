@@ -19,6 +19,8 @@ import time
 import unittest
 
 from oss2swift import utils, request
+from oss2swift.response import Response as OssResponse
+from swift.common.swob import Response
 
 
 strs = [
@@ -133,6 +135,48 @@ class TestOss2swiftUtils(unittest.TestCase):
             os.environ['TZ'] = orig_tz
             time.tzset()
 
+    def test_metadata_post_headers(self):
+        resp = OssResponse.from_swift_resp(Response(headers={
+            'X-Object-Meta-Foo': 'bar',
+            'X-Object-Meta-Object-Type': 'Appendable',
+            'X-Object-Meta-Hash-Crc64ecma': '42',
+            'X-Object-Transient-Sysmeta-Oss2swift-Acl': 'public-read',
+            'X-Object-Sysmeta-Oss2swift-Append-Prefix': 'obj/X',
+            'X-Object-Sysmeta-Oss2swift-Acl': 'private'}))
+        headers = utils.metadata_post_headers(resp, 'bucket')
+        self.assertEqual(dict((k.lower(), v) for k, v in headers.items()), {
+            'x-object-meta-foo': 'bar',
+            'x-object-meta-object-type': 'Appendable',
+            'x-object-meta-hash-crc64ecma': '42',
+            'x-object-transient-sysmeta-oss2swift-acl': 'public-read',
+            'x-object-manifest': 'bucket%2Bsegments/obj/X/'})
+
+        headers = utils.metadata_post_headers(resp, 'bucket', user_meta=False)
+        self.assertNotIn('x-object-meta-foo', headers)
+        self.assertEqual(headers['x-object-meta-object-type'], 'Appendable')
+
+    def test_client_address(self):
+        env = {'REMOTE_ADDR': '10.0.0.9',
+               'HTTP_X_FORWARDED_FOR': '1.2.3.4, 5.6.7.8, 10.0.0.8'}
+        self.assertEqual(utils.client_address(env, []), '10.0.0.9')
+        self.assertEqual(utils.client_address(env, ['10.0.0.9']),
+                         '10.0.0.8')
+        self.assertEqual(
+            utils.client_address(env, ['10.0.0.9', '10.0.0.8']), '5.6.7.8')
+        self.assertEqual(
+            utils.client_address({'REMOTE_ADDR': '10.0.0.9'}, ['10.0.0.9']),
+            '10.0.0.9')
+
+    def test_keystone_expires(self):
+        v2 = {'access': {'token': {'expires': '2017-03-01T10:24:37Z'}}}
+        self.assertEqual(utils.keystone_expires(v2), 1488363877)
+        v3 = {'token': {'expires_at': '2017-03-01T10:24:37.154000Z'}}
+        self.assertEqual(utils.keystone_expires(v3), 1488363877)
+        self.assertIsNone(utils.keystone_expires({}))
+        self.assertIsNone(utils.keystone_expires({'token': {}}))
+        self.assertIsNone(
+            utils.keystone_expires({'token': {'expires_at': 'soon'}}))
+
 if __name__ == '__main__':
     unittest.main()
 
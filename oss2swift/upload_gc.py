@@ -0,0 +1,303 @@
+"""
+Garbage collector for abandoned multipart uploads.
+
+Initiate Multipart Upload leaves a marker object in the [bucket]+uploads
+container and every uploaded part in the [bucket]+segments container (see
+oss2swift.controllers.multi_upload).  If the client never completes or aborts
+the upload, those objects stay there forever.  This daemon scans the upload
+containers of the configured accounts and removes the uploads whose marker is
+older than max_upload_age, or older than the AbortMultipartUpload Days of a
+matching lifecycle rule on the bucket.  Markers of uploads initiated before
+[bucket]+uploads existed are looked up in [bucket]+segments.  The parts may
+be in any shard of the segments containers; the marker tells which one.
+
+Only uploads whose marker still exists are reclaimed; the parts of completed
+uploads are the segments of the SLO manifest and must never be touched.  The
+marker is checked again right before the parts are deleted, as Complete
+Multipart Upload may remove it while they are listed.  The parts are removed
+first and the marker last, so an interrupted pass leaves the upload visible
+and it is picked up again on the next one.
+"""
+
+import ast
+import json
+import os
+import re
+from random import random
+from StringIO import StringIO
+from time import time
+from urllib import quote
+
+from eventlet import sleep, Timeout
+from oss2swift.utils import MULTIUPLOAD_SUFFIX, MULTIUPLOAD_INDEX_SUFFIX, \
+    multiupload_bucket, mktime, sysmeta_header
+from swift.common.daemon import Daemon, run_daemon
+from swift.common.http import HTTP_NOT_FOUND
+from swift.common.internal_client import InternalClient, UnexpectedResponse
+from swift.common.utils import get_logger, list_from_csv, parse_options, \
+    ratelimit_sleep
+
+
+PART_PATTERN = re.compile('/[0-9]+$')
+SEGMENTS_CONTAINER_HEADER = sysmeta_header('object', 'segments-container')
+SECONDS_PER_DAY = 86400
+
+
+class UploadGC(Daemon):
+    """
+    Daemon that reclaims stale multipart uploads.
+
+    :param conf: The daemon configuration.
+    :param logger: Optional logger instance.
+    :param swift: Optional InternalClient instance.
+    """
+
+    def __init__(self, conf, logger=None, swift=None):
+        self.conf = conf
+        self.logger = logger or get_logger(conf,
+                                           log_route='oss2swift-upload-gc')
+        self.interval = int(conf.get('interval') or 3600)
+        self.accounts = list_from_csv(conf.get('accounts', ''))
+        self.max_upload_age = int(conf.get('max_upload_age', 604800))
+        self.objects_per_second = float(conf.get('objects_per_second', 100))
+        self.bulk_delete_size = int(conf.get('bulk_delete_size', 1000))
+        self.checkpoint_file = conf.get(
+            'checkpoint_file', '/var/cache/swift/oss2swift-upload-gc.json')
+        self.checkpoint_interval = int(conf.get('checkpoint_interval', 100))
+        if swift is None:
+            conf_path = conf.get('__file__') or \
+                '/etc/swift/oss2swift-upload-gc.conf'
+            request_tries = int(conf.get('request_tries') or 3)
+            swift = InternalClient(conf_path, 'Oss2swift Upload GC',
+                                   request_tries)
+        self.swift = swift
+        self._running_time = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'uploads': 0, 'objects': 0, 'bytes': 0, 'errors': 0}
+
+    def report(self, elapsed):
+        self.logger.info(
+            'Pass completed in %ds; %d uploads, %d objects and %d bytes '
+            'reclaimed, %d errors', elapsed, self.stats['uploads'],
+            self.stats['objects'], self.stats['bytes'], self.stats['errors'])
+
+    def load_checkpoint(self):
+        """
+        Returns the position saved by an interrupted pass, or None.
+        """
+        try:
+            with open(self.checkpoint_file) as f:
+                checkpoint = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if not isinstance(checkpoint, dict) or \
+                checkpoint.get('account') not in self.accounts:
+            return None
+        return checkpoint
+
+    def save_checkpoint(self, account, container, marker):
+        tmp = self.checkpoint_file + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'account': account, 'container': container,
+                           'marker': marker}, f)
+            os.rename(tmp, self.checkpoint_file)
+        except (IOError, OSError) as e:
+            self.logger.warning('Unable to save checkpoint %s: %s',
+                                self.checkpoint_file, e)
+
+    def clear_checkpoint(self):
+        try:
+            os.unlink(self.checkpoint_file)
+        except OSError:
+            pass
+
+    def run_once(self, *args, **kwargs):
+        begin = time()
+        self.reset_stats()
+        checkpoint = self.load_checkpoint()
+        accounts = self.accounts
+        if checkpoint:
+            accounts = accounts[accounts.index(checkpoint['account']):]
+            self.logger.info('Resuming from %s/%s/%s', checkpoint['account'],
+                             checkpoint['container'], checkpoint['marker'])
+        for account in accounts:
+            try:
+                self.process_account(account, checkpoint)
+            except (Exception, Timeout):
+                self.stats['errors'] += 1
+                self.logger.exception('Unhandled exception while processing '
+                                      'account %s', account)
+            checkpoint = None
+        self.clear_checkpoint()
+        self.report(time() - begin)
+
+    def run_forever(self, *args, **kwargs):
+        sleep(random() * self.interval)
+        while True:
+            begin = time()
+            try:
+                self.run_once(*args, **kwargs)
+            except (Exception, Timeout):
+                self.logger.exception('Unhandled exception')
+            elapsed = time() - begin
+            if elapsed < self.interval:
+                sleep(random() * (self.interval - elapsed))
+
+    def process_account(self, account, checkpoint=None):
+        for info in self.swift.iter_containers(account):
+            container = info['name'].encode('utf8')
+            bucket = multiupload_bucket(container)
+            # The shards other than [bucket]+segments only hold parts
+            if container not in (bucket + MULTIUPLOAD_SUFFIX,
+                                 bucket + MULTIUPLOAD_INDEX_SUFFIX):
+                continue
+            marker = ''
+            if checkpoint:
+                if container < checkpoint['container']:
+                    continue
+                if container == checkpoint['container']:
+                    marker = checkpoint['marker'].encode('utf8')
+            self.process_container(account, container, marker)
+
+    def get_abort_rules(self, account, bucket):
+        """
+        Returns a list of (prefix, seconds) for the enabled lifecycle rules
+        of the bucket that have an AbortMultipartUpload action.
+        """
+        meta = self.swift.get_container_metadata(
+            account, bucket, metadata_prefix='x-container-meta-',
+            acceptable_statuses=(2, HTTP_NOT_FOUND))
+        rules = []
+        for rule_key in meta.get('rules', '').split(','):
+            rule_id = rule_key.split(':')[0].lower()
+            if rule_id not in meta:
+                continue
+            try:
+                rule = ast.literal_eval(meta[rule_id])
+                if rule.get('ruleStatus') != 'Enabled' or \
+                        not rule.get('abortDay'):
+                    continue
+                rules.append((rule.get('rulePrefix') or '',
+                              int(rule['abortDay']) * SECONDS_PER_DAY))
+            except (ValueError, SyntaxError, AttributeError) as e:
+                self.logger.warning('Invalid lifecycle rule %s on %s/%s: %s',
+                                    rule_id, account, bucket, e)
+        return rules
+
+    def upload_age_limit(self, key, rules):
+        """
+        Returns the age in seconds after which an upload of the key is
+        reclaimed, or None if it never is.
+        """
+        limits = [age for prefix, age in rules if key.startswith(prefix)]
+        if self.max_upload_age > 0:
+            limits.append(self.max_upload_age)
+        return min(limits) if limits else None
+
+    def process_container(self, account, container, marker=''):
+        bucket = multiupload_bucket(container)
+        rules = self.get_abort_rules(account, bucket)
+        now = time()
+        processed = 0
+        for info in self.swift.iter_objects(account, container,
+                                            marker=marker):
+            name = info['name'].encode('utf8')
+            if PART_PATTERN.search(name) or '/' not in name:
+                continue
+            key = name.rsplit('/', 1)[0]
+            limit = self.upload_age_limit(key, rules)
+            if limit is None or \
+                    now - mktime(info['last_modified'][:19]) < limit:
+                continue
+            try:
+                self.reclaim_upload(account, bucket, container, name)
+            except (Exception, Timeout):
+                self.stats['errors'] += 1
+                self.logger.exception('Unable to reclaim upload %s/%s/%s',
+                                      account, container, name)
+            processed += 1
+            if processed % self.checkpoint_interval == 0:
+                self.save_checkpoint(account, container, name)
+
+    def reclaim_upload(self, account, bucket, container, upload):
+        """
+        Deletes the parts of the upload and then its marker.  The upload is
+        skipped if its marker is gone, i.e. it was completed or aborted.
+
+        :param container: container holding the marker
+        :param upload: marker object name, i.e. [key]/[upload_id]
+        """
+        meta = self.get_marker_metadata(account, container, upload)
+        if meta is None:
+            return
+        segments = meta.get(SEGMENTS_CONTAINER_HEADER) or \
+            bucket + MULTIUPLOAD_SUFFIX
+        # '0' is the character right after '/', so this lists exactly the
+        # objects under "[upload]/".
+        parts = list(self.swift.iter_objects(account, segments,
+                                             marker=upload + '/',
+                                             end_marker=upload + '0'))
+        names = [p['name'].encode('utf8') for p in parts]
+        if self.get_marker_metadata(account, container, upload) is None:
+            return
+        self.delete_objects(account, segments, names)
+        self.delete_objects(account, container, [upload])
+        self.stats['uploads'] += 1
+        self.stats['bytes'] += sum(p['bytes'] for p in parts)
+        self.logger.increment('uploads')
+        self.logger.update_stats('bytes', sum(p['bytes'] for p in parts))
+
+    def get_marker_metadata(self, account, container, upload):
+        """
+        Returns the metadata of the marker of the upload, or None if the
+        marker does not exist.
+        """
+        try:
+            return self.swift.get_object_metadata(account, container, upload)
+        except UnexpectedResponse as e:
+            if e.resp.status_int == HTTP_NOT_FOUND:
+                return None
+            raise
+
+    def delete_objects(self, account, container, names):
+        if self.bulk_delete_size <= 0:
+            for name in names:
+                self._running_time = ratelimit_sleep(
+                    self._running_time, self.objects_per_second)
+                self.swift.delete_object(account, container, name)
+            self.stats['objects'] += len(names)
+            self.logger.update_stats('objects', len(names))
+            return
+
+        for i in range(0, len(names), self.bulk_delete_size):
+            batch = names[i:i + self.bulk_delete_size]
+            self._running_time = ratelimit_sleep(
+                self._running_time, self.objects_per_second,
+                incr_by=len(batch))
+            self.bulk_delete(account, container, batch)
+
+    def bulk_delete(self, account, container, names):
+        body = '\n'.join(quote('/%s/%s' % (container, name))
+                         for name in names)
+        path = self.swift.make_path(account) + '?bulk-delete'
+        headers = {'Content-Type': 'text/plain',
+                   'Accept': 'application/json'}
+        resp = self.swift.make_request('POST', path, headers, (2,),
+                                       body_file=StringIO(body))
+        result = json.loads(resp.body)
+        deleted = result.get('Number Deleted', 0)
+        self.stats['objects'] += deleted
+        self.logger.update_stats('objects', deleted)
+        if result.get('Errors'):
+            raise Exception('Bulk delete failed in %s/%s: %s %s' % (
+                account, container, result.get('Response Status'),
+                result['Errors']))
+
+
+def main():
+    conf_file, options = parse_options(once=True)
+    run_daemon(UploadGC, conf_file, section_name='oss2swift-upload-gc',
+               **options)
@@ -8,13 +8,15 @@ import re
 import socket
 import threading
 import time
-from urllib import unquote
+from urllib import quote, unquote
 import uuid
 
 import crcmod
 from exception import ClientError
 from oss2swift.cfg import CONF
+from swift import __version__ as swift_version
 from swift.common import utils
+from swift.common.middleware.slo import DEFAULT_MAX_MANIFEST_SEGMENTS
 from swift.common.swob import HTTPPreconditionFailed
 from swift.common.utils import get_logger
 
@@ -23,6 +25,7 @@ from swift.common.utils import get_logger
 LOGGER = get_logger(CONF, log_route='oss2swift')
 
 MULTIUPLOAD_SUFFIX = '+segments'
+MULTIUPLOAD_INDEX_SUFFIX = '+uploads'
 
 
 def sysmeta_prefix(resource):
@@ -42,6 +45,64 @@ def sysmeta_header(resource, name):
     return sysmeta_prefix(resource) + name
 
 
+# the prefix of the segments of an appendable object, see
+# oss2swift.controllers.append
+APPEND_PREFIX_HEADER = sysmeta_header('object', 'append-prefix')
+
+TRANSIENT_SYSMETA_PREFIX = 'x-object-transient-sysmeta-oss2swift-'
+
+
+def transient_sysmeta_header(name):
+    """
+    Returns the transient system metadata header of objects for given name.
+    Unlike the object system metadata, it can be changed by a POST.
+    """
+    return TRANSIENT_SYSMETA_PREFIX + name
+
+
+def metadata_post_headers(resp, bucket, user_meta=True):
+    """
+    Returns the headers a Swift POST to the object of the HEAD response resp
+    must send again to keep its metadata, since POST replaces the user
+    metadata, the transient system metadata and X-Object-Manifest.
+
+    :param user_meta: whether to keep the metadata set by the user
+    """
+    headers = {}
+    for key, val in resp.headers.iteritems():
+        _key = key.lower()
+        if _key in ('x-oss-object-type', 'x-oss-hash-crc64ecma',
+                    'x-oss-next-append-position'):
+            # kept by oss2swift in user metadata
+            headers['x-object-meta-' + _key[6:]] = val
+        elif user_meta and _key.startswith('x-oss-meta-') and val:
+            headers['x-object-meta-' + _key[11:]] = val
+    for key, val in resp.sysmeta_headers.iteritems():
+        if key.lower().startswith(TRANSIENT_SYSMETA_PREFIX):
+            headers[key] = val
+    # the Dynamic Large Object of an appendable object
+    prefix = resp.sysmeta_headers.get(APPEND_PREFIX_HEADER)
+    if prefix:
+        headers['X-Object-Manifest'] = \
+            quote('%s%s/%s/' % (bucket, MULTIUPLOAD_SUFFIX, prefix))
+    return headers
+
+
+def is_multiupload_container(container):
+    """
+    Returns True if the container holds multipart upload information.
+    Bucket names never contain '+', so only the internal containers do.
+    """
+    return '+' in container
+
+
+def multiupload_bucket(container):
+    """
+    Returns the name of the bucket a multipart upload container belongs to.
+    """
+    return container.split('+', 1)[0]
+
+
 def camel_to_snake(camel):
     return re.sub('(.)([A-Z])', r'\1_\2', camel).lower()
 
@@ -99,6 +160,26 @@ def check_path_header(req, name, length, error_msg):
             body=error_msg)
 
 
+def client_address(environ, trusted_proxies):
+    """
+    Returns the address of the client of a request.  X-Forwarded-For is only
+    read when the request comes from one of the trusted_proxies, and then the
+    client is the last address in it which is not a trusted proxy.  Other
+    clients could forge it.
+
+    :param trusted_proxies: a collection of the addresses of the proxies
+    """
+    addr = environ.get('REMOTE_ADDR')
+    forwarded = environ.get('HTTP_X_FORWARDED_FOR')
+    if not forwarded or addr not in trusted_proxies:
+        return addr
+    for hop in reversed(forwarded.split(',')):
+        addr = hop.strip()
+        if addr not in trusted_proxies:
+            break
+    return addr
+
+
 def is_valid_ipv6(ip):
     # FIXME: replace with swift.common.ring.utils is_valid_ipv6
     #        when oss2swift requires swift 2.3 or later
@@ -207,6 +288,58 @@ def to_unixtime(time_string, format_string):
         return int(calendar.timegm(time.strptime(time_string, format_string)))
 
 
+def version_info(version):
+    """
+    Returns the leading numbers of a version string as a tuple, e.g.
+    (2, 10, 1) for 2.10.1.dev12.
+    """
+    info = []
+    for part in version.split('.'):
+        if not part.isdigit():
+            break
+        info.append(int(part))
+    return tuple(info)
+
+
+# the release of the Swift oss2swift runs in, e.g. (2, 7, 0)
+SWIFT_VERSION = version_info(swift_version)
+# Swift stores the transient system metadata of objects since 2.9.0
+TRANSIENT_SYSMETA_SUPPORTED = SWIFT_VERSION >= (2, 9, 0)
+# Swift updates the metadata and the Content-Type of an object in place on
+# POST, rather than copying the object, since 2.10.0
+FAST_POST_SUPPORTED = SWIFT_VERSION >= (2, 10, 0)
+
+
+def max_manifest_segments():
+    """
+    Returns the maximum number of segments of an SLO manifest, as set by the
+    slo middleware.
+    """
+    slo_info = utils.get_swift_info().get('slo', {})
+    return slo_info.get('max_manifest_segments', DEFAULT_MAX_MANIFEST_SEGMENTS)
+
+
+def keystone_expires(token_info):
+    """
+    Returns the expiry of a Keystone token as seconds since the epoch, or None
+    if it is unknown.
+
+    :param token_info: the token data of Keystone, {'access': {'token': ...}}
+                       for v2 and {'token': ...} for v3, as the auth_token
+                       middleware sets it in keystone.token_info
+    """
+    try:
+        if 'access' in token_info:
+            expires = token_info['access']['token']['expires']
+        else:
+            expires = token_info['token']['expires_at']
+        # e.g. 2017-03-01T10:24:37Z or 2017-03-01T10:24:37.154000Z
+        return to_unixtime(expires.rstrip('Z').split('.')[0],
+                           '%Y-%m-%dT%H:%M:%S')
+    except (KeyError, AttributeError, TypeError, ValueError):
+        return None
+
+
 def to_bytes(data):
         """若输入为unicode? 则转为utf-8编码的bytes；其他则原样返回?"""
         if isinstance(data, unicode):